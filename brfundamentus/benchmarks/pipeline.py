@@ -0,0 +1,300 @@
+"""
+Benchmarks of every stage of the pipeline on synthetic data,
+with a regression report against a previous run
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+
+from brfundamentus.benchmarks.synthetic_data import (
+    SAMPLE_CSV,
+    write_portfolio_csv,
+    write_statusinvest_csv,
+    write_trademap_csv,
+)
+from brfundamentus.builders.portfolio_builder import build_list_of_shares
+from brfundamentus.builders.stock_builder import build_list_of_stocks
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.csv_reader import read_csv
+from brfundamentus.utils.utils import compute_greenblatt_rank
+
+MARKET_RISK = 0.15
+CONDITIONS = [
+    {'parameter': 'dy', 'cut_criterion': 0.04, 'reverse_cut': False},
+    {
+        'parameter': 'price_per_profit',
+        'cut_criterion': 0,
+        'reverse_cut': False,
+    },
+    {
+        'parameter': 'price_per_profit',
+        'cut_criterion': 15,
+        'reverse_cut': True,
+    },
+    {
+        'any': [
+            {'parameter': 'roe', 'cut_criterion': 0.1, 'reverse_cut': False},
+            {'parameter': 'roic', 'cut_criterion': 0.1, 'reverse_cut': False},
+        ]
+    },
+]
+SORT_BY = {'parameter': 'graham_valuation', 'ascending': False}
+
+
+def generate_data(
+    directory: str,
+    num_rows: int,
+    num_operations: int,
+    num_positions: int,
+    sample: str = SAMPLE_CSV,
+    seed: int = 0,
+) -> dict[str, str]:
+    """
+    Writes the synthetic files of a benchmark into 'directory',
+    unless they are already there, and returns their paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        'market': os.path.join(
+            directory, f'statusinvest-{num_rows}-{seed}.csv'
+        ),
+        'portfolio': os.path.join(
+            directory, f'portfolio-{num_rows}-{num_positions}-{seed}.csv'
+        ),
+        'trademap': os.path.join(
+            directory, f'trademap-{num_rows}-{num_operations}-{seed}.csv'
+        ),
+    }
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    prices = write_statusinvest_csv(paths['market'], num_rows, sample, seed)
+    write_portfolio_csv(paths['portfolio'], prices, num_positions, seed)
+    write_trademap_csv(
+        paths['trademap'], prices, num_operations, num_positions, seed=seed
+    )
+
+    return paths
+
+
+def time_stage(run: Callable, repeat: int, warmup: bool = False) -> dict:
+    """
+    Wall time of 'repeat' calls of run(), after an untimed call if 'warmup'
+    """
+    if warmup:
+        run()
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(paths: dict[str, str], repeat: int = 5) -> dict:
+    """
+    Times every stage of the pipeline on the files of generate_data.
+    Filters are timed with the sorted indexes built and without the
+    query cache, so they measure the work of a new screen.
+    The portfolio is aggregated from shares built anew on every run.
+    """
+    headers, rows = read_csv(paths['market'], ';')
+    rows = list(rows)
+    market = StockMarket.read_from_csv(paths['market'], MARKET_RISK)
+    uncached = StockMarket(
+        store=market.store,
+        compute_rank=False,
+        market_risk=MARKET_RISK,
+        query_cache_size=0,
+    )
+    stocks = market.stocks
+    portfolio_headers, portfolio_rows = read_csv(paths['portfolio'], ',')
+    portfolio_rows = list(portfolio_rows)
+
+    def aggregate():
+        # fresh shares every run, so the totals are computed from scratch
+        shares = build_list_of_shares(
+            market, portfolio_rows, portfolio_headers
+        )
+        portfolio = Portfolio(shares)
+        for share in portfolio.shares:
+            portfolio.compute_share_weight(share)
+        return portfolio.return_of_investiment
+
+    stages = {
+        'read_from_csv': lambda: StockMarket.read_from_csv(
+            paths['market'], MARKET_RISK
+        ),
+        'read_from_csv (trusted)': lambda: StockMarket.read_from_csv(
+            paths['market'], MARKET_RISK, trusted=True
+        ),
+        'build_list_of_stocks': lambda: build_list_of_stocks(
+            rows, headers, MARKET_RISK
+        ),
+        'compute_greenblatt_rank': lambda: compute_greenblatt_rank(stocks),
+        'MarketStore.compute_greenblatt_rank': (
+            lambda: market.store.compute_greenblatt_rank()
+        ),
+        'get_top_stocks_by_criterion': (
+            lambda: uncached.get_top_stocks_by_criterion(50, 'dy', 0.04)
+        ),
+        'get_top_stocks_by_list_of_conditions': (
+            lambda: uncached.get_top_stocks_by_list_of_conditions(
+                CONDITIONS, SORT_BY, 50
+            )
+        ),
+        'Portfolio.read_from_cvs': lambda: Portfolio.read_from_cvs(
+            paths['portfolio'], market
+        ),
+        'Portfolio.read_from_trademap_csv': (
+            lambda: Portfolio.read_from_trademap_csv(
+                paths['trademap'], market
+            )
+        ),
+        'Portfolio aggregation': aggregate,
+    }
+    warm = {
+        'get_top_stocks_by_criterion',
+        'get_top_stocks_by_list_of_conditions',
+    }
+
+    results = dict()
+    for name, run in stages.items():
+        results[name] = time_stage(run, repeat, warmup=name in warm)
+
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'rows': len(rows),
+            'files': {
+                name: os.path.basename(path) for name, path in paths.items()
+            },
+        },
+        'stages': results,
+    }
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.1) -> list:
+    """
+    Change of the best time of every stage timed in both runs,
+    which is the least affected by noise of the machine.
+    A stage is 'slower' if its time grew by more than 'tolerance'
+    (as a fraction), 'faster' if it shrank by as much, else 'same'.
+    """
+    report = list()
+    for name, timing in current['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        before = baseline['stages'][name]['min']
+        ratio = timing['min'] / before if before > 0 else float('inf')
+        if ratio > 1 + tolerance:
+            status = 'slower'
+        elif ratio < 1 / (1 + tolerance):
+            status = 'faster'
+        else:
+            status = 'same'
+        report.append(
+            {
+                'stage': name,
+                'baseline': before,
+                'current': timing['min'],
+                'ratio': ratio,
+                'status': status,
+            }
+        )
+
+    return report
+
+
+def format_report(results: dict, comparison: list = None) -> str:
+    """
+    Table of the best times of a run and, if given,
+    of their change against a baseline
+    """
+    lines = [
+        f"{results['meta']['rows']} stocks, "
+        f"{results['meta']['timestamp']}, python {results['meta']['python']}"
+    ]
+    if comparison is None:
+        for name, timing in results['stages'].items():
+            lines.append(f"{name:<40}{timing['min'] * 1000:>12.3f} ms")
+        return '\n'.join(lines)
+
+    lines.append(
+        f"{'stage':<40}{'baseline':>12}{'current':>12}{'ratio':>8}  status"
+    )
+    for row in comparison:
+        lines.append(
+            f"{row['stage']:<40}"
+            f"{row['baseline'] * 1000:>9.3f} ms"
+            f"{row['current'] * 1000:>9.3f} ms"
+            f"{row['ratio']:>8.2f}  {row['status']}"
+        )
+
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--operations', type=int, default=10000)
+    parser.add_argument('--positions', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample', default=SAMPLE_CSV)
+    parser.add_argument('--data-dir', default='./benchmark-data')
+    parser.add_argument('--output', help='json file to save the results')
+    parser.add_argument('--baseline', help='json results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument(
+        '--fail-on-regression',
+        action='store_true',
+        help='exit with status 1 if any stage is slower than the baseline',
+    )
+    args = parser.parse_args()
+
+    paths = generate_data(
+        args.data_dir,
+        args.rows,
+        args.operations,
+        args.positions,
+        args.sample,
+        args.seed,
+    )
+    results = run_benchmarks(paths, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            comparison = compare(json.load(file), results, args.tolerance)
+    print(format_report(results, comparison))
+
+    if args.fail_on_regression and comparison is not None:
+        if any(row['status'] == 'slower' for row in comparison):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Generators of synthetic statusinvest, portfolio and TradeMap csv files,
+for benchmarks at sizes beyond the sample files
+"""
+
+import datetime
+import os
+import string
+from typing import Iterator
+
+import numpy as np
+
+from brfundamentus.utils.csv_reader import read_csv
+from brfundamentus.utils.utils import parse_column_to_floats
+
+SAMPLE_CSV = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    '..',
+    'statusinvest-busca-avancada-exemplo.csv',
+)
+TICKER_SUFFIXES = ('3', '4', '5', '6', '11')
+BROKERS = ('Modal DTVM', 'XP Investimentos', 'Clear Corretora', 'Rico')
+# swaps the separators of '1,234.56' into the brazilian '1.234,56'
+_PT_BR = str.maketrans(',.', '.,')
+CHUNK_SIZE = 10000
+
+
+def format_pt_br(value: float) -> str:
+    """
+    Number in the format of statusinvest: dot as thousands separator,
+    comma as decimal separator and two decimals. NaN is an empty field.
+    """
+    if value != value:
+        return ''
+    return f'{value:,.2f}'.translate(_PT_BR)
+
+
+def synthetic_tickers(num_tickers: int, seed: int = 0) -> list[str]:
+    """
+    Distinct tickers of four letters and a B3 class suffix
+    """
+    num_suffixes = len(TICKER_SUFFIXES)
+    capacity = 26**4 * num_suffixes
+    if num_tickers > capacity:
+        raise ValueError(f'At most {capacity} distinct tickers are supported')
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(capacity, size=num_tickers, replace=False)
+    letters = string.ascii_uppercase
+
+    tickers = list()
+    for code in codes.tolist():
+        code, suffix = divmod(code, num_suffixes)
+        name = ''
+        for _ in range(4):
+            code, letter = divmod(code, 26)
+            name += letters[letter]
+        tickers.append(name + TICKER_SUFFIXES[suffix])
+
+    return tickers
+
+
+class StatusInvestSample:
+    """
+    Rows of a real statusinvest file, parsed, from which synthetic rows
+    are drawn. Every synthetic row is a sample row with its values
+    perturbed, so empty fields, signs and magnitudes keep the patterns
+    (and the correlations) of the real data.
+    """
+
+    def __init__(self, path: str = SAMPLE_CSV):
+        headers, rows = read_csv(path, ';')
+        rows = [row for row in rows if len(row) >= len(headers)]
+        if not rows:
+            raise ValueError(f'No rows in sample file {path}')
+        self.headers = headers
+        # numeric columns, without TICKER
+        self.values = np.column_stack(
+            [
+                parse_column_to_floats([row[idx] for row in rows])[0]
+                for idx in range(1, len(headers))
+            ]
+        )
+
+    def iter_rows(
+        self, num_rows: int, seed: int = 0, noise: float = 0.1
+    ) -> Iterator[tuple[list[str], np.ndarray]]:
+        """
+        Yields chunks of synthetic rows: their tickers and their values,
+        as a row x column matrix with NaN for empty fields
+        """
+        rng = np.random.default_rng(seed)
+        tickers = synthetic_tickers(num_rows, seed)
+        for start in range(0, num_rows, CHUNK_SIZE):
+            end = min(start + CHUNK_SIZE, num_rows)
+            picks = rng.integers(0, len(self.values), end - start)
+            factors = rng.lognormal(
+                0, noise, (end - start, self.values.shape[1])
+            )
+            yield tickers[start:end], self.values[picks] * factors
+
+    def write(
+        self, path: str, num_rows: int, seed: int = 0, noise: float = 0.1
+    ) -> dict[str, float]:
+        """
+        Writes a statusinvest csv file of 'num_rows' synthetic stocks.
+        Returns the price of every ticker written.
+        """
+        prices = dict()
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(';'.join(self.headers) + '\n')
+            for tickers, values in self.iter_rows(num_rows, seed, noise):
+                prices.update(zip(tickers, values[:, 0].tolist()))
+                file.write(
+                    ''.join(
+                        ';'.join([ticker] + [format_pt_br(v) for v in row])
+                        + '\n'
+                        for ticker, row in zip(tickers, values.tolist())
+                    )
+                )
+
+        return prices
+
+
+def write_statusinvest_csv(
+    path: str,
+    num_rows: int,
+    sample: str = SAMPLE_CSV,
+    seed: int = 0,
+    noise: float = 0.1,
+) -> dict[str, float]:
+    """
+    Writes a synthetic statusinvest csv file, drawn from a sample file.
+    Returns the price of every ticker written.
+    """
+    return StatusInvestSample(sample).write(path, num_rows, seed, noise)
+
+
+def _listed(prices: dict[str, float]) -> tuple[list[str], np.ndarray]:
+    tickers = [ticker for ticker, price in prices.items() if price > 0]
+    return tickers, np.array([prices[ticker] for ticker in tickers])
+
+
+def write_portfolio_csv(
+    path: str, prices: dict[str, float], num_positions: int, seed: int = 0
+):
+    """
+    Writes a portfolio csv file (TICKER, PRECO MEDIO, QTD) of positions
+    in tickers of 'prices', as read by Portfolio.read_from_cvs
+    """
+    rng = np.random.default_rng(seed)
+    tickers, listed_prices = _listed(prices)
+    picks = rng.choice(
+        len(tickers), size=min(num_positions, len(tickers)), replace=False
+    )
+    mean_prices = listed_prices[picks] * rng.lognormal(0, 0.2, len(picks))
+    quantities = rng.integers(1, 50, len(picks)) * 5
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write('TICKER, PRECO MEDIO, QTD\n')
+        file.writelines(
+            f'{tickers[pick]}, {mean_price:.2f}, {quantity}\n'
+            for pick, mean_price, quantity in zip(
+                picks.tolist(), mean_prices.tolist(), quantities.tolist()
+            )
+        )
+
+
+def write_trademap_csv(
+    path: str,
+    prices: dict[str, float],
+    num_operations: int,
+    num_tickers: int = 50,
+    start: datetime.date = datetime.date(2018, 1, 2),
+    seed: int = 0,
+):
+    """
+    Writes a TradeMap csv file of 'num_operations' confirmed operations
+    on 'num_tickers' tickers of 'prices', in date order, as read by
+    Portfolio.read_from_trademap_csv. About a third of the operations
+    are sales, never of more than the position held.
+    """
+    rng = np.random.default_rng(seed)
+    tickers, listed_prices = _listed(prices)
+    picks = rng.choice(
+        len(tickers), size=min(num_tickers, len(tickers)), replace=False
+    )
+    held = dict.fromkeys(picks.tolist(), 0)
+    # three operations a day, on average
+    days = np.sort(
+        rng.integers(0, num_operations // 3 + 1, num_operations)
+    )
+    choices = rng.choice(picks, num_operations)
+    sells = rng.random(num_operations) < 1 / 3
+    price_factors = rng.lognormal(0, 0.15, num_operations)
+    quantities = rng.integers(1, 20, num_operations) * 5
+    brokers = rng.integers(0, len(BROKERS), num_operations)
+
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write(
+            'Data;Corretora;Ativo;Operação;Quantidade;Preço;Origem;Situação\n'
+        )
+        for start_row in range(0, num_operations, CHUNK_SIZE):
+            lines = list()
+            for row in range(
+                start_row, min(start_row + CHUNK_SIZE, num_operations)
+            ):
+                pick = int(choices[row])
+                quantity = int(quantities[row])
+                side = 'Compra'
+                if sells[row] and held[pick] > 0:
+                    side = 'Venda'
+                    quantity = min(quantity, held[pick])
+                held[pick] += quantity if side == 'Compra' else -quantity
+                date = start + datetime.timedelta(days=int(days[row]))
+                lines.append(
+                    ';'.join(
+                        (
+                            date.strftime('%d/%m/%y'),
+                            BROKERS[brokers[row]],
+                            tickers[pick],
+                            side,
+                            str(quantity),
+                            format_pt_br(
+                                listed_prices[pick] * price_factors[row]
+                            ),
+                            'B3I',
+                            'Confirmada',
+                        )
+                    )
+                    + '\n'
+                )
+            file.writelines(lines)
@@ -0,0 +1,215 @@
+"""
+Parallel loading of many statusinvest csv files
+"""
+
+import datetime
+import os
+import re
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+from brfundamentus.models.market_store import MarketStore, INDICATORS
+from brfundamentus.models.stock_market import StockMarket
+
+# snapshot files are dated by an ISO date in their name,
+# e.g. statusinvest-2021-03-15.csv
+SNAPSHOT_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+
+
+def snapshot_date(path: str) -> Optional[datetime.date]:
+    """
+    Date in the name of a snapshot file, if there is one
+    """
+    match = SNAPSHOT_DATE.search(os.path.basename(path))
+    if match is None:
+        return None
+
+    return datetime.date(*map(int, match.groups()))
+
+
+class LoadedMarket:
+    """
+    Outcome of loading one file: the market, or the error that
+    prevented it from being read
+    """
+
+    def __init__(
+        self,
+        path: str,
+        market: Optional[StockMarket] = None,
+        error: Optional[str] = None,
+    ):
+        self.path = path
+        self.date = snapshot_date(path)
+        self.market = market
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'failed: {self.error}'
+        return f'LoadedMarket({self.path!r}, {status})'
+
+
+def compute_market_arrays(
+    path: str, market_risk: float, cache_dir: Optional[str] = None
+) -> tuple:
+    """
+    Parses a statusinvest file, computes valuations and ranks, and
+    returns the plain arrays of the store (tickers and a matrix with
+    a row per indicator), which are cheap to send between processes,
+    and its rejection report. See market_from_arrays.
+    """
+    store = StockMarket.read_from_csv(path, market_risk, cache_dir).store
+    store.refresh_greenblatt_rank()
+
+    return (
+        np.array(store.tickers, dtype=str),
+        np.stack([store.columns[parameter] for parameter in INDICATORS])
+        if len(store)
+        else np.empty((len(INDICATORS), 0)),
+        store.rejections,
+    )
+
+
+def market_from_arrays(
+    tickers: np.ndarray,
+    matrix: np.ndarray,
+    market_risk: float,
+    trusted: bool = False,
+    rejections: list[dict] = None,
+) -> StockMarket:
+    """
+    Rebuilds the StockMarket returned by compute_market_arrays
+    """
+    store = MarketStore(
+        tickers.tolist(),
+        {parameter: matrix[idx] for idx, parameter in enumerate(INDICATORS)},
+        trusted,
+    )
+    store.rejections = rejections or list()
+
+    return StockMarket(
+        store=store, compute_rank=False, market_risk=market_risk
+    )
+
+
+class _SerialExecutor(Executor):
+    """
+    Runs submitted calls right away, in the calling process
+    """
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+
+        return future
+
+
+def iter_markets(
+    paths: Iterable[str],
+    market_risk: float = 0.15,
+    max_workers: int = None,
+    max_pending: int = None,
+    cache_dir: str = None,
+    trusted: bool = False,
+) -> Iterator[LoadedMarket]:
+    """
+    Loads many statusinvest csv files on a pool of processes
+    and yields a LoadedMarket per file, in date order
+    (files without a date in their name come last, by name).
+    Each market is the same StockMarket.read_from_csv would return.
+    At most 'max_pending' files (twice the number of workers,
+    by default) are loaded or waiting to be consumed at any time,
+    which bounds memory. A file that fails to load is yielded with
+    its error instead of stopping the batch.
+    With max_workers=1 files are loaded in the calling process.
+    """
+    paths = sorted(
+        (os.fspath(path) for path in paths),
+        key=lambda path: (
+            snapshot_date(path) or datetime.date.max,
+            os.path.basename(path),
+            path,
+        ),
+    )
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+
+    executor = (
+        _SerialExecutor()
+        if max_workers == 1
+        else ProcessPoolExecutor(max_workers)
+    )
+    pending = deque()
+    try:
+        paths = iter(paths)
+        while True:
+            for path in paths:
+                pending.append(
+                    (
+                        path,
+                        executor.submit(
+                            compute_market_arrays,
+                            path,
+                            market_risk,
+                            cache_dir,
+                        ),
+                    )
+                )
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            path, future = pending.popleft()
+            try:
+                tickers, matrix, rejections = future.result()
+            except Exception as error:
+                yield LoadedMarket(
+                    path, error=f'{type(error).__name__}: {error}'
+                )
+                continue
+
+            yield LoadedMarket(
+                path,
+                market_from_arrays(
+                    tickers, matrix, market_risk, trusted, rejections
+                ),
+            )
+    except BaseException:
+        # the consumer stopped early (GeneratorExit) or loading failed:
+        # pending loads are dropped instead of waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+
+def load_markets(
+    paths: Iterable[str],
+    market_risk: float = 0.15,
+    max_workers: int = None,
+    cache_dir: str = None,
+    trusted: bool = False,
+) -> list[LoadedMarket]:
+    """
+    Loads many statusinvest csv files in parallel, see iter_markets.
+    Returns a LoadedMarket per file, in date order.
+    """
+    return list(
+        iter_markets(
+            paths,
+            market_risk,
+            max_workers,
+            cache_dir=cache_dir,
+            trusted=trusted,
+        )
+    )
@@ -1,40 +1,53 @@
 from brfundamentus.models.stock_market import StockMarket
 from brfundamentus.models.share import Share
+from brfundamentus.models.ledger import OperationsLedger
 from brfundamentus.utils.utils import parse_str_to_float
+from brfundamentus.utils.csv_reader import header_positions
+from typing import Iterable, Union
 
 
 def build_single_share(
-    market: StockMarket, headers: list[str], info: list[str]
+    market: StockMarket,
+    headers: Union[list[str], dict[str, int]],
+    info: list[str],
+    ledger: OperationsLedger = None,
 ):
     """
-    Build a single share for a portfolio
+    Build a single share for a portfolio.
+    'headers' is the list of csv headers, or a dict mapping each
+    upper-cased header to its position in the row.
     """
 
-    map_info = {
-        parameter.strip().upper(): info[idx]
-        for idx, parameter in enumerate(headers)
-    }
+    positions = (
+        headers
+        if isinstance(headers, dict)
+        else header_positions(headers, upper=True)
+    )
 
-    stock = market.get_stock_by_ticker(map_info['TICKER'])
+    stock = market.get_stock_by_ticker(info[positions['TICKER']])
 
     return Share(
         stock=stock,
-        mean_price=parse_str_to_float(map_info['PRECO MEDIO']),
-        quantity=int(parse_str_to_float(map_info['QTD'])),
+        mean_price=parse_str_to_float(info[positions['PRECO MEDIO']]),
+        quantity=int(parse_str_to_float(info[positions['QTD']])),
+        ledger=ledger,
     )
 
 
 def build_list_of_shares(
-    market: StockMarket, csv_info: list[str], headers: list[str]
+    market: StockMarket,
+    csv_rows: Iterable[list[str]],
+    headers: list[str],
+    ledger: OperationsLedger = None,
 ):
     """
-    Build a list of StockInPortfolio from a csv file
+    Build a list of StockInPortfolio from the rows of a csv file
     """
 
+    positions = header_positions(headers, upper=True)
     shares = list()
-    for line in csv_info:
-        splited = line.split(',')
-        stock = build_single_share(market, headers, splited)
+    for row in csv_rows:
+        stock = build_single_share(market, positions, row, ledger)
         shares.append(stock)
 
     return shares
@@ -4,42 +4,90 @@ Methods to build stocks and list of stocks
 
 from pydantic.error_wrappers import ValidationError
 from brfundamentus.models.stock import Stock
-from brfundamentus.utils.utils import parse_str_to_float
+from brfundamentus.models.market_store import MarketStore, INDICATORS
+from brfundamentus.utils.utils import (
+    parse_str_to_float,
+    parse_column_to_floats,
+)
+from brfundamentus.utils.csv_reader import header_positions, iter_chunks
+from brfundamentus.utils.instrumentation import span
+from typing import Iterable, Union
 import math
+import numpy as np
+
+CHUNK_SIZE = 65536
+
+# indicators proportional to the price, and inversely proportional to it
+PRICE_MULTIPLES = ['price_per_profit', 'price_to_book', 'book_value']
+PRICE_YIELDS = ['dy']
+
+# assumptions of the valuation models
+GRAHAM_MULTIPLIER = 22.5
+BAZIN_REQUIRED_YIELD = 0.06
+
+# indicator: (csv header, divisor)
+CSV_INDICATORS = {
+    'price': ('PRECO', 1),
+    'dy': ('DY', 100),
+    'price_per_profit': ('P/L', 1),
+    'price_to_book': ('P/VP', 1),
+    'gross_margin': ('MARGEM BRUTA', 100),
+    'net_margin': ('MARG. LIQUIDA', 100),
+    'ebit_margin': ('MARGEM EBIT', 100),
+    'ev_per_ebit': ('EV/EBIT', 1),
+    'current_liquidity': ('LIQ. CORRENTE', 1),
+    'net_debt_to_equity': ('DIV. LIQ. / PATRI.', 1),
+    'roe': ('ROE', 100),
+    'roa': ('ROA', 1),
+    'roic': ('ROIC', 100),
+    'cagr': ('CAGR LUCROS 5 ANOS', 100),
+    'adtv': ('LIQUIDEZ MEDIA DIARIA', 1000000),
+    'bvps': ('VPA', 1),
+    'eps': ('LPA', 1),
+    'book_value': ('VALOR DE MERCADO', 1000000000),
+}
 
 
 def build_single_stock(
-    info: list[str], headers: list[str], market_risk: float
+    info: list[str],
+    headers: Union[list[str], dict[str, int]],
+    market_risk: float,
 ) -> Stock:
     """
-    Build a Stock from a list of strings
+    Build a Stock from a list of strings.
+    'headers' is the list of csv headers, or a dict mapping each header
+    to its position in the row (see utils.csv_reader.header_positions),
+    so it is not rebuilt for every row.
     """
 
-    map_info = {
-        parameter.strip(): info[idx] for idx, parameter in enumerate(headers)
-    }
+    positions = (
+        headers if isinstance(headers, dict) else header_positions(headers)
+    )
+
+    def field(header: str) -> str:
+        return info[positions[header]]
 
-    ticker = map_info['TICKER']
+    ticker = field('TICKER')
 
     # basic indicators
-    price = parse_str_to_float(map_info['PRECO'])
-    dy = parse_str_to_float(map_info['DY'], 100)
-    price_per_profit = parse_str_to_float(map_info['P/L'])
-    price_to_book = parse_str_to_float(map_info['P/VP'])
-    gross_margin = parse_str_to_float(map_info['MARGEM BRUTA'], 100)
-    net_margin = parse_str_to_float(map_info['MARG. LIQUIDA'], 100)
-    ebit_margin = parse_str_to_float(map_info['MARGEM EBIT'], 100)
-    ev_per_ebit = parse_str_to_float(map_info['EV/EBIT'])
-    current_liquidity = parse_str_to_float(map_info['LIQ. CORRENTE'])
-    net_debt_to_equity = parse_str_to_float(map_info['DIV. LIQ. / PATRI.'])
-    roe = parse_str_to_float(map_info['ROE'], 100)
-    roa = parse_str_to_float(map_info['ROA'])
-    roic = parse_str_to_float(map_info['ROIC'], 100)
-    cagr = parse_str_to_float(map_info['CAGR LUCROS 5 ANOS'], 100)
-    advt = parse_str_to_float(map_info['LIQUIDEZ MEDIA DIARIA'], 1000000)
-    bvps = parse_str_to_float(map_info['VPA'])
-    eps = parse_str_to_float(map_info['LPA'])
-    book_value = parse_str_to_float(map_info['VALOR DE MERCADO'], 1000000000)
+    price = parse_str_to_float(field('PRECO'))
+    dy = parse_str_to_float(field('DY'), 100)
+    price_per_profit = parse_str_to_float(field('P/L'))
+    price_to_book = parse_str_to_float(field('P/VP'))
+    gross_margin = parse_str_to_float(field('MARGEM BRUTA'), 100)
+    net_margin = parse_str_to_float(field('MARG. LIQUIDA'), 100)
+    ebit_margin = parse_str_to_float(field('MARGEM EBIT'), 100)
+    ev_per_ebit = parse_str_to_float(field('EV/EBIT'))
+    current_liquidity = parse_str_to_float(field('LIQ. CORRENTE'))
+    net_debt_to_equity = parse_str_to_float(field('DIV. LIQ. / PATRI.'))
+    roe = parse_str_to_float(field('ROE'), 100)
+    roa = parse_str_to_float(field('ROA'))
+    roic = parse_str_to_float(field('ROIC'), 100)
+    cagr = parse_str_to_float(field('CAGR LUCROS 5 ANOS'), 100)
+    advt = parse_str_to_float(field('LIQUIDEZ MEDIA DIARIA'), 1000000)
+    bvps = parse_str_to_float(field('VPA'))
+    eps = parse_str_to_float(field('LPA'))
+    book_value = parse_str_to_float(field('VALOR DE MERCADO'), 1000000000)
 
     # extra indicators
     dps = dy * price if dy is not None else None
@@ -77,14 +125,16 @@ def build_single_stock(
         or eps < 0
         or price is None
         or price == 0
-        else math.sqrt(22.5 * eps * bvps)
+        else math.sqrt(GRAHAM_MULTIPLIER * eps * bvps)
     )
     graham_valuation = (
         None if fair_price_graham is None else (fair_price_graham / price) - 1
     )
 
     fair_price_bazin = (
-        None if dps is None or price is None or price == 0 else dps / 0.06
+        None
+        if dps is None or price is None or price == 0
+        else dps / BAZIN_REQUIRED_YIELD
     )
     bazin_valuation = (
         None if fair_price_bazin is None else (fair_price_bazin / price) - 1
@@ -136,19 +186,266 @@ def build_single_stock(
 
 
 def build_list_of_stocks(
-    csv_info: list[str], headers: list[str], market_risk: float
+    csv_rows: Iterable[list[str]], headers: list[str], market_risk: float
 ):
     """
-    Build a list of Stock from the info of a csv file
+    Build a list of Stock from the rows of a csv file
     """
 
+    positions = header_positions(headers)
     stocks = list()
-    for line in csv_info:
-        splited = line.split(';')
-        try:
-            stock = build_single_stock(splited, headers, market_risk)
-        except (ValidationError, IndexError):
-            continue
-        stocks.append(stock)
+    num_rows, short_rows = 0, 0
+    with span('stocks.build_list_of_stocks') as stage:
+        for row in csv_rows:
+            num_rows += 1
+            if len(row) < len(headers):
+                short_rows += 1
+                continue
+            try:
+                stock = build_single_stock(row, positions, market_risk)
+            except ValidationError:
+                continue
+            stocks.append(stock)
+        stage.add('rows', num_rows)
+        stage.add('short_rows', short_rows)
+        stage.add('rows_dropped', num_rows - short_rows - len(stocks))
 
     return stocks
+
+
+def compute_fair_prices(
+    price: np.ndarray,
+    eps: np.ndarray,
+    bvps: np.ndarray,
+    dps: np.ndarray,
+    cagr: np.ndarray,
+    market_risk,
+    required_yield=BAZIN_REQUIRED_YIELD,
+    graham_multiplier=GRAHAM_MULTIPLIER,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Graham, Bazin and Gordon fair prices, NaN where they are undefined.
+    All arguments broadcast, so indicators of shape (stocks, 1) and
+    model parameters of shape (scenarios,) give (stocks, scenarios) matrices.
+    """
+
+    valid_price = ~np.isnan(price) & (price != 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fair_price_graham = np.where(
+            (eps * bvps >= 0) & (eps >= 0) & valid_price,
+            np.sqrt(graham_multiplier * eps * bvps),
+            np.nan,
+        )
+        fair_price_bazin = np.where(
+            valid_price, dps / required_yield, np.nan
+        )
+        fair_price_gordon = np.where(
+            valid_price & ~np.isnan(cagr),
+            (1 / market_risk) * dps * (1 + 0.1 * cagr),
+            np.nan,
+        )
+
+    return fair_price_graham, fair_price_bazin, fair_price_gordon
+
+
+def compute_valuations(columns: dict[str, np.ndarray], market_risk: float):
+    """
+    Computes the extra indicators and the valuations of a whole snapshot
+    at once, adding them to the dict of columns.
+    Missing values are NaN, and every derived value is NaN exactly
+    where build_single_stock gives None.
+    """
+
+    price = columns['price']
+    eps = columns['eps']
+    bvps = columns['bvps']
+    roe = columns['roe']
+    cagr = columns['cagr']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # extra indicators
+        dps = columns['dy'] * price
+        payout = np.where(eps != 0, dps / eps, np.nan)
+        expected_growth = np.where(
+            payout != 0, (1 - payout) * roe, 0.2 * roe
+        )
+        average_growth = np.where(
+            np.isnan(cagr) | np.isnan(expected_growth),
+            expected_growth,
+            (expected_growth + cagr) / 2,
+        )
+        peg = np.where(
+            average_growth != 0,
+            columns['price_per_profit'] / average_growth,
+            np.nan,
+        )
+
+        # valuations
+        fair_price_graham, fair_price_bazin, fair_price_gordon = (
+            compute_fair_prices(price, eps, bvps, dps, cagr, market_risk)
+        )
+
+        columns.update(
+            dps=dps,
+            payout=payout,
+            expected_growth=expected_growth,
+            average_growth=average_growth,
+            peg=peg,
+            fair_price_graham=fair_price_graham,
+            fair_price_bazin=fair_price_bazin,
+            fair_price_gordon=fair_price_gordon,
+            graham_valuation=fair_price_graham / price - 1,
+            bazin_valuation=fair_price_bazin / price - 1,
+            gordon_valuation=fair_price_gordon / price - 1,
+        )
+
+
+def reprice_columns(
+    columns: dict[str, np.ndarray], prices: np.ndarray, market_risk: float
+) -> dict[str, np.ndarray]:
+    """
+    Columns of the indicators read from csv for new prices of the same stocks.
+    Multiples of the price are rescaled and yields are scaled inversely,
+    so fundamentals like dividends and earnings per share are kept.
+    EV/EBIT is kept, since it also depends on the debt.
+    Derived indicators and valuations are recomputed.
+    """
+
+    ratio = prices / columns['price']
+    repriced = {parameter: columns[parameter] for parameter in CSV_INDICATORS}
+    repriced['price'] = prices
+    for parameter in PRICE_MULTIPLES:
+        repriced[parameter] = columns[parameter] * ratio
+    for parameter in PRICE_YIELDS:
+        repriced[parameter] = columns[parameter] / ratio
+    compute_valuations(repriced, market_risk)
+
+    return repriced
+
+
+def compute_valuation_sensitivity(
+    columns: dict[str, np.ndarray],
+    market_risks: list[float],
+    required_yields: list[float],
+    graham_multipliers: list[float],
+) -> dict:
+    """
+    Evaluates the Graham, Bazin and Gordon valuations of every stock
+    over the grid of all combinations of the given market risks,
+    Bazin required yields and Graham multipliers, in a single pass.
+    Returns a dictionary with the list of 'scenarios' (dictionaries with
+    keys 'market_risk', 'required_yield' and 'graham_multiplier') and,
+    for each model, a (stocks, scenarios) matrix of valuations.
+    """
+
+    market_risk, required_yield, graham_multiplier = (
+        grid.ravel()
+        for grid in np.meshgrid(
+            np.asarray(market_risks, dtype=float),
+            np.asarray(required_yields, dtype=float),
+            np.asarray(graham_multipliers, dtype=float),
+            indexing='ij',
+        )
+    )
+    price, eps, bvps, dps, cagr = (
+        columns[parameter][:, None]
+        for parameter in ['price', 'eps', 'bvps', 'dps', 'cagr']
+    )
+
+    fair_prices = compute_fair_prices(
+        price,
+        eps,
+        bvps,
+        dps,
+        cagr,
+        market_risk,
+        required_yield,
+        graham_multiplier,
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        graham, bazin, gordon = (
+            fair_price / price - 1 for fair_price in fair_prices
+        )
+
+    return {
+        'scenarios': [
+            {
+                'market_risk': float(risk),
+                'required_yield': float(yld),
+                'graham_multiplier': float(multiplier),
+            }
+            for risk, yld, multiplier in zip(
+                market_risk, required_yield, graham_multiplier
+            )
+        ],
+        'graham_valuation': graham,
+        'bazin_valuation': bazin,
+        'gordon_valuation': gordon,
+    }
+
+
+def build_market_store(
+    csv_rows: Iterable[list[str]],
+    headers: list[str],
+    market_risk: float,
+    chunk_size: int = CHUNK_SIZE,
+    trusted: bool = False,
+) -> MarketStore:
+    """
+    Build a MarketStore from the rows of a csv file.
+    Batch equivalent of build_list_of_stocks: rows are dropped
+    under the same conditions in which Stock validation fails
+    (see MarketStore.validate), and reported in the 'rejections'
+    of the store. Rows are consumed in chunks, so only the parsed
+    columns of the whole file are held in memory.
+    If 'trusted', rows are taken as valid: validation is skipped and
+    the store builds CompactStock objects. Only for clean files.
+    """
+
+    positions = header_positions(headers)
+    tickers = list()
+    chunks = {parameter: list() for parameter in CSV_INDICATORS}
+    rows = iter_chunks(csv_rows, chunk_size)
+    while True:
+        # rows are read and split lazily, as chunks are taken
+        with span('market.split_lines') as stage:
+            chunk = next(rows, None)
+            if chunk is None:
+                break
+            num_rows = len(chunk)
+            chunk = [row for row in chunk if len(row) >= len(headers)]
+            stage.add('rows', num_rows)
+            stage.add('short_rows', num_rows - len(chunk))
+        if not chunk:
+            continue
+        with span('market.parse_floats') as stage:
+            fields = list(zip(*chunk))
+            tickers += fields[positions['TICKER']]
+            for parameter, (header, d) in CSV_INDICATORS.items():
+                values, _ = parse_column_to_floats(
+                    fields[positions[header]], d
+                )
+                chunks[parameter].append(values)
+            stage.add('values', len(chunk) * len(CSV_INDICATORS))
+
+    columns = {
+        parameter: np.concatenate(chunks[parameter] or [np.empty(0)])
+        for parameter in CSV_INDICATORS
+    }
+    with span('market.valuations') as stage:
+        compute_valuations(columns, market_risk)
+        stage.add('rows', len(tickers))
+    columns = {
+        parameter: columns.get(parameter, np.full(len(tickers), np.nan))
+        for parameter in INDICATORS
+    }
+    store = MarketStore(np.array(tickers, dtype=object), columns, trusted)
+    if trusted:
+        return store
+    with span('market.validation') as stage:
+        store, rejected = store.validate()
+        stage.add('rows', len(tickers))
+        stage.add('rows_dropped', len(rejected))
+
+    return store
@@ -1,67 +1,174 @@
+import datetime
+from functools import lru_cache
 from brfundamentus.models.share import Share
+from brfundamentus.models.ledger import OperationsLedger
+from brfundamentus.models.constants import OperationType
 from brfundamentus.models.stock_market import StockMarket
 from brfundamentus.utils.utils import parse_str_to_float
-from pydantic.error_wrappers import ValidationError
+from brfundamentus.utils.csv_reader import header_positions
+from brfundamentus.utils.instrumentation import count
+from typing import Iterable, Optional
 
 """
 Builds shares from TradeMap csv file of transactions
 """
 
 
+@lru_cache(maxsize=4096)
+def parse_trademap_date(value: str) -> Optional[datetime.date]:
+    """
+    Parses the dd/mm/yy (or dd/mm/yyyy) dates of TradeMap.
+    Two digit years follow strptime: 69 to 99 are 19xx, the rest 20xx.
+    """
+    value = value.strip()
+    if not value:
+        return None
+    day, month, year = value.split('/')
+    if len(year) == 2:
+        year = ('19' if int(year) >= 69 else '20') + year
+
+    return datetime.date(int(year), int(month), int(day))
+
+
+def parse_trademap_amounts(quantity: str, price: str) -> tuple[int, float]:
+    """
+    Parses the quantity and the price of an operation of TradeMap.
+    Raises ValueError if either is blank.
+    """
+    num_stocks = parse_str_to_float(quantity)
+    value = parse_str_to_float(price)
+    if num_stocks is None or value is None:
+        raise ValueError('Operation without a quantity or a price')
+
+    return int(num_stocks), value
+
+
 def build_single_share_from_trademap_info(
     market: StockMarket,
-    headers: list[str],
+    positions: dict[str, int],
     info: list[str],
     map_of_shares: dict[str, Share],
+    ledger: OperationsLedger = None,
 ):
 
-    map_info = {
-        parameter.strip().upper(): info[idx]
-        for idx, parameter in enumerate(headers)
-    }
+    def field(header: str) -> str:
+        return info[positions[header]]
 
-    stock = market.get_stock_by_ticker(map_info['ATIVO'])
+    stock = market.get_stock_by_ticker(field('ATIVO'))
     if stock is None:
         return
+    date = parse_trademap_date(field('DATA')) if 'DATA' in positions else None
+    quantity, price = parse_trademap_amounts(
+        field('QUANTIDADE'), field('PREÇO')
+    )
     if stock.ticker in map_of_shares:
         compute_transaction(
             share=map_of_shares[stock.ticker],
-            operation=map_info['OPERAÇÃO'].upper(),
-            quantity=int(parse_str_to_float(map_info['QUANTIDADE'])),
-            price=parse_str_to_float(map_info['PREÇO']),
+            operation=field('OPERAÇÃO').upper(),
+            quantity=quantity,
+            price=price,
+            date=date,
         )
     else:
         share = Share(
             stock=stock,
-            mean_price=parse_str_to_float(map_info['PREÇO']),
-            quantity=int(parse_str_to_float(map_info['QUANTIDADE'])),
+            mean_price=price,
+            quantity=quantity,
+            ledger=ledger,
+            date=date,
         )
         map_of_shares[stock.ticker] = share
 
 
+def build_ledger_from_trademap_info(
+    market: StockMarket,
+    csv_rows: Iterable[list[str]],
+    headers: list[str],
+    ledger: OperationsLedger = None,
+) -> OperationsLedger:
+    """
+    Records the operations of a TradeMap csv file in a ledger,
+    as build_shares_from_trademap_info does, without building shares:
+    the first operation of a ticker opens its position, and rows of
+    unlisted tickers or with invalid operations are skipped.
+    Replaying the ledger gives the state of the shares.
+    """
+    positions = header_positions(headers, upper=True)
+    ledger = OperationsLedger() if ledger is None else ledger
+    sides = {'COMPRA': OperationType.BUY, 'VENDA': OperationType.SELL}
+    opened = set()
+    for row in csv_rows:
+
+        def field(header: str) -> str:
+            return row[positions[header]]
+
+        idx = market.store.get_position(field('ATIVO'))
+        if idx is None:
+            continue
+        ticker = market.store.tickers[idx]
+        side = (
+            sides.get(field('OPERAÇÃO').upper())
+            if ticker in opened
+            else OperationType.BUY
+        )
+        if side is None:
+            continue
+        try:
+            quantity, price = parse_trademap_amounts(
+                field('QUANTIDADE'), field('PREÇO')
+            )
+            ledger.append(
+                ticker,
+                side,
+                quantity,
+                price,
+                parse_trademap_date(field('DATA'))
+                if 'DATA' in positions
+                else None,
+            )
+        except ValueError:
+            continue
+        opened.add(ticker)
+
+    return ledger
+
+
 def compute_transaction(
-    share: Share, operation: str, quantity: int, price: float
+    share: Share,
+    operation: str,
+    quantity: int,
+    price: float,
+    date: datetime.date = None,
 ):
     if operation == 'COMPRA':
-        share.buy(price=price, num_stocks=quantity)
+        share.buy(price=price, num_stocks=quantity, date=date)
     elif operation == 'VENDA':
-        share.sell(price=price, num_stocks=quantity)
+        share.sell(price=price, num_stocks=quantity, date=date)
     else:
         return None
 
 
 def build_shares_from_trademap_info(
-    market: StockMarket, csv_info: list[str], headers: list[str]
+    market: StockMarket,
+    csv_rows: Iterable[list[str]],
+    headers: list[str],
+    ledger: OperationsLedger = None,
 ):
+    """
+    Build the shares of a portfolio from the rows of a TradeMap csv file.
+    Operations are recorded in 'ledger', one row each.
+    Rows with invalid operations are printed and skipped.
+    """
+    positions = header_positions(headers, upper=True)
     map_of_shares = dict()
-    for line in csv_info:
-        splited = line.split(';')
+    for row in csv_rows:
         try:
             build_single_share_from_trademap_info(
-                market, headers, splited, map_of_shares
+                market, positions, row, map_of_shares, ledger
             )
-        except ValidationError:
-            print(splited)
+        except ValueError:
+            print(row)
+            count('rows_dropped')
             continue
 
     shares = list(map_of_shares.values())
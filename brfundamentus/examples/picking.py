@@ -1,5 +1,6 @@
 import json
 from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.models.screen import compile_screen
 from brfundamentus.utils.utils import print_list_of_stocks
 
 
@@ -17,9 +18,8 @@ def stock_picking(path_to_parameters: str, path_to_csv: str):
         name = param_list['name']
         my_params = base_params + param_list['filters']
 
-        stocks_picked = market.get_top_stocks_by_list_of_conditions(
-            conditions=my_params, sort_by=sort_dict
-        )
+        screen = compile_screen(conditions=my_params, sort_by=sort_dict)
+        stocks_picked = market.run_screen(screen)
 
         print(f'\n\n*** {name.upper()} ***\n')
         print_list_of_stocks(stocks_picked)
@@ -2,12 +2,15 @@ import json
 from copy import copy
 
 from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.models.screen import compile_screen
 from brfundamentus.utils.utils import print_list_of_stocks
 
 """
 This script is an example of how to use some of the functionalities to run a radar of good stocks
 """
 
+RANK = {'parameter': 'graham_valuation', 'ascending': False}
+
 
 def union_lists(list1: list, list2: list) -> list:
     union = copy(list1)
@@ -37,15 +40,16 @@ def radar(path_to_csv: str, path_to_parameters: str):
 
     filtros_comuns = parameters['common']
 
-    filtros = parameters['first']
-
-    filtros += filtros_comuns
+    # Screens are validated and compiled once, up front,
+    # then run on the market
+    screens = {
+        name: compile_screen(
+            conditions=parameters[name] + filtros_comuns, sort_by=RANK
+        )
+        for name in ('first', 'second', 'third')
+    }
 
-    rank = {'parameter': 'graham_valuation', 'ascending': False}
-
-    initial_list = market.get_top_stocks_by_list_of_conditions(
-        conditions=filtros, sort_by=rank, num_stocks=600
-    )
+    initial_list = market.run_screen(screens['first'], num_stocks=600)
 
     print('\nPrimeira lista')
     print_list_of_stocks(initial_list)
@@ -53,30 +57,16 @@ def radar(path_to_csv: str, path_to_parameters: str):
 
     # second list
 
-    filtros = parameters['second']
-
-    filtros += filtros_comuns
-
     second_list = union_lists(
-        initial_list,
-        market.get_top_stocks_by_list_of_conditions(
-            conditions=filtros, sort_by=rank, num_stocks=600
-        ),
+        initial_list, market.run_screen(screens['second'], num_stocks=600)
     )
 
     print('\nSegunda lista')
     print_list_of_stocks(second_list)
     print(len(second_list))
 
-    filtros = parameters['third']
-
-    filtros += filtros_comuns
-
     third_list = union_lists(
-        second_list,
-        market.get_top_stocks_by_list_of_conditions(
-            conditions=filtros, sort_by=rank, num_stocks=600
-        ),
+        second_list, market.run_screen(screens['third'], num_stocks=600)
     )
 
     print('\nTerceira lista')
@@ -0,0 +1,286 @@
+"""
+Vectorized backtests of screens over the snapshots of a MarketHistory
+"""
+
+import datetime
+from typing import Union
+
+import numpy as np
+
+from brfundamentus.models.market_history import MarketHistory, DateLike
+from brfundamentus.models.market_store import INDICATORS
+from brfundamentus.models.screen import Screen, compile_screen
+
+# calendar periods for rebalancing on the first snapshot of each period
+REBALANCE_PERIODS = {
+    'weekly': lambda date: tuple(date.isocalendar())[:2],
+    'monthly': lambda date: (date.year, date.month),
+    'quarterly': lambda date: (date.year, (date.month - 1) // 3),
+    'yearly': lambda date: date.year,
+}
+
+Frequency = Union[int, str]
+
+
+def rebalance_rows(
+    dates: list[datetime.date], frequency: Frequency
+) -> np.ndarray:
+    """
+    Rows of 'dates' on which the portfolio is rebalanced: every
+    'frequency' snapshots, if it is an int, or the first snapshot of each
+    week, month, quarter or year (see REBALANCE_PERIODS)
+    """
+    if isinstance(frequency, int):
+        if frequency < 1:
+            raise ValueError('Rebalancing frequency must be positive')
+        return np.arange(0, len(dates), frequency)
+    if frequency not in REBALANCE_PERIODS:
+        raise ValueError(
+            f'Unknown rebalancing frequency {frequency!r}, '
+            f'expected an int or one of {list(REBALANCE_PERIODS)}'
+        )
+
+    periods = [REBALANCE_PERIODS[frequency](date) for date in dates]
+
+    return np.array(
+        [
+            row
+            for row, period in enumerate(periods)
+            if row == 0 or period != periods[row - 1]
+        ],
+        dtype=np.int64,
+    )
+
+
+class BacktestResult:
+    """
+    Outcome of a backtest.
+    'values' is the value of the portfolio on every snapshot, starting
+    at 1, and 'returns' its return since the previous snapshot (0 on the
+    first one). On each rebalance date, 'holdings' has the tickers bought
+    and 'turnover' the fraction of the portfolio traded, counting cash,
+    so the first rebalance has turnover 1 if it buys anything.
+    """
+
+    def __init__(
+        self,
+        dates: list[datetime.date],
+        values: np.ndarray,
+        rebalance_dates: list[datetime.date],
+        holdings: list[list[str]],
+        turnover: np.ndarray,
+    ):
+        self.dates = dates
+        self.values = values
+        self.returns = np.concatenate([[0.0], values[1:] / values[:-1] - 1])
+        self.rebalance_dates = rebalance_dates
+        self.holdings = holdings
+        self.turnover = turnover
+
+    @property
+    def total_return(self) -> float:
+        return float(self.values[-1] - 1) if len(self.values) else 0.0
+
+    @property
+    def annualized_return(self) -> float:
+        if len(self.dates) < 2:
+            return 0.0
+        years = (self.dates[-1] - self.dates[0]).days / 365.25
+        if years <= 0:
+            return 0.0
+        return float(self.values[-1] ** (1 / years) - 1)
+
+    @property
+    def mean_turnover(self) -> float:
+        return float(self.turnover.mean()) if len(self.turnover) else 0.0
+
+    def summary(self) -> dict:
+        return {
+            'start': self.dates[0] if self.dates else None,
+            'end': self.dates[-1] if self.dates else None,
+            'total_return': self.total_return,
+            'annualized_return': self.annualized_return,
+            'mean_turnover': self.mean_turnover,
+            'rebalances': len(self.rebalance_dates),
+        }
+
+    def __repr__(self):
+        return f'BacktestResult({self.summary()})'
+
+
+class Backtester:
+    """
+    Replays screens over the snapshots of a MarketHistory.
+    Indicators are read once, as date x ticker matrices, and shared by
+    every screen run on the backtester, so many variants of a screen
+    can be compared cheaply. Selection runs on all rebalance dates at
+    once, and picks the same stocks as StockMarket.run_screen on each
+    snapshot. Portfolios are equally weighted at every rebalance and
+    bought and held until the next one. A stock missing from a snapshot
+    is valued at its last known price.
+    """
+
+    def __init__(
+        self,
+        history: MarketHistory,
+        start: DateLike = None,
+        end: DateLike = None,
+    ):
+        self.history = history
+        self.start = start
+        self.end = end
+        self.dates, self.__csv_positions = history.csv_positions(start, end)
+        self.tickers = np.array(history.tickers, dtype=object)
+        self.__panels: dict[str, np.ndarray] = dict()
+
+        prices = self.panel('price')
+        # last known price of every ticker
+        rows = np.where(
+            np.isnan(prices), 0, np.arange(len(self.dates))[:, None]
+        )
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        self.__prices = prices[rows, np.arange(prices.shape[1])]
+
+    def panel(self, parameter: str) -> np.ndarray:
+        """
+        Date x ticker matrix of an indicator, read on first use
+        """
+        if parameter not in self.__panels:
+            _, _, self.__panels[parameter] = self.history.panel(
+                parameter, start=self.start, end=self.end
+            )
+
+        return self.__panels[parameter]
+
+    def run(
+        self,
+        conditions: list[dict],
+        sort_by: dict,
+        num_stocks: int = 50,
+        rebalance: Frequency = 'monthly',
+    ) -> BacktestResult:
+        """
+        Backtests a screen in the format of
+        StockMarket.get_top_stocks_by_list_of_conditions, buying its
+        top 'num_stocks' stocks on every rebalance date
+        """
+        return self.run_screen(
+            compile_screen(conditions, sort_by), num_stocks, rebalance
+        )
+
+    def run_screen(
+        self,
+        screen: Screen,
+        num_stocks: int = 50,
+        rebalance: Frequency = 'monthly',
+    ) -> BacktestResult:
+        """
+        Backtests a screen compiled with screen.compile_screen
+        """
+        if not self.dates:
+            return BacktestResult([], np.empty(0), [], [], np.empty(0))
+
+        rebalances = rebalance_rows(self.dates, rebalance)
+        selected = self.select(screen, rebalances, num_stocks)
+        values, weights = self.__simulate(rebalances, selected)
+        turnover = self.__turnover(rebalances, weights, values)
+
+        return BacktestResult(
+            self.dates,
+            values,
+            [self.dates[row] for row in rebalances],
+            [self.tickers[ids[ids >= 0]].tolist() for ids in selected],
+            turnover,
+        )
+
+    def select(
+        self, screen: Screen, rows: np.ndarray, num_stocks: int
+    ) -> np.ndarray:
+        """
+        Ticker ids picked by a screen on the snapshots at 'rows',
+        as a row x num_stocks matrix padded with -1
+        """
+        csv_positions = self.__csv_positions[rows]
+        panels = {
+            parameter: self.panel(parameter)[rows]
+            for parameter in screen.parameters() & set(INDICATORS)
+        }
+        panels['price'] = self.panel('price')[rows]
+        present = csv_positions >= 0
+        selected = present & screen.condition.evaluate_panel(panels)
+
+        # selected with a sort value, then selected without one, then the
+        # rest, each in the order of the csv file (stable sort)
+        values = panels[screen.sort_by['parameter']]
+        keys = values if screen.sort_by['ascending'] else -values
+        missing = np.isnan(keys)
+        groups = np.where(selected, np.where(missing, 1, 0), 2)
+        keys = np.where(groups == 0, keys, 0)
+        csv_positions = np.where(
+            present, csv_positions, np.iinfo(np.int64).max
+        )
+        order = np.lexsort((csv_positions, keys, groups), axis=-1)
+        order = order[:, :num_stocks]
+
+        picked = np.take_along_axis(groups, order, axis=-1) < 2
+
+        return np.where(picked, order, -1)
+
+    def __simulate(
+        self, rebalances: np.ndarray, selected: np.ndarray
+    ) -> tuple:
+        """
+        Value of the portfolio on every snapshot and the weights
+        bought on every rebalance, as a rebalance x ticker matrix
+        """
+        prices = self.__prices
+        num_held = np.count_nonzero(selected >= 0, axis=1)
+        weights = np.zeros((len(rebalances), len(self.tickers)))
+        rows, columns = np.nonzero(selected >= 0)
+        weights[rows, selected[rows, columns]] = 1 / num_held[rows]
+
+        # growth of the holdings since the last rebalance before each date
+        periods = np.searchsorted(rebalances, np.arange(len(self.dates))) - 1
+        periods[0] = 0
+        ids = selected[periods]
+        held = ids >= 0
+        ids = np.where(held, ids, 0)
+        growth = prices[np.arange(len(self.dates))[:, None], ids] / prices[
+            rebalances[periods][:, None], ids
+        ]
+        growth = np.where(held, growth, 0).sum(axis=1)
+        num_held = num_held[periods]
+        growth = np.where(num_held > 0, growth / np.maximum(num_held, 1), 1.0)
+        growth[0] = 1.0
+
+        value_at_rebalance = np.cumprod(
+            np.concatenate([[1.0], growth[rebalances[1:]]])
+        )
+        values = value_at_rebalance[periods] * growth
+
+        return values, weights
+
+    def __turnover(
+        self, rebalances: np.ndarray, weights: np.ndarray, values: np.ndarray
+    ) -> np.ndarray:
+        """
+        Fraction of the portfolio traded on every rebalance:
+        half the sum of the changes of weight, cash included
+        """
+        prices = np.nan_to_num(self.__prices[rebalances])
+        drifted = np.zeros_like(weights)
+        if len(rebalances) > 1:
+            price_change = np.divide(
+                prices[1:],
+                prices[:-1],
+                out=np.zeros_like(prices[1:]),
+                where=weights[:-1] > 0,
+            )
+            growth = values[rebalances[1:]] / values[rebalances[:-1]]
+            drifted[1:] = weights[:-1] * price_change / growth[:, None]
+        cash = 1 - weights.sum(axis=1)
+        drifted_cash = 1 - drifted.sum(axis=1)
+
+        return 0.5 * (
+            np.abs(weights - drifted).sum(axis=1) + np.abs(cash - drifted_cash)
+        )
@@ -0,0 +1,118 @@
+"""
+Incremental maintenance of the Greenblatt rank
+"""
+
+from typing import Optional
+
+import numpy as np
+from sortedcontainers import SortedList
+
+
+def combine_ranks(rank_ev_ebit: np.ndarray, rank_roic: np.ndarray) -> np.ndarray:
+    """
+    Greenblatt rank from the EV/EBIT and ROIC ranks (NaN for unranked),
+    ties broken by position, as in utils.compute_greenblatt_rank
+    """
+    total_rank = rank_ev_ebit + rank_roic
+    greenblatt_rank = np.full(len(total_rank), np.nan)
+    ranked = np.flatnonzero(~np.isnan(total_rank))
+    order = ranked[np.argsort(total_rank[ranked], kind='stable')]
+    greenblatt_rank[order] = np.arange(1, len(order) + 1)
+
+    return greenblatt_rank
+
+
+class GreenblattRanking:
+    """
+    Order statistic structures for the Greenblatt rank of a market.
+    Stocks are kept sorted by EV/EBIT and by ROIC, keyed by
+    (value, position), so ties keep the order of the market.
+    Updating the indicators of a stock and reading its EV/EBIT,
+    ROIC or total rank cost O(log n). The Greenblatt rank itself depends
+    on the total rank of every stock, so the first read after updates
+    recomputes all of them in one vectorized pass, and later reads
+    are cached until the next update.
+    """
+
+    def __init__(self, ev_per_ebit: np.ndarray, roic: np.ndarray):
+        self.__ev_ebit_keys: dict[int, tuple] = dict()
+        self.__roic_keys: dict[int, tuple] = dict()
+        for idx in np.flatnonzero(ev_per_ebit > 0).tolist():
+            self.__ev_ebit_keys[idx] = (float(ev_per_ebit[idx]), idx)
+        for idx in np.flatnonzero(roic > 0).tolist():
+            self.__roic_keys[idx] = (-float(roic[idx]), idx)
+
+        self.__by_ev_ebit = SortedList(self.__ev_ebit_keys.values())
+        self.__by_roic = SortedList(self.__roic_keys.values())
+        self.__size = len(ev_per_ebit)
+        self.__greenblatt_ranks = None
+
+    def update(self, idx: int, ev_per_ebit: float, roic: float):
+        """
+        Sets the indicators of the stock at position idx,
+        which can be a new position at the end of the market
+        """
+        self.__replace(
+            self.__by_ev_ebit,
+            self.__ev_ebit_keys,
+            idx,
+            (ev_per_ebit, idx) if ev_per_ebit > 0 else None,
+        )
+        self.__replace(
+            self.__by_roic,
+            self.__roic_keys,
+            idx,
+            (-roic, idx) if roic > 0 else None,
+        )
+        self.__size = max(self.__size, idx + 1)
+        self.__greenblatt_ranks = None
+
+    @staticmethod
+    def __replace(
+        sorted_keys: SortedList, keys: dict, idx: int, key: Optional[tuple]
+    ):
+        old_key = keys.pop(idx, None)
+        if old_key is not None:
+            sorted_keys.remove(old_key)
+        if key is not None:
+            keys[idx] = key
+            sorted_keys.add(key)
+
+    def rank_ev_ebit(self, idx: int) -> Optional[int]:
+        key = self.__ev_ebit_keys.get(idx)
+        return None if key is None else self.__by_ev_ebit.index(key) + 1
+
+    def rank_roic(self, idx: int) -> Optional[int]:
+        key = self.__roic_keys.get(idx)
+        return None if key is None else self.__by_roic.index(key) + 1
+
+    def total_rank(self, idx: int) -> Optional[int]:
+        rank_ev_ebit = self.rank_ev_ebit(idx)
+        rank_roic = self.rank_roic(idx)
+        if rank_ev_ebit is None or rank_roic is None:
+            return None
+        return rank_ev_ebit + rank_roic
+
+    def greenblatt_ranks(self) -> np.ndarray:
+        """
+        Current Greenblatt rank of every stock, NaN for unranked ones
+        """
+        if self.__greenblatt_ranks is None:
+            self.__greenblatt_ranks = combine_ranks(
+                self.__ranks(self.__by_ev_ebit), self.__ranks(self.__by_roic)
+            )
+
+        return self.__greenblatt_ranks
+
+    def greenblatt_rank(self, idx: int) -> Optional[int]:
+        rank = self.greenblatt_ranks()[idx]
+        return None if np.isnan(rank) else int(rank)
+
+    def __ranks(self, sorted_keys: SortedList) -> np.ndarray:
+        order = np.fromiter(
+            (idx for _, idx in sorted_keys), dtype=int, count=len(sorted_keys)
+        )
+        ranks = np.full(self.__size, np.nan)
+        ranks[order] = np.arange(1, len(order) + 1)
+
+        return ranks
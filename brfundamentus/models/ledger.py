@@ -0,0 +1,248 @@
+"""
+Append-only columnar ledger of buy and sell operations
+"""
+
+import datetime
+from typing import Optional
+
+import numpy as np
+
+from brfundamentus.models.constants import OperationType
+from brfundamentus.models.operation import Operation
+
+# codes of the side column
+SIDES = [OperationType.BUY, OperationType.SELL]
+SIDE_CODES = {side: code for code, side in enumerate(SIDES)}
+
+COLUMNS = {
+    'date': 'datetime64[D]',
+    'ticker': np.int32,
+    'side': np.int8,
+    'quantity': np.int64,
+    'price': np.float64,
+}
+
+
+class OperationsLedger:
+    """
+    Operations of a portfolio, one row each in five columns: date,
+    ticker, side, quantity and price. Tickers are stored as ids into
+    'tickers', and dates as datetime64 (NaT when unknown).
+    An append only checks the constraints of Operation (positive price
+    and quantity) and queues a tuple. Queued rows are moved into the
+    columns in bulk on the next read, so no validated object is built
+    per operation. Columns grow by doubling their capacity, so moving
+    rows costs time in proportion to the rows moved, not to the ledger.
+    The rows of each ticker are indexed on the first call of 'rows' and
+    kept up to date as rows are moved. Operation objects are only built
+    on demand, by 'operations'.
+    """
+
+    def __init__(self):
+        self.tickers: list[str] = list()
+        self.__ticker_ids: dict[str, int] = dict()
+        self.__columns = {
+            name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()
+        }
+        # rows moved into the columns, the rest of them is spare capacity
+        self.__size = 0
+        self.__pending: list[tuple] = list()
+        # ticker id: read-only array of its rows, built by 'rows'
+        self.__rows: Optional[dict[int, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self.__size + len(self.__pending)
+
+    def __flush(self):
+        if not self.__pending:
+            return
+        start, end = self.__size, self.__size + len(self.__pending)
+        capacity = len(self.__columns['price'])
+        if end > capacity:
+            capacity = max(end, 2 * capacity, 16)
+            for name, dtype in COLUMNS.items():
+                column = np.empty(capacity, dtype=dtype)
+                column[:start] = self.__columns[name][:start]
+                self.__columns[name] = column
+        for values, (name, dtype) in zip(
+            zip(*self.__pending), COLUMNS.items()
+        ):
+            self.__columns[name][start:end] = np.array(values, dtype=dtype)
+        self.__size = end
+        self.__pending.clear()
+
+        if self.__rows is not None:
+            self.__index_rows(start, end)
+
+    def __index_rows(self, start: int, end: int):
+        if start == end:
+            return
+        ticker_ids = self.__columns['ticker'][start:end]
+        order = np.argsort(ticker_ids, kind='stable')
+        ticker_ids = ticker_ids[order]
+        bounds = np.flatnonzero(np.r_[True, ticker_ids[1:] != ticker_ids[:-1]])
+        for first, last in zip(bounds, np.r_[bounds[1:], len(order)]):
+            ticker_id = int(ticker_ids[first])
+            rows = order[first:last] + start
+            if ticker_id in self.__rows:
+                rows = np.concatenate([self.__rows[ticker_id], rows])
+            rows.flags.writeable = False
+            self.__rows[ticker_id] = rows
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Read-only view of a column, with one value per operation
+        """
+        self.__flush()
+        view = self.__columns[name][: self.__size]
+        view.flags.writeable = False
+
+        return view
+
+    def ticker_id(self, ticker: str) -> int:
+        if ticker not in self.__ticker_ids:
+            self.__ticker_ids[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+
+        return self.__ticker_ids[ticker]
+
+    def append(
+        self,
+        ticker: str,
+        side: OperationType,
+        quantity: int,
+        price: float,
+        date: Optional[datetime.date] = None,
+    ) -> int:
+        """
+        Records an operation and returns its row.
+        Raises ValueError if the price or the quantity are not positive.
+        """
+        if not price > 0:
+            raise ValueError(f'Price of {ticker} must be positive: {price}')
+        if not quantity > 0 or int(quantity) != quantity:
+            raise ValueError(
+                f'Quantity of {ticker} must be a positive integer: {quantity}'
+            )
+
+        self.__pending.append(
+            (date, self.ticker_id(ticker), SIDE_CODES[side], quantity, price)
+        )
+
+        return len(self) - 1
+
+    def rows(self, ticker: str) -> np.ndarray:
+        """
+        Rows of the operations of a ticker, in the order they were recorded
+        """
+        self.__flush()
+        if self.__rows is None:
+            self.__rows = dict()
+            self.__index_rows(0, self.__size)
+        rows = self.__rows.get(self.__ticker_ids.get(ticker))
+        if rows is None:
+            return np.empty(0, dtype=np.int64)
+
+        return rows
+
+    def operations(self, ticker: str = None) -> list[Operation]:
+        """
+        The operations of a ticker (or all of them), as Operation objects
+        """
+        rows = range(len(self)) if ticker is None else self.rows(ticker)
+
+        return [self.operation(row) for row in rows]
+
+    def operation(self, row: int) -> Operation:
+        date = self.column('date')[row]
+        return Operation(
+            ticker=self.tickers[self.column('ticker')[row]],
+            price=float(self.column('price')[row]),
+            quantity=int(self.column('quantity')[row]),
+            type=SIDES[self.column('side')[row]],
+            date=None if np.isnat(date) else date.astype(datetime.date),
+        )
+
+    def replay(self, ticker: str) -> tuple:
+        """
+        Mean price and quantity of a ticker after its operations,
+        computed as Share does: the first operation opens the position
+        at its price, buys update the mean price (rounded to cents)
+        and sells only reduce the quantity.
+        Returns (None, 0) for tickers without operations.
+        """
+        rows = self.rows(ticker)
+
+        return self.__replay(
+            self.column('side')[rows].tolist(),
+            self.column('quantity')[rows].tolist(),
+            self.column('price')[rows].tolist(),
+        )
+
+    def replay_all(self) -> dict[str, tuple]:
+        """
+        Mean price and quantity of every ticker, see replay
+        """
+        ticker_ids = self.column('ticker')
+        order = np.argsort(ticker_ids, kind='stable')
+        bounds = np.searchsorted(
+            ticker_ids[order], np.arange(len(self.tickers) + 1)
+        )
+        sides = self.column('side')[order].tolist()
+        quantities = self.column('quantity')[order].tolist()
+        prices = self.column('price')[order].tolist()
+
+        return {
+            ticker: self.__replay(
+                sides[start:end], quantities[start:end], prices[start:end]
+            )
+            for ticker, start, end in zip(
+                self.tickers, bounds[:-1], bounds[1:]
+            )
+        }
+
+    @staticmethod
+    def __replay(sides: list, quantities: list, prices: list) -> tuple:
+        if not sides:
+            return None, 0
+        buy = SIDE_CODES[OperationType.BUY]
+        mean_price, quantity = prices[0], quantities[0]
+        for side, num_stocks, price in zip(
+            sides[1:], quantities[1:], prices[1:]
+        ):
+            if side == buy:
+                mean_price = round(
+                    (quantity * mean_price + price * num_stocks)
+                    / (num_stocks + quantity),
+                    2,
+                )
+                quantity += num_stocks
+            else:
+                quantity -= num_stocks
+
+        return mean_price, quantity
+
+    def save(self, path: str):
+        """
+        Saves the ledger to a .npz file, one array per column
+        """
+        np.savez(
+            path,
+            tickers=np.array(self.tickers, dtype=str),
+            **{name: self.column(name) for name in COLUMNS},
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Loads a ledger saved with OperationsLedger.save
+        """
+        with np.load(path) as arrays:
+            ledger = OperationsLedger()
+            for ticker in arrays['tickers'].tolist():
+                ledger.ticker_id(ticker)
+            for name, dtype in COLUMNS.items():
+                ledger.__columns[name] = arrays[name].astype(dtype)
+            ledger.__size = len(ledger.__columns['price'])
+
+        return ledger
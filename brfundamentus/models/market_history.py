@@ -0,0 +1,335 @@
+"""
+Historical store of dated statusinvest snapshots
+"""
+
+import datetime
+import json
+import os
+from typing import Iterator, Optional, Union
+
+import numpy as np
+
+from brfundamentus.models.market_store import MarketStore, INDICATORS
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.builders.market_loader import (
+    LoadedMarket,
+    iter_markets,
+    snapshot_date,
+)
+from brfundamentus.utils.snapshot_cache import file_digest
+
+DateLike = Union[str, datetime.date]
+
+
+def _to_date(date: DateLike) -> datetime.date:
+    if isinstance(date, datetime.date):
+        return date
+    return datetime.date.fromisoformat(date)
+
+
+class MarketHistory:
+    """
+    Date x ticker x indicator store of many snapshots of the market,
+    kept in a directory.
+    Tickers get a global id on their first appearance, and ids are never
+    reassigned. Each snapshot is a float64 block with a row per indicator
+    and a column per ticker id known at the time it was ingested
+    (NaN for tickers absent that day), saved next to the order of its
+    stocks in the csv file. Blocks are memory-mapped on demand, so queries
+    never parse csv files, and adding a snapshot writes only its block,
+    the new tickers and the manifest.
+    A ticker listed twice in the same snapshot keeps its first row,
+    as in MarketStore.get_position.
+    """
+
+    def __init__(self, directory: str, market_risk: float = 0.15):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'snapshots'), exist_ok=True)
+
+        manifest = self.__read_json('manifest.json', None)
+        if manifest is None:
+            manifest = {
+                'market_risk': market_risk,
+                'indicators': INDICATORS,
+                'snapshots': dict(),
+            }
+        if manifest['market_risk'] != market_risk:
+            raise ValueError(
+                f"History in {directory} was computed with market_risk "
+                f"{manifest['market_risk']}, not {market_risk}"
+            )
+        if manifest['indicators'] != INDICATORS:
+            raise ValueError(
+                f'History in {directory} has a different set of indicators'
+            )
+        self.market_risk = market_risk
+        self.__manifest = manifest
+
+        self.tickers: list[str] = self.__read_json('tickers.json', list())
+        self.__ids = {
+            ticker.upper(): idx for idx, ticker in enumerate(self.tickers)
+        }
+        # date: (block, order), memory-mapped on first use
+        self.__blocks: dict[datetime.date, tuple] = dict()
+
+    def __read_json(self, name: str, default):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return default
+        with open(path) as file:
+            return json.load(file)
+
+    def __write_json(self, name: str, content):
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(content, file)
+        os.replace(path + '.tmp', path)
+
+    @property
+    def dates(self) -> list[datetime.date]:
+        return sorted(
+            _to_date(date) for date in self.__manifest['snapshots']
+        )
+
+    def __len__(self) -> int:
+        return len(self.__manifest['snapshots'])
+
+    def ingest(
+        self, directory: str, max_workers: int = 1
+    ) -> tuple[list[datetime.date], list[LoadedMarket]]:
+        """
+        Adds every csv file of 'directory' dated by an ISO date in its name
+        (e.g. statusinvest-2021-03-15.csv) that is not in the history yet,
+        or whose content changed since it was ingested.
+        Files are loaded on 'max_workers' processes (see iter_markets).
+        Returns the dates that were (re)ingested and the files that
+        failed to load, which are left out.
+        A date has a single snapshot, so if two files of 'directory'
+        have the same date (e.g. a download next to its re-download),
+        ValueError is raised before anything is ingested: the stale
+        file must be removed or renamed, as neither of them wins.
+        """
+        paths = dict()
+        for name in sorted(os.listdir(directory)):
+            date = snapshot_date(name)
+            if not name.lower().endswith('.csv') or date is None:
+                continue
+            if date in paths:
+                raise ValueError(
+                    f'Files {os.path.basename(paths[date])} and {name} '
+                    f'in {directory} have the same date {date.isoformat()}'
+                )
+            paths[date] = os.path.join(directory, name)
+
+        digests = dict()
+        for date, path in paths.items():
+            digest = file_digest(path)
+            if not self.__is_ingested(date, digest):
+                digests[path] = digest
+
+        ingested, failures = list(), list()
+        for loaded in iter_markets(
+            digests, self.market_risk, max_workers=max_workers
+        ):
+            if not loaded.ok:
+                failures.append(loaded)
+                continue
+            self.__add_market(loaded.date, loaded.market, digests[loaded.path])
+            ingested.append(loaded.date)
+
+        return ingested, failures
+
+    def add_snapshot(self, date: DateLike, path: str) -> bool:
+        """
+        Adds the snapshot of 'date' from a statusinvest csv file.
+        Does nothing if the same file was already ingested for that date,
+        and returns whether the history changed.
+        """
+        date = _to_date(date)
+        digest = file_digest(path)
+        if self.__is_ingested(date, digest):
+            return False
+
+        market = StockMarket.read_from_csv(path, self.market_risk)
+        self.__add_market(date, market, digest)
+
+        return True
+
+    def __is_ingested(self, date: datetime.date, digest: str) -> bool:
+        snapshot = self.__manifest['snapshots'].get(date.isoformat(), {})
+
+        return snapshot.get('digest') == digest
+
+    def __add_market(
+        self, date: datetime.date, market: StockMarket, digest: str
+    ):
+        self.__add_store(date, market.store)
+        self.__manifest['snapshots'][date.isoformat()] = {
+            'digest': digest,
+            'stocks': len(market.store),
+        }
+        self.__write_json('manifest.json', self.__manifest)
+
+    def __add_store(self, date: datetime.date, store: MarketStore):
+        store.refresh_greenblatt_rank()
+        num_tickers = len(self.tickers)
+        order = list()
+        for ticker in store.tickers:
+            key = str(ticker).upper()
+            if key not in self.__ids:
+                self.__ids[key] = len(self.tickers)
+                self.tickers.append(str(ticker))
+            order.append(self.__ids[key])
+        if len(self.tickers) > num_tickers:
+            self.__write_json('tickers.json', self.tickers)
+
+        order = np.array(order, dtype=np.int64)
+        # first occurrence of each ticker, in csv order
+        _, rows = np.unique(order, return_index=True)
+        rows.sort()
+        order = order[rows]
+
+        block = np.full((len(INDICATORS), len(self.tickers)), np.nan)
+        for row, parameter in enumerate(INDICATORS):
+            block[row, order] = store.columns[parameter][rows]
+
+        prefix = os.path.join(self.directory, 'snapshots', date.isoformat())
+        np.save(prefix + '.npy', block)
+        np.save(prefix + '-order.npy', order)
+        self.__blocks.pop(date, None)
+
+    def __block(self, date: datetime.date) -> tuple:
+        if date not in self.__blocks:
+            prefix = os.path.join(
+                self.directory, 'snapshots', date.isoformat()
+            )
+            self.__blocks[date] = (
+                np.load(prefix + '.npy', mmap_mode='r'),
+                np.load(prefix + '-order.npy', mmap_mode='r'),
+            )
+
+        return self.__blocks[date]
+
+    def __select_dates(
+        self, start: Optional[DateLike], end: Optional[DateLike]
+    ) -> list[datetime.date]:
+        dates = self.dates
+        if start is not None:
+            dates = [date for date in dates if date >= _to_date(start)]
+        if end is not None:
+            dates = [date for date in dates if date <= _to_date(end)]
+
+        return dates
+
+    def series(
+        self,
+        ticker: str,
+        parameter: str,
+        start: DateLike = None,
+        end: DateLike = None,
+    ) -> tuple[list[datetime.date], np.ndarray]:
+        """
+        Values of an indicator of a ticker over time, e.g.
+        history.series('ITSA4', 'roe').
+        Returns the dates of the snapshots between 'start' and 'end'
+        (inclusive) and an array of values, NaN where the ticker was absent.
+        """
+        dates, _, matrix = self.panel(parameter, [ticker], start, end)
+
+        return dates, matrix[:, 0]
+
+    def panel(
+        self,
+        parameter: str,
+        tickers: list[str] = None,
+        start: DateLike = None,
+        end: DateLike = None,
+    ) -> tuple[list[datetime.date], list[str], np.ndarray]:
+        """
+        Values of an indicator for many tickers (all, by default) over time.
+        Returns the dates, the tickers and a date x ticker matrix,
+        NaN where a ticker was absent or unknown.
+        """
+        if parameter not in INDICATORS:
+            raise KeyError(f'Unknown indicator {parameter}')
+        row = INDICATORS.index(parameter)
+        if tickers is None:
+            tickers = list(self.tickers)
+        ids = np.array(
+            [self.__ids.get(ticker.upper(), -1) for ticker in tickers],
+            dtype=np.int64,
+        )
+
+        dates = self.__select_dates(start, end)
+        matrix = np.full((len(dates), len(tickers)), np.nan)
+        for idx, date in enumerate(dates):
+            block, _ = self.__block(date)
+            known = (ids >= 0) & (ids < block.shape[1])
+            matrix[idx, known] = block[row, ids[known]]
+
+        return dates, tickers, matrix
+
+    def csv_positions(
+        self, start: DateLike = None, end: DateLike = None
+    ) -> tuple[list[datetime.date], np.ndarray]:
+        """
+        Position of every ticker in the csv file of each snapshot,
+        as a date x ticker matrix, -1 where a ticker was absent
+        """
+        dates = self.__select_dates(start, end)
+        matrix = np.full((len(dates), len(self.tickers)), -1, dtype=np.int64)
+        for idx, date in enumerate(dates):
+            _, order = self.__block(date)
+            matrix[idx, order] = np.arange(len(order))
+
+        return dates, matrix
+
+    def iter_snapshots(
+        self, start: DateLike = None, end: DateLike = None
+    ) -> Iterator[tuple[datetime.date, np.ndarray, np.ndarray]]:
+        """
+        Yields the date, the tickers and the indicator x stock matrix
+        (rows in the order of INDICATORS) of every snapshot between 'start'
+        and 'end', with stocks in the order of its csv file.
+        One block is read at a time.
+        """
+        tickers = np.array(self.tickers, dtype=object)
+        for date in self.__select_dates(start, end):
+            block, order = self.__block(date)
+            order = np.asarray(order)
+            yield date, tickers[order], block[:, order]
+
+    def snapshot_date(self, date: DateLike) -> Optional[datetime.date]:
+        """
+        Date of the latest snapshot on or before 'date', if any
+        """
+        dates = self.__select_dates(None, date)
+
+        return dates[-1] if dates else None
+
+    def market_as_of(
+        self, date: DateLike, trusted: bool = False
+    ) -> Optional[StockMarket]:
+        """
+        State of the market on 'date': the latest snapshot taken on or
+        before it, with stocks in the order of its csv file, as
+        StockMarket.read_from_csv would return it. None if the history
+        starts after 'date'.
+        """
+        date = self.snapshot_date(date)
+        if date is None:
+            return None
+
+        block, order = self.__block(date)
+        order = np.asarray(order)
+        columns = {
+            parameter: block[row, order]
+            for row, parameter in enumerate(INDICATORS)
+        }
+        store = MarketStore(
+            np.array(self.tickers, dtype=object)[order], columns, trusted
+        )
+
+        return StockMarket(
+            store=store, compute_rank=False, market_risk=self.market_risk
+        )
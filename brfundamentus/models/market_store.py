@@ -0,0 +1,486 @@
+"""
+Columnar storage of the indicators of a market
+"""
+
+import dataclasses
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+from brfundamentus.models.stock import Stock, CompactStock
+from brfundamentus.models.greenblatt import GreenblattRanking, combine_ranks
+from brfundamentus.utils.instrumentation import count, span, timed
+
+INDICATORS = [
+    field.name for field in dataclasses.fields(Stock) if field.name != 'ticker'
+]
+INTEGER_INDICATORS = ['greenblatt_rank']
+# mirror the validators of Stock
+REQUIRED_INDICATORS = ['price', 'roe', 'price_per_profit']
+POSITIVE_INDICATORS = ['price', 'greenblatt_rank']
+
+
+class MarketStore:
+    """
+    Columnar store of the stocks in a market.
+    Every indicator is kept as one contiguous float64 array,
+    with NaN standing in for None, next to an array of tickers.
+    Stock objects are only built on demand. If 'trusted', they are built
+    as CompactStock, without validation, which is only safe for values
+    that were already validated (see MarketStore.validate).
+    """
+
+    def __init__(
+        self,
+        tickers: np.ndarray,
+        columns: dict[str, np.ndarray],
+        trusted: bool = False,
+    ):
+        self.trusted = trusted
+        self.tickers = np.asarray(tickers, dtype=object)
+        self.columns = {
+            parameter: np.ascontiguousarray(columns[parameter], dtype=float)
+            for parameter in INDICATORS
+        }
+        self.__stocks: list[Optional[Stock]] = [None] * len(self.tickers)
+        self.__positions: dict[str, int] = dict()
+        for idx, ticker in enumerate(self.tickers):
+            self.__positions.setdefault(ticker.upper(), idx)
+        # (parameter, ascending): (positions, sort keys, number of non NaN)
+        self.__sorted_indexes: dict[tuple, tuple] = dict()
+        # incremented on every change of the data
+        self.version = 0
+        # rows dropped when the store was validated, see validate
+        self.rejections: list[dict] = list()
+        # built on the first incremental update of the ranking indicators
+        self.__ranking: Optional[GreenblattRanking] = None
+        self.__stale_greenblatt_rank = False
+
+    @classmethod
+    def from_stocks(cls, stocks: list[Stock]):
+        columns = {
+            parameter: np.array(
+                [
+                    np.nan
+                    if stock.__dict__[parameter] is None
+                    else stock.__dict__[parameter]
+                    for stock in stocks
+                ],
+                dtype=float,
+            )
+            for parameter in INDICATORS
+        }
+        store = MarketStore([stock.ticker for stock in stocks], columns)
+        for idx, stock in enumerate(stocks):
+            store.__stocks[idx] = stock
+
+        return store
+
+    def save(self, directory: str):
+        """
+        Saves the store in a directory, as .npy files:
+        the tickers and one float64 matrix with a row per indicator,
+        next to its rejection report
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(
+            os.path.join(directory, 'tickers.npy'),
+            np.array(self.tickers, dtype=str),
+        )
+        np.save(
+            os.path.join(directory, 'columns.npy'),
+            np.stack([self.columns[parameter] for parameter in INDICATORS])
+            if len(self)
+            else np.empty((len(INDICATORS), 0)),
+        )
+        with open(os.path.join(directory, 'indicators.json'), 'w') as file:
+            json.dump(INDICATORS, file)
+        with open(os.path.join(directory, 'rejections.json'), 'w') as file:
+            json.dump(self.rejections, file)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, trusted: bool = False):
+        """
+        Loads a store saved with MarketStore.save.
+        If 'mmap', the indicators are memory-mapped (copy on write)
+        instead of read into memory.
+        """
+        with open(os.path.join(directory, 'indicators.json')) as file:
+            indicators = json.load(file)
+        tickers = np.load(os.path.join(directory, 'tickers.npy'))
+        matrix = np.load(
+            os.path.join(directory, 'columns.npy'),
+            mmap_mode='c' if mmap else None,
+        )
+        columns = {
+            parameter: matrix[idx] for idx, parameter in enumerate(indicators)
+        }
+        store = MarketStore(tickers, columns, trusted)
+        with open(os.path.join(directory, 'rejections.json')) as file:
+            store.rejections = json.load(file)
+
+        return store
+
+    def validate(self) -> tuple:
+        """
+        Validates every row at once against the constraints of Stock.
+        Returns a store with the valid rows only and a rejection report:
+        a list of dictionaries with the 'ticker' of every dropped row
+        and the 'reasons' it was dropped for. The report is also kept
+        as the 'rejections' of the returned store.
+        """
+        reasons = [list() for _ in range(len(self))]
+        for parameter in REQUIRED_INDICATORS:
+            for idx in np.flatnonzero(np.isnan(self.columns[parameter])):
+                reasons[idx].append(f'{parameter}: value is missing')
+        for parameter in POSITIVE_INDICATORS:
+            for idx in np.flatnonzero(self.columns[parameter] <= 0):
+                reasons[idx].append(f'{parameter}: value must be positive')
+        for parameter in INTEGER_INDICATORS:
+            values = self.columns[parameter]
+            fractional = ~np.isnan(values) & (values != np.round(values))
+            for idx in np.flatnonzero(fractional):
+                reasons[idx].append(f'{parameter}: value must be an integer')
+
+        valid = np.array([not reason for reason in reasons], dtype=bool)
+        report = [
+            {'ticker': str(self.tickers[idx]), 'reasons': reasons[idx]}
+            for idx in np.flatnonzero(~valid)
+        ]
+        store = MarketStore(
+            self.tickers[valid],
+            {
+                parameter: values[valid]
+                for parameter, values in self.columns.items()
+            },
+            self.trusted,
+        )
+        store.rejections = report
+
+        return store, report
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def get_position(self, ticker: str) -> Optional[int]:
+        """
+        Position of a ticker in the store, or None if it is not listed
+        """
+        return self.__positions.get(ticker.upper())
+
+    def has_indicator(self, parameter: str) -> bool:
+        return parameter in self.columns
+
+    def set_column(self, parameter: str, values: np.ndarray):
+        """
+        Replaces the values of an indicator, invalidating its sorted indexes
+        """
+        self.columns[parameter] = np.ascontiguousarray(values, dtype=float)
+        for ascending in (True, False):
+            self.__sorted_indexes.pop((parameter, ascending), None)
+        self.version += 1
+
+    def set_value(self, idx: int, parameter: str, value: Optional[float]):
+        """
+        Changes a single value in place, keeping the Stock built for
+        that position (if any) and the Greenblatt ranking up to date.
+        The greenblatt_rank column itself is refreshed lazily,
+        by refresh_greenblatt_rank.
+        """
+        old_value = self.columns[parameter][idx]
+        self.columns[parameter][idx] = np.nan if value is None else value
+        for ascending in (True, False):
+            if (parameter, ascending) in self.__sorted_indexes:
+                self.__patch_sorted_index(
+                    parameter, ascending, idx, old_value
+                )
+        self.version += 1
+
+        stock = self.__stocks[idx]
+        if stock is not None and parameter == 'price':
+            stock.set_price(self.get_value(idx, parameter))
+        elif stock is not None:
+            setattr(stock, parameter, self.get_value(idx, parameter))
+
+        if parameter in ('ev_per_ebit', 'roic'):
+            if self.__ranking is None:
+                self.__ranking = GreenblattRanking(
+                    self.columns['ev_per_ebit'], self.columns['roic']
+                )
+            else:
+                self.__ranking.update(
+                    idx,
+                    float(self.columns['ev_per_ebit'][idx]),
+                    float(self.columns['roic'][idx]),
+                )
+            self.__stale_greenblatt_rank = True
+
+    def __patch_sorted_index(
+        self, parameter: str, ascending: bool, idx: int, old_value: float
+    ):
+        """
+        Moves position idx inside the sorted index of 'parameter',
+        with two binary searches instead of a new sort
+        """
+        positions, keys, num_valid = self.__sorted_indexes[
+            (parameter, ascending)
+        ]
+        old_key = old_value if ascending else -old_value
+        new_value = self.columns[parameter][idx]
+        new_key = new_value if ascending else -new_value
+
+        start, end = self.__tie_range(keys, num_valid, old_key)
+        at = start + np.searchsorted(positions[start:end], idx)
+        positions = np.delete(positions, at)
+        keys = np.delete(keys, at)
+        num_valid -= not np.isnan(old_value)
+
+        start, end = self.__tie_range(keys, num_valid, new_key)
+        at = start + np.searchsorted(positions[start:end], idx)
+        positions = np.insert(positions, at, idx)
+        keys = np.insert(keys, at, new_key)
+        num_valid += not np.isnan(new_value)
+
+        self.__sorted_indexes[(parameter, ascending)] = (
+            positions,
+            keys,
+            num_valid,
+        )
+
+    @staticmethod
+    def __tie_range(keys: np.ndarray, num_valid: int, key: float) -> tuple:
+        """
+        Slice of the sorted keys equal to 'key'. Inside it,
+        positions are sorted, since the index is a stable sort.
+        """
+        if np.isnan(key):
+            return num_valid, len(keys)
+        return (
+            np.searchsorted(keys[:num_valid], key, side='left'),
+            np.searchsorted(keys[:num_valid], key, side='right'),
+        )
+
+    def update_rows(self, indexes: list[int], columns: dict[str, np.ndarray]):
+        """
+        Sets the given indicators of the stocks at 'indexes', in place.
+        'columns' maps indicators to arrays aligned with 'indexes'.
+        """
+        for parameter, values in columns.items():
+            for idx, value in zip(indexes, values.tolist()):
+                self.set_value(idx, parameter, value)
+
+    def append(self, store: 'MarketStore'):
+        """
+        Adds the stocks of another store at the end of this one.
+        Their Greenblatt rank is brought in by the incremental ranking.
+        """
+        first = len(self)
+        self.tickers = np.concatenate([self.tickers, store.tickers])
+        for parameter in INDICATORS:
+            self.columns[parameter] = np.concatenate(
+                [self.columns[parameter], store.columns[parameter]]
+            )
+        self.columns['greenblatt_rank'][first:] = np.nan
+        self.__stocks += [None] * len(store)
+        for idx in range(first, len(self)):
+            self.__positions.setdefault(self.tickers[idx].upper(), idx)
+        self.__sorted_indexes.clear()
+        self.version += 1
+
+        if self.__ranking is None:
+            self.__ranking = GreenblattRanking(
+                self.columns['ev_per_ebit'], self.columns['roic']
+            )
+        else:
+            for idx in range(first, len(self)):
+                self.__ranking.update(
+                    idx,
+                    float(self.columns['ev_per_ebit'][idx]),
+                    float(self.columns['roic'][idx]),
+                )
+        self.__stale_greenblatt_rank = True
+
+    def refresh_greenblatt_rank(self):
+        """
+        Brings the greenblatt_rank column up to date with the
+        incremental updates of EV/EBIT and ROIC, if there were any
+        """
+        if self.__stale_greenblatt_rank:
+            self.__set_greenblatt_rank(self.__ranking.greenblatt_ranks())
+
+    def get_greenblatt_rank(self, idx: int) -> Optional[int]:
+        """
+        Current Greenblatt rank of the stock at position idx
+        """
+        if self.__ranking is None:
+            return self.get_value(idx, 'greenblatt_rank')
+        return self.__ranking.greenblatt_rank(idx)
+
+    def get_value(self, idx: int, parameter: str):
+        value = self.columns[parameter][idx]
+        if np.isnan(value):
+            return None
+        if parameter in INTEGER_INDICATORS:
+            return int(value)
+        return float(value)
+
+    def build_stock(self, idx: int) -> Stock:
+        """
+        Returns the Stock at position idx, building it on the first access
+        """
+        return self.get_stocks([idx])[0]
+
+    def get_stocks(self, indexes=None) -> list[Stock]:
+        """
+        Returns the Stocks at the given positions (all, by default).
+        Missing ones are built in a single pass over the columns.
+        """
+        if indexes is None:
+            indexes = range(len(self))
+        indexes = [int(idx) for idx in indexes]
+
+        missing = [
+            idx for idx in dict.fromkeys(indexes) if self.__stocks[idx] is None
+        ]
+        if missing:
+            with span('store.build_stocks') as stage:
+                columns = [
+                    [
+                        None if value != value else value
+                        for value in self.columns[parameter][missing].tolist()
+                    ]
+                    for parameter in INDICATORS
+                ]
+                for parameter in INTEGER_INDICATORS:
+                    column = columns[INDICATORS.index(parameter)]
+                    column[:] = [
+                        None if value is None else int(value)
+                        for value in column
+                    ]
+
+                for idx, row in zip(missing, zip(*columns)):
+                    if self.trusted:
+                        stock = CompactStock.from_row(
+                            (self.tickers[idx],) + row
+                        )
+                    else:
+                        stock = Stock(
+                            ticker=self.tickers[idx],
+                            **dict(zip(INDICATORS, row)),
+                        )
+                    self.__stocks[idx] = stock
+                stage.add('stocks', len(missing))
+
+        return [self.__stocks[idx] for idx in indexes]
+
+    def filter_mask(
+        self, parameter: str, cut_criterion: float, reverse_cut: bool
+    ) -> np.ndarray:
+        """
+        Boolean mask of the stocks whose 'parameter' is greater than
+        'cut_criterion' (or less than, if 'reverse_cut').
+        Missing values never pass the filter.
+        """
+        values = self.columns[parameter]
+        if reverse_cut:
+            return values < cut_criterion
+        return values > cut_criterion
+
+    def tickers_mask(
+        self, tickers: list[str], positions: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Boolean mask of the stocks (or of the given positions)
+        whose ticker is in 'tickers'
+        """
+        market_tickers = (
+            self.tickers if positions is None else self.tickers[positions]
+        )
+        return np.isin(market_tickers, list(tickers))
+
+    def sorted_index(self, parameter: str, ascending: bool) -> tuple:
+        """
+        Lazily built index of 'parameter': the positions of the stocks
+        sorted by it (stable, missing values at the end), the sort keys
+        in that order and the number of non missing values.
+        Descending indexes are sorted by the negated values, so that
+        ties keep their original order in both directions.
+        """
+        key = (parameter, ascending)
+        if key not in self.__sorted_indexes:
+            values = self.columns[parameter]
+            keys = values if ascending else -values
+            positions = np.argsort(keys, kind='stable')
+            self.__sorted_indexes[key] = (
+                positions,
+                keys[positions],
+                np.count_nonzero(~np.isnan(values)),
+            )
+
+        return self.__sorted_indexes[key]
+
+    def sort_mask(
+        self, mask: np.ndarray, parameter: str, ascending: bool
+    ) -> np.ndarray:
+        """
+        Positions selected by 'mask', sorted by 'parameter'.
+        Missing values go to the end.
+        """
+        positions, _, _ = self.sorted_index(parameter, ascending)
+
+        return positions[mask[positions]]
+
+    def top_positions(
+        self,
+        parameter: str,
+        cut_criterion: float,
+        reverse_cut: bool,
+        ascending: bool,
+    ) -> np.ndarray:
+        """
+        Positions of the stocks passing the cut of 'parameter', sorted by it.
+        The cut is a binary search on the sorted index, so no sort
+        or scan of the whole market is needed.
+        """
+        positions, keys, num_valid = self.sorted_index(parameter, ascending)
+        cut = cut_criterion if ascending else -cut_criterion
+
+        if ascending != reverse_cut:
+            start = np.searchsorted(keys[:num_valid], cut, side='right')
+            return positions[start:num_valid]
+
+        end = np.searchsorted(keys[:num_valid], cut, side='left')
+        return positions[:end]
+
+    @timed('market.greenblatt_rank')
+    def compute_greenblatt_rank(self):
+        """
+        Computes the greenblatt rank of every stock on the columns,
+        with the same tie breaking as utils.compute_greenblatt_rank
+        """
+        num_stocks = len(self)
+        ev_per_ebit = self.columns['ev_per_ebit']
+        roic = self.columns['roic']
+
+        rank_ev_ebit = np.full(num_stocks, np.nan)
+        positive = np.flatnonzero(ev_per_ebit > 0)
+        order = positive[np.argsort(ev_per_ebit[positive], kind='stable')]
+        rank_ev_ebit[order] = np.arange(1, len(order) + 1)
+
+        rank_roic = np.full(num_stocks, np.nan)
+        positive = np.flatnonzero(roic > 0)
+        order = positive[np.argsort(-roic[positive], kind='stable')]
+        rank_roic[order] = np.arange(1, len(order) + 1)
+
+        self.__ranking = None
+        self.__set_greenblatt_rank(combine_ranks(rank_ev_ebit, rank_roic))
+        count('stocks', num_stocks)
+
+    def __set_greenblatt_rank(self, greenblatt_rank: np.ndarray):
+        self.__stale_greenblatt_rank = False
+        self.set_column('greenblatt_rank', greenblatt_rank)
+        for idx, stock in enumerate(self.__stocks):
+            if stock is not None:
+                stock.greenblatt_rank = self.get_value(idx, 'greenblatt_rank')
@@ -1,3 +1,5 @@
+import datetime
+from typing import Optional
 from brfundamentus.models.constants import OperationType
 from pydantic.dataclasses import dataclass
 from pydantic import PositiveFloat, PositiveInt
@@ -9,3 +11,4 @@ class Operation:
     price: PositiveFloat
     quantity: PositiveInt
     type: OperationType
+    date: Optional[datetime.date] = None
@@ -1,60 +1,130 @@
 from brfundamentus.models.share import Share
+from brfundamentus.models.ledger import OperationsLedger
+from brfundamentus.models.position_index import PositionIndex
 from brfundamentus.models.stock_market import StockMarket
 from brfundamentus.builders.portfolio_builder import build_list_of_shares
 from brfundamentus.builders.trademap_builder import (
     build_shares_from_trademap_info,
 )
+from brfundamentus.utils.csv_reader import CsvSource, read_csv
+from brfundamentus.utils.instrumentation import count, timed
 
 
 class Portfolio:
     """
     Class to model a portfolio
+    The total invested and the equity are kept up to date as shares
+    are bought and sold and as the prices of their stocks change,
+    so reading them, or the position of a share, costs O(1).
     """
 
-    def __init__(self, shares: list[Share]):
+    # the running totals are recomputed from the shares every this many
+    # updates, so the rounding errors of the increments do not pile up
+    REANCHOR_INTERVAL = 1000
+
+    def __init__(self, shares: list[Share], ledger: OperationsLedger = None):
+        # operations of the shares, when they share a ledger
+        self.ledger = ledger
+        self.__position_index: PositionIndex = None
         self.shares = shares
 
+    @property
+    def shares(self) -> list[Share]:
+        return self.__shares
+
+    @shares.setter
+    def shares(self, shares: list[Share]):
+        for share in getattr(self, '_Portfolio__shares', list()):
+            share.remove_listener(self._on_share_change)
+        self.__shares = list()
+        self.__shares_by_ticker: dict[str, Share] = dict()
+        self.__total_invested = 0
+        self.__equity = 0
+        self.__updates = 0
+        for share in shares:
+            self.add_share(share)
+
+    def add_share(self, share: Share):
+        self.__shares.append(share)
+        self.__shares_by_ticker.setdefault(share.stock.ticker.upper(), share)
+        self.__total_invested += share.total_invested
+        self.__equity += share.total_amount
+        share.add_listener(self._on_share_change)
+
+    # single underscore: pickle finds the listeners of shares by name,
+    # which fails for mangled names
+    def _on_share_change(
+        self, share: Share, invested_change: float, amount_change: float
+    ):
+        self.__updates += 1
+        if self.__updates >= self.REANCHOR_INTERVAL:
+            self.__reanchor()
+            return
+        self.__total_invested += invested_change
+        self.__equity += amount_change
+
+    def __reanchor(self):
+        self.__total_invested = sum(st.total_invested for st in self.shares)
+        self.__equity = sum(st.total_amount for st in self.shares)
+        self.__updates = 0
+
     @property
     def total_invested(self):
-        return sum(st.total_invested for st in self.shares)
+        return self.__total_invested
 
     @property
     def equity(self):
-        return sum(st.total_amount for st in self.shares)
+        return self.__equity
 
     @property
     def return_of_investiment(self):
         return self.equity / self.total_invested - 1
 
     @classmethod
-    def read_from_cvs(cls, path: str, market: StockMarket, sep: str = ','):
-        with open(path) as file:
-            all_info = file.readlines()
+    @timed('portfolio.read_from_cvs')
+    def read_from_cvs(
+        cls, path: CsvSource, market: StockMarket, sep: str = ','
+    ):
+        """
+        Reads a portfolio from a csv with columns TICKER, PRECO MEDIO and QTD.
+        'path' can also be a file object or an iterable of lines.
+        """
+        headers, rows = read_csv(path, sep)
 
+        ledger = OperationsLedger()
         all_stocks = build_list_of_shares(
             market=market,
-            csv_info=all_info[1:],
-            headers=all_info[0].split(sep),
+            csv_rows=rows,
+            headers=headers,
+            ledger=ledger,
         )
-        portfolio = Portfolio(all_stocks)
+        portfolio = Portfolio(all_stocks, ledger)
+        count('shares', len(all_stocks))
 
         return portfolio
 
     @classmethod
+    @timed('portfolio.read_from_trademap_csv')
     def read_from_trademap_csv(
-        cls, path: str, market: StockMarket, sep: str = ';'
+        cls, path: CsvSource, market: StockMarket, sep: str = ';'
     ):
-        with open(path) as file:
-            all_info = file.readlines()
+        """
+        Reads a portfolio from a TradeMap csv file of transactions.
+        'path' can also be a file object or an iterable of lines.
+        """
+        headers, rows = read_csv(path, sep)
 
+        ledger = OperationsLedger()
         all_stocks = build_shares_from_trademap_info(
             market=market,
-            csv_info=all_info[1:],
-            headers=all_info[0].split(sep),
+            csv_rows=rows,
+            headers=headers,
+            ledger=ledger,
         )
-        portfolio = Portfolio(all_stocks)
-        breakpoint()
+        portfolio = Portfolio(all_stocks, ledger)
         portfolio.prune_shares()
+        count('operations', len(ledger))
+        count('shares', len(portfolio.shares))
 
         return portfolio
 
@@ -65,8 +135,14 @@ class Portfolio:
             self.print_share_info_in_portfolio(st)
             print('\n')
 
+    def compute_share_weight(self, share: Share) -> float:
+        """
+        Fraction of the equity of the portfolio held in 'share'
+        """
+        return share.total_amount / self.equity
+
     def compute_share_position(self, share: Share):
-        return round(100 * (share.total_amount / self.equity), 2)
+        return round(100 * self.compute_share_weight(share), 2)
 
     def print_share_info_in_portfolio(self, share: Share):
         print('>Portfolio info')
@@ -78,15 +154,22 @@ class Portfolio:
     def prune_shares(self):
         self.shares = [share for share in self.shares if share.quantity != 0]
 
+    def position_index(self) -> PositionIndex:
+        """
+        Index of the operations in the ledger of the portfolio, for
+        positions as of any date and realized P&L per month.
+        It is rebuilt only when new operations were recorded.
+        """
+        if self.ledger is None:
+            raise ValueError('Portfolio has no ledger of operations')
+        index = self.__position_index
+        if index is None or not index.is_current():
+            self.__position_index = PositionIndex(self.ledger)
+
+        return self.__position_index
+
     def get_share_by_ticker(self, ticker: str):
-        return next(
-            (
-                share
-                for share in self.shares
-                if share.stock.ticker == ticker.upper()
-            ),
-            None,
-        )
+        return self.__shares_by_ticker.get(ticker.upper())
 
     def __repr__(self) -> str:
         msg = f'Portfolio with {len(self.shares)} shares\n'
@@ -0,0 +1,217 @@
+"""
+Batch valuation of many portfolios against one market
+"""
+
+import os
+from typing import Iterable
+
+import numpy as np
+
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.builders.trademap_builder import (
+    build_ledger_from_trademap_info,
+)
+from brfundamentus.utils.csv_reader import header_positions, read_csv
+from brfundamentus.utils.utils import parse_str_to_float
+
+
+class PortfolioBook:
+    """
+    Holdings of many portfolios in one sparse portfolio x stock matrix,
+    in CSR form: the positions of portfolio i are the entries
+    indptr[i]:indptr[i + 1] of 'stocks' (positions in the market store),
+    'quantities' and 'mean_prices'.
+    Aggregates of every portfolio come from one pass over the entries
+    against the price column of the market, so no Share or Stock objects
+    are involved, and prices updated in the market are picked up.
+    """
+
+    def __init__(
+        self,
+        market: StockMarket,
+        names: list[str],
+        indptr: np.ndarray,
+        stocks: np.ndarray,
+        quantities: np.ndarray,
+        mean_prices: np.ndarray,
+        missing: dict[str, list[str]] = None,
+    ):
+        self.market = market
+        self.names = list(names)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.stocks = np.asarray(stocks, dtype=np.int64)
+        self.quantities = np.asarray(quantities, dtype=float)
+        self.mean_prices = np.asarray(mean_prices, dtype=float)
+        # tickers of each portfolio that are not listed in the market
+        self.missing = dict() if missing is None else missing
+        # portfolio of every entry
+        self.rows = np.repeat(
+            np.arange(len(self.names)), np.diff(self.indptr)
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_holdings(
+        cls,
+        market: StockMarket,
+        holdings: dict[str, Iterable[tuple]],
+    ):
+        """
+        Builds a book from (ticker, mean price, quantity) tuples,
+        keyed by portfolio name. Tickers not listed in the market
+        are left out and reported in 'missing'.
+        """
+        names, indptr = list(), [0]
+        stocks, quantities, mean_prices = list(), list(), list()
+        missing = dict()
+        for name, positions in holdings.items():
+            for ticker, mean_price, quantity in positions:
+                idx = market.store.get_position(ticker)
+                if idx is None:
+                    missing.setdefault(name, list()).append(ticker)
+                    continue
+                stocks.append(idx)
+                quantities.append(quantity)
+                mean_prices.append(mean_price)
+            names.append(name)
+            indptr.append(len(stocks))
+
+        return PortfolioBook(
+            market, names, indptr, stocks, quantities, mean_prices, missing
+        )
+
+    @classmethod
+    def from_portfolios(
+        cls, market: StockMarket, portfolios: dict[str, Portfolio]
+    ):
+        """
+        Builds a book from Portfolio objects, keyed by name
+        """
+        return cls.from_holdings(
+            market,
+            {
+                name: [
+                    (share.stock.ticker, share.mean_price, share.quantity)
+                    for share in portfolio.shares
+                ]
+                for name, portfolio in portfolios.items()
+            },
+        )
+
+    @classmethod
+    def read_csvs(cls, market: StockMarket, paths: Iterable[str]):
+        """
+        Reads many portfolio csv files, named by their paths.
+        Each one can be in the format of Portfolio.read_from_cvs
+        (TICKER, PRECO MEDIO, QTD) or a TradeMap file of transactions,
+        as in Portfolio.read_from_trademap_csv. Positions are read
+        straight into the book, without building shares.
+        """
+        return cls.from_holdings(
+            market,
+            {os.fspath(path): read_holdings(market, path) for path in paths},
+        )
+
+    def __entry_prices(self) -> np.ndarray:
+        return self.market.store.columns['price'][self.stocks]
+
+    def __sum_by_portfolio(self, values: np.ndarray) -> np.ndarray:
+        return np.bincount(self.rows, weights=values, minlength=len(self))
+
+    def amounts(self) -> np.ndarray:
+        """
+        Market value of every entry
+        """
+        return self.quantities * self.__entry_prices()
+
+    def equity(self) -> np.ndarray:
+        return self.__sum_by_portfolio(self.amounts())
+
+    def total_invested(self) -> np.ndarray:
+        return self.__sum_by_portfolio(self.quantities * self.mean_prices)
+
+    def return_of_investiment(self) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.equity() / self.total_invested() - 1
+
+    def weights(self) -> np.ndarray:
+        """
+        Weight of every entry in the equity of its portfolio
+        """
+        equity = self.equity()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.amounts() / equity[self.rows]
+
+    def equity_under(self, prices: np.ndarray) -> np.ndarray:
+        """
+        Equity of every portfolio under price scenarios: 'prices' is a
+        stock x scenario matrix aligned with the market store, and the
+        result a portfolio x scenario matrix
+        """
+        amounts = self.quantities[:, None] * prices[self.stocks]
+        totals = np.zeros((len(amounts) + 1, prices.shape[1]))
+        np.cumsum(amounts, axis=0, out=totals[1:])
+
+        return totals[self.indptr[1:]] - totals[self.indptr[:-1]]
+
+    def summary(self) -> list[dict]:
+        """
+        Equity, amount invested and return of every portfolio,
+        and the tickers and weights of its positions
+        """
+        equity = self.equity()
+        invested = self.total_invested()
+        returns = self.return_of_investiment()
+        weights = self.weights()
+        tickers = self.market.store.tickers[self.stocks]
+
+        return [
+            {
+                'name': name,
+                'equity': float(equity[idx]),
+                'total_invested': float(invested[idx]),
+                'return_of_investiment': float(returns[idx]),
+                'positions': dict(
+                    zip(
+                        tickers[start:end].tolist(),
+                        weights[start:end].tolist(),
+                    )
+                ),
+            }
+            for idx, (name, start, end) in enumerate(
+                zip(self.names, self.indptr[:-1], self.indptr[1:])
+            )
+        ]
+
+
+def read_holdings(market: StockMarket, path: str) -> list[tuple]:
+    """
+    (ticker, mean price, quantity) of the positions in a portfolio csv
+    file, in either format read by PortfolioBook.read_csvs.
+    Positions closed by the transactions of a TradeMap file are dropped,
+    as Portfolio.read_from_trademap_csv does.
+    """
+    with open(path, encoding='utf-8-sig') as file:
+        sep = ';' if ';' in file.readline() else ','
+    headers, rows = read_csv(path, sep)
+    positions = header_positions(headers, upper=True)
+
+    if 'ATIVO' in positions:
+        ledger = build_ledger_from_trademap_info(market, rows, headers)
+        return [
+            (ticker, mean_price, quantity)
+            for ticker, (mean_price, quantity) in ledger.replay_all().items()
+            if quantity != 0
+        ]
+
+    return [
+        (
+            row[positions['TICKER']].strip(),
+            parse_str_to_float(row[positions['PRECO MEDIO']]),
+            int(parse_str_to_float(row[positions['QTD']])),
+        )
+        for row in rows
+    ]
@@ -0,0 +1,238 @@
+"""
+Point-in-time positions and realized P&L over a ledger of operations
+"""
+
+import datetime
+from typing import Optional, Union
+
+import numpy as np
+
+from brfundamentus.models.constants import OperationType
+from brfundamentus.models.ledger import OperationsLedger, SIDE_CODES
+
+DateLike = Union[str, datetime.date]
+
+
+def apply_operation(
+    position: int, mean_price: float, quantity: int, price: float
+) -> tuple[int, float, float]:
+    """
+    Applies an operation of 'quantity' stocks (negative for sales) at
+    'price' to a position under the average-cost accounting of
+    PositionIndex:
+        - an operation on no position opens one at 'price';
+        - operations that grow the position average its cost, rounded
+          to cents;
+        - operations against it realize (price - mean price) on the
+          quantity closed and keep the mean price;
+        - beyond the position, they open the opposite one at 'price'.
+    A closed position keeps its last mean price.
+    Returns the new position, its mean price and the realized P&L.
+    """
+    if position == 0:
+        return quantity, price, 0.0
+    if (position > 0) == (quantity > 0):
+        mean_price = round(
+            (abs(position) * mean_price + abs(quantity) * price)
+            / (abs(position) + abs(quantity)),
+            2,
+        )
+        return position + quantity, mean_price, 0.0
+
+    closed = min(abs(quantity), abs(position))
+    direction = 1 if position > 0 else -1
+    gain = closed * (price - mean_price) * direction
+    new_position = position + quantity
+    if new_position != 0 and (new_position > 0) != (direction > 0):
+        mean_price = price
+
+    return new_position, mean_price, gain
+
+
+def _day(date: DateLike) -> int:
+    """
+    Days since the epoch, the sort key of the events
+    """
+    return int(np.datetime64(date, 'D').astype(np.int64))
+
+
+class PositionIndex:
+    """
+    Index over the operations of a ledger, sorted by date.
+    The position of every ticker after each of its operations is computed
+    once, under the average-cost accounting of apply_operation. Unlike
+    Share, which only reduces its quantity, a sale beyond the position
+    opens a short position at the sale price (covered symmetrically).
+    Queries are binary searches over the sorted events.
+    Operations on the same date keep the order of the ledger, and
+    undated operations come before all dated ones, as opening positions.
+    """
+
+    def __init__(self, ledger: OperationsLedger):
+        self.ledger = ledger
+        self.tickers = list(ledger.tickers)
+        self.__ticker_ids = {
+            ticker: idx for idx, ticker in enumerate(self.tickers)
+        }
+        self.num_operations = len(ledger)
+
+        # NaT is the smallest int64, so undated operations sort first
+        days = ledger.column('date').astype(np.int64)
+        ticker_ids = ledger.column('ticker')
+        signs = np.where(
+            ledger.column('side') == SIDE_CODES[OperationType.BUY], 1, -1
+        )
+        quantities = signs * ledger.column('quantity')
+        prices = ledger.column('price')
+
+        order = np.lexsort((days, ticker_ids))
+        bounds = np.searchsorted(
+            ticker_ids[order], np.arange(len(self.tickers) + 1)
+        )
+        realized = np.zeros(len(order))
+        # ticker id: (days, quantity, mean price, cumulative realized P&L)
+        self.__events: dict[int, tuple] = dict()
+        for ticker_id in range(len(self.tickers)):
+            rows = order[bounds[ticker_id] : bounds[ticker_id + 1]]
+            held, mean_price, gains = self.__accumulate(
+                quantities[rows].tolist(), prices[rows].tolist()
+            )
+            realized[rows] = gains
+            self.__events[ticker_id] = (
+                days[rows],
+                np.array(held, dtype=np.int64),
+                np.array(mean_price),
+                np.cumsum(gains),
+            )
+
+        # every event in date order, for portfolio wide P&L
+        order = np.argsort(days, kind='stable')
+        self.__days = days[order]
+        self.__realized = np.cumsum(realized[order])
+        self.__sales = np.cumsum(
+            np.where(quantities[order] < 0, -quantities[order], 0)
+            * prices[order]
+        )
+
+    @staticmethod
+    def __accumulate(quantities: list, prices: list) -> tuple:
+        held, mean_prices, gains = list(), list(), list()
+        position, mean_price = 0, 0.0
+        for quantity, price in zip(quantities, prices):
+            position, mean_price, gain = apply_operation(
+                position, mean_price, quantity, price
+            )
+            held.append(position)
+            mean_prices.append(mean_price)
+            gains.append(gain)
+
+        return held, mean_prices, gains
+
+    def is_current(self) -> bool:
+        """
+        Whether the ledger has no operations newer than the index
+        """
+        return len(self.ledger) == self.num_operations
+
+    def position(self, ticker: str, date: DateLike) -> tuple:
+        """
+        Quantity and mean price of a ticker at the end of 'date'.
+        The mean price is None when there is no position.
+        """
+        events = self.__events.get(self.__ticker_id(ticker))
+        if events is None:
+            return 0, None
+        days, held, mean_prices, _ = events
+        idx = np.searchsorted(days, _day(date), side='right') - 1
+        if idx < 0 or held[idx] == 0:
+            return 0, None
+
+        return int(held[idx]), float(mean_prices[idx])
+
+    def positions(self, date: DateLike) -> dict[str, tuple]:
+        """
+        Quantity and mean price of every open position at the end of 'date'
+        """
+        positions = dict()
+        for ticker in self.tickers:
+            quantity, mean_price = self.position(ticker, date)
+            if quantity != 0:
+                positions[ticker] = (quantity, mean_price)
+
+        return positions
+
+    def __ticker_id(self, ticker: str) -> Optional[int]:
+        return self.__ticker_ids.get(ticker)
+
+    def realized_pnl(
+        self,
+        start: DateLike = None,
+        end: DateLike = None,
+        ticker: str = None,
+    ) -> float:
+        """
+        Realized P&L of the sales between 'start' and 'end' (inclusive),
+        of one ticker or of the whole portfolio
+        """
+        if ticker is None:
+            days, cumulative = self.__days, self.__realized
+        else:
+            events = self.__events.get(self.__ticker_id(ticker))
+            if events is None:
+                return 0.0
+            days, _, _, cumulative = events
+
+        return self.__between(days, cumulative, start, end)
+
+    @staticmethod
+    def __between(
+        days: np.ndarray,
+        cumulative: np.ndarray,
+        start: Optional[DateLike],
+        end: Optional[DateLike],
+    ) -> float:
+        first = (
+            0 if start is None else np.searchsorted(days, _day(start), 'left')
+        )
+        last = (
+            len(days)
+            if end is None
+            else np.searchsorted(days, _day(end), 'right')
+        )
+        if last <= first:
+            return 0.0
+        before = cumulative[first - 1] if first > 0 else 0.0
+
+        return float(cumulative[last - 1] - before)
+
+    def monthly_summary(self) -> dict[str, dict]:
+        """
+        Realized P&L and total sales of every month with dated operations,
+        keyed by 'YYYY-MM'
+        """
+        dated = self.__days != np.iinfo(np.int64).min
+        if not dated.any():
+            return dict()
+        first_dated = np.argmax(dated)
+        days = self.__days[first_dated:]
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+        ends = np.r_[starts[1:], len(months)] - 1 + first_dated
+        previous = starts - 1 + first_dated
+
+        def totals(cumulative: np.ndarray) -> np.ndarray:
+            before = np.where(
+                previous >= 0, cumulative[np.maximum(previous, 0)], 0.0
+            )
+            return cumulative[ends] - before
+
+        realized = totals(self.__realized)
+        sales = totals(self.__sales)
+
+        return {
+            str(months[start]): {
+                'realized_pnl': float(pnl),
+                'sales': float(total),
+            }
+            for start, pnl, total in zip(starts, realized, sales)
+        }
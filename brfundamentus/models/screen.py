@@ -0,0 +1,271 @@
+"""
+Compiler of the conditions / sort_by screens into reusable plans
+"""
+
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from brfundamentus.models.market_store import MarketStore, INDICATORS
+
+
+def _panel_shape(panels: dict[str, np.ndarray]) -> tuple:
+    return next(iter(panels.values())).shape
+
+
+class Criterion:
+    """
+    A single cut of an indicator: 'parameter' greater than 'cut_criterion',
+    or less than it if 'reverse_cut'
+    """
+
+    def __init__(self, parameter: str, cut_criterion: float, reverse_cut: bool):
+        self.parameter = parameter
+        self.cut_criterion = cut_criterion
+        self.reverse_cut = reverse_cut
+
+    def count(self, store: MarketStore) -> float:
+        """
+        Number of stocks passing the cut, from a binary search on the
+        sorted index of the indicator
+        """
+        if not store.has_indicator(self.parameter):
+            return 0
+        return len(
+            store.top_positions(
+                self.parameter, self.cut_criterion, self.reverse_cut, True
+            )
+        )
+
+    def evaluate(self, store: MarketStore, positions: np.ndarray) -> np.ndarray:
+        if not store.has_indicator(self.parameter):
+            return np.zeros(len(positions), dtype=bool)
+        values = store.columns[self.parameter][positions]
+        if self.reverse_cut:
+            return values < self.cut_criterion
+        return values > self.cut_criterion
+
+    def parameters(self) -> set[str]:
+        return {self.parameter}
+
+    def evaluate_panel(self, panels: dict[str, np.ndarray]) -> np.ndarray:
+        if self.parameter not in panels:
+            return np.zeros(_panel_shape(panels), dtype=bool)
+        values = panels[self.parameter]
+        if self.reverse_cut:
+            return values < self.cut_criterion
+        return values > self.cut_criterion
+
+
+class AllConditions:
+    """
+    Conjunction of conditions.
+    Single criteria run first, from the most to the least selective
+    on the market being screened, each one only on the stocks
+    that passed the previous ones.
+    """
+
+    def __init__(self, conditions: list):
+        self.conditions = conditions
+
+    def evaluate(self, store: MarketStore, positions: np.ndarray) -> np.ndarray:
+        criteria = [c for c in self.conditions if isinstance(c, Criterion)]
+        groups = [c for c in self.conditions if not isinstance(c, Criterion)]
+        criteria.sort(key=lambda criterion: criterion.count(store))
+
+        keep = np.arange(len(positions))
+        for condition in criteria + groups:
+            if len(keep) == 0:
+                break
+            keep = keep[condition.evaluate(store, positions[keep])]
+
+        result = np.zeros(len(positions), dtype=bool)
+        result[keep] = True
+
+        return result
+
+    def parameters(self) -> set[str]:
+        return set().union(*(c.parameters() for c in self.conditions))
+
+    def evaluate_panel(self, panels: dict[str, np.ndarray]) -> np.ndarray:
+        result = np.ones(_panel_shape(panels), dtype=bool)
+        for condition in self.conditions:
+            result &= condition.evaluate_panel(panels)
+
+        return result
+
+
+class AnyCondition:
+    """
+    Disjunction of conditions
+    """
+
+    def __init__(self, conditions: list):
+        self.conditions = conditions
+
+    def evaluate(self, store: MarketStore, positions: np.ndarray) -> np.ndarray:
+        result = np.zeros(len(positions), dtype=bool)
+        for condition in self.conditions:
+            result |= condition.evaluate(store, positions)
+
+        return result
+
+    def parameters(self) -> set[str]:
+        return set().union(*(c.parameters() for c in self.conditions))
+
+    def evaluate_panel(self, panels: dict[str, np.ndarray]) -> np.ndarray:
+        result = np.zeros(_panel_shape(panels), dtype=bool)
+        for condition in self.conditions:
+            result |= condition.evaluate_panel(panels)
+
+        return result
+
+
+class NotCondition:
+    """
+    Negation of a condition. Stocks with missing values pass a negated criterion.
+    """
+
+    def __init__(self, condition):
+        self.condition = condition
+
+    def evaluate(self, store: MarketStore, positions: np.ndarray) -> np.ndarray:
+        return ~self.condition.evaluate(store, positions)
+
+    def parameters(self) -> set[str]:
+        return self.condition.parameters()
+
+    def evaluate_panel(self, panels: dict[str, np.ndarray]) -> np.ndarray:
+        return ~self.condition.evaluate_panel(panels)
+
+
+class Screen:
+    """
+    A compiled screen: a validated tree of conditions plus a sort criterion.
+    It holds no market data, so the same plan runs against any snapshot.
+    """
+
+    def __init__(self, condition, sort_by: dict):
+        self.condition = condition
+        self.sort_by = sort_by
+
+    def select(self, store: MarketStore, mask: np.ndarray = None) -> np.ndarray:
+        """
+        Positions of the stocks of 'store' selected by the screen, sorted.
+        If given, only stocks in 'mask' are considered.
+        """
+        if mask is None:
+            mask = np.ones(len(store), dtype=bool)
+        positions = np.flatnonzero(mask)
+
+        selected = np.zeros(len(store), dtype=bool)
+        selected[positions[self.condition.evaluate(store, positions)]] = True
+
+        if not store.has_indicator(self.sort_by['parameter']):
+            # an unknown sort parameter (non strict screens) only fails
+            # when there are stocks to sort
+            if selected.any():
+                raise KeyError(self.sort_by['parameter'])
+            return np.flatnonzero(selected)
+
+        return store.sort_mask(
+            selected, self.sort_by['parameter'], self.sort_by['ascending']
+        )
+
+    def parameters(self) -> set[str]:
+        """
+        Indicators read by the screen, including the sort criterion
+        """
+        return self.condition.parameters() | {self.sort_by['parameter']}
+
+
+def _compile_condition(condition, strict: bool):
+    if not isinstance(condition, dict):
+        raise ValueError(f'Condition must be a dictionary, got {condition!r}')
+
+    groups = {'all', 'any', 'not'} & condition.keys()
+    if groups:
+        if len(condition) != 1:
+            raise ValueError(
+                f'A group of conditions must have a single key: {condition!r}'
+            )
+        if 'not' in condition:
+            return NotCondition(_compile_condition(condition['not'], strict))
+        key = groups.pop()
+        if not isinstance(condition[key], list):
+            raise ValueError(f"'{key}' must be a list of conditions")
+        conditions = [_compile_condition(c, strict) for c in condition[key]]
+        return AllConditions(conditions) if key == 'all' else AnyCondition(
+            conditions
+        )
+
+    missing = {'parameter', 'cut_criterion', 'reverse_cut'} - condition.keys()
+    if missing:
+        raise ValueError(
+            f'Condition {condition!r} is missing keys {sorted(missing)}'
+        )
+    if strict and condition['parameter'] not in INDICATORS:
+        raise ValueError(f"Unknown parameter '{condition['parameter']}'")
+    cut_criterion = condition['cut_criterion']
+    if (strict and isinstance(cut_criterion, bool)) or not isinstance(
+        cut_criterion, (int, float)
+    ):
+        raise ValueError(
+            f'cut_criterion must be a number, got {cut_criterion!r}'
+        )
+    reverse_cut = condition['reverse_cut']
+    if strict and not isinstance(reverse_cut, bool):
+        raise ValueError(
+            f'reverse_cut must be a boolean, got {reverse_cut!r}'
+        )
+
+    return Criterion(condition['parameter'], cut_criterion, bool(reverse_cut))
+
+
+@lru_cache(maxsize=1024)
+def _compile_screen(key: str, strict: bool) -> Screen:
+    conditions, sort_by = json.loads(key)
+
+    if not isinstance(conditions, list):
+        raise ValueError('conditions must be a list of dictionaries')
+    if not isinstance(sort_by, dict) or {'parameter', 'ascending'} - set(
+        sort_by
+    ):
+        raise ValueError(
+            "sort_by must be a dictionary with keys 'parameter' and 'ascending'"
+        )
+    if strict and sort_by['parameter'] not in INDICATORS:
+        raise ValueError(f"Unknown sort parameter '{sort_by['parameter']}'")
+
+    return Screen(
+        _compile_condition({'all': conditions}, strict),
+        {
+            'parameter': sort_by['parameter'],
+            'ascending': bool(sort_by['ascending']),
+        },
+    )
+
+
+def compile_screen(
+    conditions: list[dict], sort_by: dict, strict: bool = True
+) -> Screen:
+    """
+    Validates a list of conditions and a sort_by dictionary, in the format
+    of StockMarket.get_top_stocks_by_list_of_conditions, and turns them
+    into a Screen. Compiled screens are cached, so compiling the same
+    screen again is a dictionary lookup.
+    Raises ValueError on malformed screens and, if 'strict', on unknown
+    parameters (of the conditions or of sort_by) and on a reverse_cut
+    (or a cut_criterion) that is not a boolean (a number). Otherwise,
+    as before screens were compiled, unknown parameters of conditions
+    select no stocks, an unknown sort_by parameter raises KeyError
+    only if some stock passes the conditions, and reverse_cut is taken
+    by its truth value.
+    """
+    try:
+        key = json.dumps([conditions, sort_by], sort_keys=True)
+    except TypeError as error:
+        raise ValueError(f'Screen is not serializable: {error}') from error
+
+    return _compile_screen(key, strict)
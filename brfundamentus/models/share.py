@@ -1,20 +1,103 @@
+import datetime
 from brfundamentus.models.stock import Stock
 from brfundamentus.models.operation import Operation, OperationType
+from brfundamentus.models.ledger import OperationsLedger
 from brfundamentus.utils.utils import round_value as rv
 
 
 class Share:
     """
     Class to model a stock inside a portfolio
+    Operations are recorded in an OperationsLedger, which can be
+    shared by all the shares of a portfolio.
+    Buys average the mean price and sales only reduce the quantity, even
+    beyond the position; PositionIndex applies its own average-cost
+    rule, apply_operation, to the same operations.
     """
 
-    def __init__(self, stock: Stock, mean_price: float, quantity: int):
-        self.stock: Stock = stock
-        self.mean_price: float = mean_price
-        self.quantity: int = quantity
-        self.operations_history: list[Operation] = list()
+    def __init__(
+        self,
+        stock: Stock,
+        mean_price: float,
+        quantity: int,
+        ledger: OperationsLedger = None,
+        date: datetime.date = None,
+    ):
+        self.ledger = OperationsLedger() if ledger is None else ledger
+        self.__fill_first_buy(stock, mean_price, quantity, date)
+        # callbacks(share, change of total_invested, change of total_amount)
+        self.__listeners: list = list()
+        self.__stock: Stock = None
+        self.__mean_price: float = mean_price
+        self.__quantity: int = quantity
+        # gains of the sales over the mean price, on the quantity held
+        self.realized_pnl: float = 0.0
+        self.stock = stock
 
-        self.__fill_first_buy()
+    @property
+    def operations_history(self) -> list[Operation]:
+        return self.ledger.operations(self.stock.ticker)
+
+    def add_listener(self, callback):
+        """
+        Registers callback(share, invested_change, amount_change),
+        called whenever total_invested or total_amount changes:
+        on buys and sells and on changes of the price of the stock
+        """
+        self.__listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.__listeners:
+            self.__listeners.remove(callback)
+
+    def __notify(self, invested_change: float, amount_change: float):
+        for callback in list(self.__listeners):
+            callback(self, invested_change, amount_change)
+
+    @property
+    def stock(self) -> Stock:
+        return self.__stock
+
+    @stock.setter
+    def stock(self, stock: Stock):
+        old_amount = self.total_amount if self.__stock is not None else 0
+        if self.__stock is not None:
+            self.__stock.unwatch_price(self.__on_price_change)
+        self.__stock = stock
+        stock.watch_price(self.__on_price_change)
+        if self.__listeners:
+            self.__notify(0, self.total_amount - old_amount)
+
+    def __setstate__(self, state: dict):
+        # stocks are pickled and copied without their price watchers
+        self.__dict__.update(state)
+        self.__stock.watch_price(self.__on_price_change)
+
+    def __on_price_change(self, stock: Stock, old_price, new_price):
+        self.__notify(0, self.quantity * (new_price - old_price))
+
+    @property
+    def mean_price(self) -> float:
+        return self.__mean_price
+
+    @mean_price.setter
+    def mean_price(self, mean_price: float):
+        old_invested = self.total_invested
+        self.__mean_price = mean_price
+        self.__notify(self.total_invested - old_invested, 0)
+
+    @property
+    def quantity(self) -> int:
+        return self.__quantity
+
+    @quantity.setter
+    def quantity(self, quantity: int):
+        old_invested, old_amount = self.total_invested, self.total_amount
+        self.__quantity = quantity
+        self.__notify(
+            self.total_invested - old_invested,
+            self.total_amount - old_amount,
+        )
 
     @property
     def total_invested(self):
@@ -28,14 +111,16 @@ class Share:
     def total_amount(self):
         return self.quantity * self.stock.price
 
-    def __fill_first_buy(self):
-        operation = Operation(
-            ticker=self.stock.ticker,
-            price=self.mean_price,
-            quantity=self.quantity,
-            type=OperationType.BUY,
+    def __fill_first_buy(
+        self,
+        stock: Stock,
+        mean_price: float,
+        quantity: int,
+        date: datetime.date,
+    ):
+        self.ledger.append(
+            stock.ticker, OperationType.BUY, quantity, mean_price, date
         )
-        self.operations_history.append(operation)
 
     def print_investiment_info(self):
         print(
@@ -44,32 +129,27 @@ class Share:
         self.stock.print_valuations()
 
     def __compute_new_mean_price(self, price: float, num_stocks: int):
-        self.mean_price = round(
+        return round(
             (self.quantity * self.mean_price + price * num_stocks)
             / (num_stocks + self.quantity),
             2,
         )
 
-    def buy(self, price: float, num_stocks: int):
-        self.__compute_new_mean_price(price, num_stocks)
-        self.quantity += num_stocks
-        operation = Operation(
-            ticker=self.stock.ticker,
-            price=price,
-            quantity=num_stocks,
-            type=OperationType.BUY,
+    def buy(self, price: float, num_stocks: int, date: datetime.date = None):
+        mean_price = self.__compute_new_mean_price(price, num_stocks)
+        self.ledger.append(
+            self.stock.ticker, OperationType.BUY, num_stocks, price, date
         )
-        self.operations_history.append(operation)
+        self.mean_price = mean_price
+        self.quantity += num_stocks
 
-    def sell(self, price, num_stocks):
-        self.quantity -= num_stocks
-        operation = Operation(
-            ticker=self.stock.ticker,
-            price=price,
-            quantity=num_stocks,
-            type=OperationType.SELL,
+    def sell(self, price, num_stocks, date: datetime.date = None):
+        self.ledger.append(
+            self.stock.ticker, OperationType.SELL, num_stocks, price, date
         )
-        self.operations_history.append(operation)
+        closed = min(num_stocks, max(self.quantity, 0))
+        self.realized_pnl += (price - self.mean_price) * closed
+        self.quantity -= num_stocks
 
     def summary(self):
         up_down = 'Upside' if self.return_of_investiment > 0 else 'Downside'
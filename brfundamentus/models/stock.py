@@ -1,3 +1,6 @@
+import dataclasses
+import types
+import weakref
 from typing import Optional
 from pydantic import PositiveInt, PositiveFloat
 from pydantic.dataclasses import dataclass
@@ -54,3 +57,121 @@ class Stock:
 
     def __repr__(self) -> str:
         return f'{self.ticker} ({self.price})'
+
+    def __getstate__(self) -> dict:
+        # price watchers are subscriptions, not part of the stock, so
+        # pickles and copies leave them out (shares watch again on load)
+        state = dict(self.__dict__)
+        state.pop('_price_watchers', None)
+        return state
+
+    def set_price(self, price: float):
+        """
+        Changes the price of the stock and calls its price watchers.
+        Prices must be changed through here for watchers to see them.
+        """
+        if not price > 0:
+            raise ValueError(f'Price of {self.ticker} must be positive')
+        old_price = self.price
+        self.price = price
+        watchers = getattr(self, '_price_watchers', None)
+        if not watchers or price == old_price:
+            return
+        for watcher in list(watchers):
+            callback = _watcher_callback(watcher)
+            if callback is None:
+                watchers.remove(watcher)
+            else:
+                callback(self, old_price, price)
+
+    def watch_price(self, callback):
+        """
+        Registers callback(stock, old_price, new_price),
+        called whenever the price of the stock changes through set_price.
+        Bound methods are held by a weak reference, so watching does not
+        keep the object of the method alive. Other callables, such as
+        functions and lambdas, are held strongly until unwatched.
+        """
+        watchers = getattr(self, '_price_watchers', None)
+        if watchers is None:
+            watchers = list()
+            object.__setattr__(self, '_price_watchers', watchers)
+        if isinstance(callback, types.MethodType):
+            watchers.append(weakref.WeakMethod(callback))
+        else:
+            watchers.append(callback)
+
+    def unwatch_price(self, callback):
+        watchers = getattr(self, '_price_watchers', None)
+        if watchers:
+            watchers[:] = [
+                watcher
+                for watcher in watchers
+                if _watcher_callback(watcher) not in (None, callback)
+            ]
+
+
+def _watcher_callback(watcher):
+    """
+    Callback of a price watcher, or None if it was garbage collected
+    """
+    if isinstance(watcher, weakref.WeakMethod):
+        return watcher()
+    return watcher
+
+
+STOCK_FIELDS = tuple(field.name for field in dataclasses.fields(Stock))
+
+
+class CompactStock:
+    """
+    Trusted counterpart of Stock, for bulk loads of already validated values
+    (e.g. from a MarketStore). It skips pydantic validation and keeps
+    its fields in __slots__, so it is cheaper to build and to hold.
+    """
+
+    __slots__ = STOCK_FIELDS + ('_price_watchers',)
+
+    def __init__(self, **values):
+        for name in STOCK_FIELDS:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_row(cls, row: tuple):
+        """
+        Builds a CompactStock from the values of all its fields,
+        in the order of the fields of Stock
+        """
+        stock = cls.__new__(cls)
+        for field, value in zip(COMPACT_STOCK_FIELDS, row):
+            field.__set__(stock, value)
+
+        return stock
+
+    def __getstate__(self) -> tuple:
+        # as in Stock, price watchers are left out
+        return None, {
+            name: getattr(self, name)
+            for name in STOCK_FIELDS
+            if hasattr(self, name)
+        }
+
+    print_valuations = Stock.print_valuations
+    __repr__ = Stock.__repr__
+    set_price = Stock.set_price
+    watch_price = Stock.watch_price
+    unwatch_price = Stock.unwatch_price
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in STOCK_FIELDS
+        )
+
+    __hash__ = None
+
+
+# descriptors of the slots of the fields, from_row skips the watchers
+COMPACT_STOCK_FIELDS = [getattr(CompactStock, name) for name in STOCK_FIELDS]
@@ -1,69 +1,320 @@
+import os
+
+import numpy as np
+
 from brfundamentus.models.stock import Stock
-from brfundamentus.utils.utils import compute_greenblatt_rank
-from brfundamentus.builders.stock_builder import build_list_of_stocks
+from brfundamentus.models.market_store import MarketStore
+from brfundamentus.models.screen import Screen, compile_screen
+from brfundamentus.builders.stock_builder import (
+    BAZIN_REQUIRED_YIELD,
+    CSV_INDICATORS,
+    GRAHAM_MULTIPLIER,
+    build_market_store,
+    compute_valuation_sensitivity,
+    reprice_columns,
+)
+from brfundamentus.utils.csv_reader import (
+    CsvSource,
+    header_positions,
+    read_csv,
+)
+from brfundamentus.utils.utils import parse_column_to_floats
+from brfundamentus.utils.snapshot_cache import (
+    cache_key,
+    load_cached_store,
+    save_cached_store,
+)
+from brfundamentus.utils.instrumentation import count, span
+from brfundamentus.utils.query_cache import (
+    QueryCache,
+    conditions_key,
+    criterion_key,
+)
 
 
 class StockMarket:
     """
     This class is responsible to handle fundamentalist information
-    about the shares in the market
+    about the shares in the market.
+    Indicators are kept in a columnar MarketStore, on which filters,
+    sorts and ranks run. Stock objects are built on demand.
+    Results of the top stocks queries are kept in an LRU cache of
+    'query_cache_size' entries, emptied whenever the store changes;
+    see query_cache_stats.
     """
 
-    def __init__(self, stocks: list[Stock]):
-        self.stocks = stocks
-        compute_greenblatt_rank(self.stocks)
+    def __init__(
+        self,
+        stocks: list[Stock] = None,
+        store: MarketStore = None,
+        compute_rank: bool = True,
+        market_risk: float = 0.15,
+        query_cache_size: int = 256,
+    ):
+        # used to recompute the Gordon valuation on updates
+        self.market_risk = market_risk
+        if store is None:
+            store = MarketStore.from_stocks(stocks)
+        self.store = store
+        if compute_rank:
+            self.store.compute_greenblatt_rank()
+        self.query_cache = QueryCache(query_cache_size)
+
+    def __cache_state(self) -> tuple:
+        # the store may also be replaced as a whole
+        return self.store, self.store.version
+
+    def __cached(self, key, query) -> list[Stock]:
+        if key is None:
+            return query()
+        stocks = self.query_cache.get(key, self.__cache_state())
+        if stocks is None:
+            count('query_cache_misses')
+            stocks = tuple(query())
+            # read the state after the query, which may refresh the ranks
+            self.query_cache.put(key, self.__cache_state(), stocks)
+        else:
+            count('query_cache_hits')
+
+        return list(stocks)
+
+    def query_cache_stats(self) -> dict:
+        """
+        Hits, misses, evictions and invalidations of the query cache
+        """
+        return self.query_cache.stats()
+
+    @property
+    def stocks(self) -> list[Stock]:
+        self.store.refresh_greenblatt_rank()
+        return self.store.get_stocks()
+
+    @property
+    def rejections(self) -> list[dict]:
+        """
+        Rows of the csv dropped by validation, as dictionaries
+        with the 'ticker' and the 'reasons' (see MarketStore.validate)
+        """
+        return self.store.rejections
 
     def get_stock_by_ticker(self, ticker: str):
-        return next(
-            (stock for stock in self.stocks if stock.ticker == ticker.upper()),
-            None,
-        )
+        position = self.store.get_position(ticker)
+        if position is None:
+            return None
+        self.store.refresh_greenblatt_rank()
+        return self.store.build_stock(position)
 
-    @classmethod
-    def read_from_csv(cls, path: str, market_risk: float = 0.15):
-        with open(path) as file:
-            all_info = file.readlines()
+    def get_greenblatt_rank(self, ticker: str):
+        """
+        Current Greenblatt rank of a ticker, None if it is unranked
+        or not listed
+        """
+        position = self.store.get_position(ticker)
+        if position is None:
+            return None
+        return self.store.get_greenblatt_rank(position)
 
-        all_stocks = build_list_of_stocks(
-            all_info[1:], all_info[0].split(';'), market_risk
-        )
-        market = StockMarket(all_stocks)
+    def update_indicators(self, ticker: str, **indicators):
+        """
+        Changes indicators of a listed stock in place, e.g.
+        market.update_indicators('ITSA4', ev_per_ebit=5.2, roic=0.18).
+        The Greenblatt ranking is maintained incrementally.
+        Derived indicators are not recomputed.
+        """
+        position = self.store.get_position(ticker)
+        if position is None:
+            raise KeyError(f'Ticker {ticker} is not listed')
+        for parameter, value in indicators.items():
+            if not self.store.has_indicator(parameter):
+                raise KeyError(f'Unknown indicator {parameter}')
+            self.store.set_value(position, parameter, value)
+
+    def get_stocks_by_tickers(self, tickers: list[str]) -> list[Stock]:
+        """
+        Resolves many tickers in one call.
+        Returns a list aligned with 'tickers', with None for unknown tickers.
+        """
+        return [self.get_stock_by_ticker(ticker) for ticker in tickers]
+
+    @classmethod
+    def read_from_csv(
+        cls,
+        path: CsvSource,
+        market_risk: float = 0.15,
+        cache_dir: str = None,
+        trusted: bool = False,
+    ):
+        """
+        Reads a statusinvest csv file.
+        'path' can also be a file object or an iterable of lines.
+        If 'cache_dir' is given and 'path' is a file, the computed market
+        is cached there, keyed by the content of the file and market_risk,
+        and later reads of the same file just memory-map it.
+        If 'trusted', the rows are taken as valid: the validation pass is
+        skipped, stocks are returned as CompactStock, built without
+        pydantic validation, and the market is not written to the cache.
+        Rows dropped by validation are listed in 'rejections'.
+        """
+        with span('market.read_from_csv') as stage:
+            key = None
+            if cache_dir is not None and isinstance(
+                path, (str, os.PathLike)
+            ):
+                key = cache_key(path, market_risk)
+                store = load_cached_store(cache_dir, key, trusted)
+                if store is not None:
+                    stage.add('snapshot_cache_hits')
+                    stage.add('stocks', len(store))
+                    return StockMarket(
+                        store=store,
+                        compute_rank=False,
+                        market_risk=market_risk,
+                    )
+                stage.add('snapshot_cache_misses')
+
+            headers, rows = read_csv(path, ';')
+
+            store = build_market_store(
+                rows, headers, market_risk, trusted=trusted
+            )
+            market = StockMarket(store=store, market_risk=market_risk)
+            if key is not None and not trusted:
+                save_cached_store(cache_dir, key, market.store)
+            stage.add('stocks', len(store))
 
         return market
 
-    def __filter_stocks_by_single_criterion(
-        self,
-        parameter: str,
-        cut_criterion: float = 0,
-        reverse_cut: bool = False,
-        disconsider: list = None,
-        only_from: list = None,
-    ) -> list[Stock]:
+    def apply_updates(
+        self, csv: CsvSource = None, prices: dict[str, float] = None
+    ) -> list[str]:
+        """
+        Refreshes the market with changed rows only, instead of a full reload.
+        Parameters:
+            - csv: a partial statusinvest csv (path, file object or iterable of lines).
+                   With all the statusinvest headers, its rows replace the stocks
+                   with the same tickers, and unknown tickers are added.
+                   With only TICKER and PRECO, its rows are price ticks.
+            - prices (dict): price ticks, from ticker to new price.
+        On a price tick, multiples of the price (P/L, P/VP, market value)
+        and the dividend yield are rescaled, keeping the fundamentals.
+        Only the affected stocks have their derived indicators and valuations
+        recomputed. Stocks already built, the Greenblatt ranking and the
+        sorted indexes are patched in place.
+        Returns the tickers updated or added.
+        """
+        updated = list()
+        if csv is not None:
+            headers, rows = read_csv(csv, ';')
+            positions = header_positions(headers)
+            csv_headers = [header for header, _ in CSV_INDICATORS.values()]
+            if all(header in positions for header in csv_headers):
+                updated += self.__apply_rows(rows, headers)
+            elif 'TICKER' in positions and 'PRECO' in positions:
+                rows = list(rows)
+                ticks, _ = parse_column_to_floats(
+                    [row[positions['PRECO']] for row in rows]
+                )
+                updated += self.__apply_prices(
+                    zip([row[positions['TICKER']] for row in rows], ticks)
+                )
+            else:
+                raise ValueError(
+                    'Updates csv must have all the statusinvest headers '
+                    'or TICKER and PRECO'
+                )
+        if prices is not None:
+            updated += self.__apply_prices(prices.items())
+
+        return updated
 
-        if disconsider is None:
-            disconsider = []
-        if only_from is None:
-            only_from = []
+    def __apply_rows(self, rows, headers: list[str]) -> list[str]:
+        changes = build_market_store(
+            rows, headers, self.market_risk, trusted=self.store.trusted
+        )
+        positions = [self.store.get_position(t) for t in changes.tickers]
+        listed = np.array([p is not None for p in positions], dtype=bool)
+
+        self.store.update_rows(
+            [p for p in positions if p is not None],
+            {
+                parameter: values[listed]
+                for parameter, values in changes.columns.items()
+                if parameter != 'greenblatt_rank'
+            },
+        )
+        if not listed.all():
+            self.store.append(
+                MarketStore(
+                    changes.tickers[~listed],
+                    {
+                        parameter: values[~listed]
+                        for parameter, values in changes.columns.items()
+                    },
+                )
+            )
 
-        if parameter not in list(self.stocks[0].__dict__.keys()):
+        return list(changes.tickers)
+
+    def __apply_prices(self, ticks) -> list[str]:
+        positions, prices, tickers = list(), list(), list()
+        for ticker, price in ticks:
+            position = self.store.get_position(ticker)
+            if position is None or not price > 0:
+                continue
+            positions.append(position)
+            prices.append(price)
+            tickers.append(self.store.tickers[position])
+        if not positions:
             return []
 
-        modifier = -1 if reverse_cut else 1
-        stocks_list = [
-            stock
-            for stock in self.stocks
-            if stock.__dict__[parameter] is not None
-            and stock.ticker not in disconsider
-            and modifier * stock.__dict__[parameter] > modifier * cut_criterion
-            and stock.ticker not in disconsider
-        ]
+        repriced = reprice_columns(
+            {
+                parameter: values[positions]
+                for parameter, values in self.store.columns.items()
+            },
+            np.array(prices, dtype=float),
+            self.market_risk,
+        )
+        self.store.update_rows(positions, repriced)
+
+        return tickers
 
+    def valuation_sensitivity(
+        self,
+        market_risks: list[float],
+        required_yields: list[float] = (BAZIN_REQUIRED_YIELD,),
+        graham_multipliers: list[float] = (GRAHAM_MULTIPLIER,),
+    ) -> dict:
+        """
+        Sensitivity of the valuations to the assumptions of the models:
+        the market risk of Gordon, the required yield of Bazin
+        and the multiplier of Graham.
+        Every combination of the given values is a scenario.
+        Returns a dictionary with the 'tickers', the list of 'scenarios'
+        and, for each of 'graham_valuation', 'bazin_valuation' and
+        'gordon_valuation', a ticker x scenario matrix.
+        """
+        sensitivity = compute_valuation_sensitivity(
+            self.store.columns,
+            market_risks,
+            required_yields,
+            graham_multipliers,
+        )
+        sensitivity['tickers'] = list(self.store.tickers)
+
+        return sensitivity
+
+    def __mask_stocks_by_tickers(
+        self, disconsider: list = None, only_from: list = None
+    ) -> np.ndarray:
+
+        mask = np.ones(len(self.store), dtype=bool)
+        if disconsider:
+            mask &= ~self.store.tickers_mask(disconsider)
         if only_from:
-            stocks_list = [
-                stock for stock in stocks_list if stock.ticker in only_from
-            ]
+            mask &= self.store.tickers_mask(only_from)
 
-        return stocks_list
+        return mask
 
     def get_top_stocks_by_criterion(
         self,
@@ -93,21 +344,53 @@ class StockMarket:
             - only_from (list): A list of tickers. Method will only consider stocks from that list before filter by given criterion.
         """
 
-        stocks_list = self.__filter_stocks_by_single_criterion(
-            parameter=parameter,
-            cut_criterion=cut_criterion,
-            reverse_cut=reverse_cut,
-            disconsider=disconsider,
-            only_from=only_from,
-        )
+        with span('screen.top_stocks_by_criterion'):
+            return self.__cached(
+                criterion_key(
+                    num_stocks,
+                    parameter,
+                    cut_criterion,
+                    reverse_cut,
+                    ascending,
+                    disconsider,
+                    only_from,
+                ),
+                lambda: self.__top_stocks_by_criterion(
+                    num_stocks,
+                    parameter,
+                    cut_criterion,
+                    reverse_cut,
+                    ascending,
+                    disconsider,
+                    only_from,
+                ),
+            )
 
-        stocks_list.sort(
-            key=lambda st: st.__dict__[parameter], reverse=not ascending
-        )
+    def __top_stocks_by_criterion(
+        self,
+        num_stocks: int,
+        parameter: str,
+        cut_criterion: float,
+        reverse_cut: bool,
+        ascending: bool,
+        disconsider: list,
+        only_from: list,
+    ) -> list[Stock]:
+        if not self.store.has_indicator(parameter):
+            return []
 
-        max_index = min(num_stocks, len(stocks_list))
+        self.store.refresh_greenblatt_rank()
+        positions = self.store.top_positions(
+            parameter, cut_criterion, reverse_cut, ascending
+        )
+        if disconsider:
+            positions = positions[
+                ~self.store.tickers_mask(disconsider, positions)
+            ]
+        if only_from:
+            positions = positions[self.store.tickers_mask(only_from, positions)]
 
-        return stocks_list[:max_index]
+        return self.store.get_stocks(positions[:num_stocks])
 
     def get_top_stocks_by_list_of_conditions(
         self,
@@ -126,6 +409,11 @@ class StockMarket:
                                 - 'parameter' (string): the criterion one wants to filter. Should be a key from the dictionarie of all info.
                                 - 'cut_criterion' (float): a value used as cut criterion.
                                 - 'reverse_cut' (bool): flag to indicate if the cut_criterion is reversed.
+                            A condition can also be a group of conditions, as a dictionary with a single key:
+                                - 'all': a list of conditions that must all hold.
+                                - 'any': a list of conditions of which at least one must hold.
+                                - 'not': a condition that must not hold. Stocks with a missing value pass a negated criterion.
+                            Groups can be nested, e.g. {'any': [{'not': criterion_1}, {'all': [criterion_2, criterion_3]}]}.
             -sort_by: A dictionary to indicate for what parameter we must sort the results.
                         This dictionary must have the follwing keys:
                             - 'parameter': for which we sort by
@@ -135,37 +423,40 @@ class StockMarket:
             - only_from (list): A list of tickers. Method will only consider stocks from that list before filter by given criterion.
         """
 
-        list_of_stocks_filtered = list()
-        for criterion in conditions:
-            total_stocks = self.__filter_stocks_by_single_criterion(
-                parameter=criterion['parameter'],
-                cut_criterion=criterion['cut_criterion'],
-                reverse_cut=criterion['reverse_cut'],
-                disconsider=disconsider,
-                only_from=only_from,
-            )
-
-            list_of_stocks_filtered.append(total_stocks)
+        def query() -> list[Stock]:
+            screen = compile_screen(conditions, sort_by, strict=False)
+            return self.run_screen(screen, num_stocks, disconsider, only_from)
 
-        selected_stocks = [
-            stock
-            for stock in self.stocks
-            if all(
-                (
-                    stock in single_list
-                    for single_list in list_of_stocks_filtered
-                )
+        with span('screen.top_stocks_by_conditions'):
+            return self.__cached(
+                conditions_key(
+                    conditions, sort_by, num_stocks, disconsider, only_from
+                ),
+                query,
             )
-        ]
 
-        selected_stocks.sort(
-            key=lambda st: st.__dict__[sort_by['parameter']],
-            reverse=not sort_by['ascending'],
-        )
+    def run_screen(
+        self,
+        screen: Screen,
+        num_stocks: int = 50,
+        disconsider: list = None,
+        only_from: list = None,
+    ) -> list[Stock]:
+        """
+        Runs a screen compiled with screen.compile_screen on this market.
+        Parameters num_stocks, disconsider and only_from are the same
+        of get_top_stocks_by_list_of_conditions.
+        """
 
-        limit = min(len(selected_stocks), num_stocks)
+        with span('screen.run') as stage:
+            self.store.refresh_greenblatt_rank()
+            positions = screen.select(
+                self.store,
+                self.__mask_stocks_by_tickers(disconsider, only_from),
+            )
+            stage.add('selected', len(positions))
 
-        return selected_stocks[:limit]
+            return self.store.get_stocks(positions[:num_stocks])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,407 @@
+"""
+Local HTTP/JSON service answering screening queries on a market
+kept in memory, reloaded when its statusinvest csv file changes
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from brfundamentus.models.stock import STOCK_FIELDS
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.builders.market_loader import (
+    compute_market_arrays,
+    market_from_arrays,
+)
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+MAX_BODY_SIZE = 1 << 20
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def stock_to_dict(stock) -> dict:
+    return {field: getattr(stock, field) for field in STOCK_FIELDS}
+
+
+def _split_tickers(values: Optional[list[str]]) -> Optional[list[str]]:
+    if not values:
+        return None
+    return [
+        ticker.strip().upper()
+        for value in values
+        for ticker in value.split(',')
+        if ticker.strip()
+    ]
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise HttpError(400, f'Invalid boolean {value!r}')
+
+
+class ScreeningService:
+    """
+    Serves queries on a StockMarket held in memory:
+
+    GET  /stocks/<ticker>          get_stock_by_ticker
+    GET  /top?parameter=dy&...     get_top_stocks_by_criterion, with
+                                   num_stocks, cut_criterion, reverse_cut,
+                                   ascending, disconsider and only_from
+                                   (comma separated tickers)
+    POST /screen                   get_top_stocks_by_list_of_conditions,
+                                   with a JSON body of its arguments
+    GET  /status                   the snapshot being served
+
+    Queries run on the event loop, each one against the snapshot current
+    when it started. The csv file is polled for changes; a new snapshot
+    is built in a separate process and then swapped in with a single
+    assignment, so queries never wait for a rebuild nor see a market
+    half built. If a rebuild fails or reads no stocks, the previous
+    snapshot is kept and the error is reported on /status.
+    """
+
+    def __init__(
+        self,
+        csv_path: str,
+        market_risk: float = 0.15,
+        host: str = '127.0.0.1',
+        port: int = 8080,
+        poll_interval: float = 2.0,
+        cache_dir: str = None,
+    ):
+        self.csv_path = csv_path
+        self.market_risk = market_risk
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.cache_dir = cache_dir
+
+        self.market: Optional[StockMarket] = None
+        self.loaded_at: Optional[float] = None
+        self.snapshot = 0
+        self.last_error: Optional[str] = None
+        self.__signature = None
+        self.__executor: Optional[ProcessPoolExecutor] = None
+        self.__server: Optional[asyncio.AbstractServer] = None
+        self.__watcher: Optional[asyncio.Task] = None
+
+    def __file_signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.csv_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def reload(self) -> bool:
+        """
+        Builds a new snapshot from the csv file, off the event loop,
+        and swaps it in. Returns whether it succeeded.
+        """
+        signature = self.__file_signature()
+        loop = asyncio.get_running_loop()
+        try:
+            tickers, matrix, rejections = await loop.run_in_executor(
+                self.__executor,
+                compute_market_arrays,
+                self.csv_path,
+                self.market_risk,
+                self.cache_dir,
+            )
+            if len(tickers) == 0:
+                raise ValueError('No stocks were read')
+            market = market_from_arrays(
+                tickers, matrix, self.market_risk, rejections=rejections
+            )
+        except BrokenProcessPool as error:
+            # the worker died (e.g. killed for its memory), not the file:
+            # a new pool is started and the next poll tries again
+            self.last_error = f'{type(error).__name__}: {error}'
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = ProcessPoolExecutor(max_workers=1)
+            return False
+        except Exception as error:
+            self.last_error = f'{type(error).__name__}: {error}'
+            # not retried until the file changes again
+            self.__signature = signature
+            return False
+
+        self.market = market
+        self.loaded_at = time.time()
+        self.snapshot += 1
+        self.last_error = None
+        self.__signature = signature
+
+        return True
+
+    async def __watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            signature = self.__file_signature()
+            if signature is not None and signature != self.__signature:
+                await self.reload()
+
+    async def start(self):
+        self.__executor = ProcessPoolExecutor(max_workers=1)
+        if not await self.reload():
+            raise RuntimeError(
+                f'Could not load {self.csv_path}: {self.last_error}'
+            )
+        self.__server = await asyncio.start_server(
+            self.__handle_connection, self.host, self.port
+        )
+        self.port = self.__server.sockets[0].getsockname()[1]
+        self.__watcher = asyncio.create_task(self.__watch())
+
+    async def stop(self):
+        if self.__watcher is not None:
+            self.__watcher.cancel()
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.__server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def __handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while True:
+                request = await self.__read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = self.__dispatch(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.__write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # the server is stopping
+            pass
+        except HttpError as error:
+            self.__write_response(
+                writer, error.status, {'error': str(error)}, False
+            )
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def __read_request(reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(400, 'Malformed request line')
+
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, 'Invalid Content-Length')
+        if length < 0:
+            raise HttpError(400, 'Invalid Content-Length')
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, 'Request body too large')
+        body = await reader.readexactly(length) if length else b''
+
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def __write_response(
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload,
+        keep_alive: bool,
+    ):
+        body = json.dumps(payload).encode()
+        writer.write(
+            (
+                f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+                '\r\n'
+            ).encode('latin-1')
+            + body
+        )
+
+    def __dispatch(self, method: str, target: str, body: bytes) -> tuple:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        # every query runs on the snapshot current when it started
+        market = self.market
+        try:
+            if parts == ['status']:
+                return 200, self.status()
+            if market is None:
+                raise HttpError(503, 'No market loaded')
+            if len(parts) == 2 and parts[0] == 'stocks':
+                self.__require(method, 'GET')
+                return 200, self.get_stock(market, parts[1])
+            if parts == ['top']:
+                self.__require(method, 'GET')
+                return 200, self.top_stocks(market, query)
+            if parts == ['screen']:
+                self.__require(method, 'POST')
+                return 200, self.screen(market, body)
+            raise HttpError(404, f'Unknown path {url.path}')
+        except HttpError as error:
+            return error.status, {'error': str(error)}
+        except Exception as error:
+            return 500, {'error': f'{type(error).__name__}: {error}'}
+
+    @staticmethod
+    def __require(method: str, expected: str):
+        if method != expected:
+            raise HttpError(405, f'Use {expected}')
+
+    def status(self) -> dict:
+        return {
+            'csv_path': self.csv_path,
+            'snapshot': self.snapshot,
+            'loaded_at': self.loaded_at,
+            'stocks': None if self.market is None else len(self.market.store),
+            'last_error': self.last_error,
+            'query_cache': None
+            if self.market is None
+            else self.market.query_cache_stats(),
+        }
+
+    @staticmethod
+    def get_stock(market: StockMarket, ticker: str) -> dict:
+        stock = market.get_stock_by_ticker(ticker)
+        if stock is None:
+            raise HttpError(404, f'Ticker {ticker} is not listed')
+        return stock_to_dict(stock)
+
+    @staticmethod
+    def top_stocks(market: StockMarket, query: dict) -> list[dict]:
+        def single(name: str, default: str) -> str:
+            return query.get(name, [default])[-1]
+
+        if 'parameter' not in query:
+            raise HttpError(400, "Missing query parameter 'parameter'")
+        try:
+            num_stocks = int(single('num_stocks', '10'))
+            cut_criterion = float(single('cut_criterion', '0'))
+        except ValueError as error:
+            raise HttpError(400, str(error))
+
+        stocks = market.get_top_stocks_by_criterion(
+            num_stocks=num_stocks,
+            parameter=single('parameter', ''),
+            cut_criterion=cut_criterion,
+            reverse_cut=_parse_bool(single('reverse_cut', 'false')),
+            ascending=_parse_bool(single('ascending', 'false')),
+            disconsider=_split_tickers(query.get('disconsider')),
+            only_from=_split_tickers(query.get('only_from')),
+        )
+
+        return [stock_to_dict(stock) for stock in stocks]
+
+    @staticmethod
+    def screen(market: StockMarket, body: bytes) -> list[dict]:
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            raise HttpError(400, 'Body must be JSON')
+        if not isinstance(request, dict):
+            raise HttpError(400, 'Body must be a JSON object')
+        unknown = set(request) - {
+            'conditions',
+            'sort_by',
+            'num_stocks',
+            'disconsider',
+            'only_from',
+        }
+        if unknown:
+            raise HttpError(400, f'Unknown arguments {sorted(unknown)}')
+        if 'conditions' not in request or 'sort_by' not in request:
+            raise HttpError(400, "'conditions' and 'sort_by' are required")
+        num_stocks = request.get('num_stocks', 50)
+        if type(num_stocks) is not int or num_stocks < 0:
+            raise HttpError(400, "'num_stocks' must be a non-negative integer")
+        for name in ('disconsider', 'only_from'):
+            tickers = request.get(name)
+            if tickers is not None and not (
+                isinstance(tickers, list)
+                and all(isinstance(ticker, str) for ticker in tickers)
+            ):
+                raise HttpError(400, f"'{name}' must be a list of tickers")
+
+        try:
+            stocks = market.get_top_stocks_by_list_of_conditions(**request)
+        except ValueError as error:
+            raise HttpError(400, str(error))
+
+        return [stock_to_dict(stock) for stock in stocks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('csv_path', help='statusinvest csv file to serve')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--market-risk', type=float, default=0.15)
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--cache-dir', default=None)
+    args = parser.parse_args()
+
+    service = ScreeningService(
+        args.csv_path,
+        market_risk=args.market_risk,
+        host=args.host,
+        port=args.port,
+        poll_interval=args.poll_interval,
+        cache_dir=args.cache_dir,
+    )
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Streaming reader of csv files
+"""
+
+import csv
+import os
+from itertools import islice
+from typing import Iterable, Iterator, Union
+
+CsvSource = Union[str, os.PathLike, Iterable[str]]
+
+
+def iter_csv_rows(
+    source: CsvSource, sep: str = ';', encoding: str = 'utf-8-sig'
+) -> Iterator[list[str]]:
+    """
+    Lazily yields the fields of every line of a csv source.
+    The source can be a path, a file object or any iterable of lines,
+    so piped input can be processed too. Quoted fields are handled
+    by the csv module. 'encoding' is only used to open paths.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline='', encoding=encoding) as file:
+            yield from csv.reader(file, delimiter=sep)
+    else:
+        yield from csv.reader(source, delimiter=sep)
+
+
+def read_csv(
+    source: CsvSource, sep: str = ';', encoding: str = 'utf-8-sig'
+) -> tuple[list[str], Iterator[list[str]]]:
+    """
+    Returns the headers of a csv source and a lazy iterator over its rows.
+    Blank lines are skipped, and so are repeated header lines,
+    so concatenated exports can be read as a single file.
+    """
+    rows = iter_csv_rows(source, sep, encoding)
+    headers = next(rows, [])
+
+    return headers, (row for row in rows if row and row != headers)
+
+
+def header_positions(headers: list[str], upper: bool = False) -> dict[str, int]:
+    """
+    Maps each header, stripped (and upper-cased, if 'upper'), to its position
+    """
+    return {
+        (parameter.strip().upper() if upper else parameter.strip()): idx
+        for idx, parameter in enumerate(headers)
+    }
+
+
+def iter_chunks(rows: Iterable, chunk_size: int) -> Iterator[list]:
+    """
+    Groups an iterable in lists of at most chunk_size items
+    """
+    iterator = iter(rows)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
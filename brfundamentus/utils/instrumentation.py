@@ -0,0 +1,263 @@
+"""
+Timing spans and counters of the stages of the pipeline.
+
+Instrumentation is off by default, and then span() returns a shared
+no-op object and count() returns right away. It is switched on
+    - by a context manager:
+        with profile() as recorded:
+            market = StockMarket.read_from_csv(path)
+        print(recorded.to_json())
+    - or for a whole run, by the environment variable BRFUNDAMENTUS_PROFILE:
+      '1' prints the JSON report to stderr at exit, any other value is
+      the path of a file to write it to.
+Spans opened inside other spans (in the same thread) are their children.
+The summary per stage covers every span, but only the last MAX_SPANS
+spans are kept one by one, so a long-running process (e.g. the screening
+service) can be profiled without growing without bound.
+Work done in other processes, e.g. by builders.market_loader with many
+workers, is not recorded.
+"""
+
+import atexit
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+ENV_VAR = 'BRFUNDAMENTUS_PROFILE'
+MAX_SPANS = 10000
+
+
+class Span:
+    """
+    A timed stage, with counters such as the rows it read or dropped
+    """
+
+    __slots__ = (
+        'name',
+        'parent',
+        'start',
+        'duration',
+        'counters',
+        '_stack',
+        '_on_exit',
+    )
+
+    def __init__(self, name: str, stack: list, on_exit: Callable = None):
+        self.name = name
+        self.parent: Optional[Span] = stack[-1] if stack else None
+        self.start = 0.0
+        self.duration = 0.0
+        self.counters: dict[str, float] = dict()
+        self._stack = stack
+        self._on_exit = on_exit
+
+    def __enter__(self) -> 'Span':
+        self._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self.start
+        self._stack.pop()
+        if self._on_exit is not None:
+            self._on_exit(self)
+
+    def add(self, counter: str, value: float = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+
+class _NullSpan:
+    """
+    Stand-in for Span while instrumentation is off
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def add(self, counter: str, value: float = 1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profile:
+    """
+    Spans and counters recorded while instrumentation is on.
+    'spans' holds the last 'max_spans' spans opened.
+    """
+
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self.created = time.time()
+        self.origin = time.perf_counter()
+        self.spans: collections.deque[Span] = collections.deque(
+            maxlen=max_spans
+        )
+        self.num_spans = 0
+        # counters added outside of any span
+        self.counters: dict[str, float] = dict()
+        # name: calls, total, min and max seconds and counters of its spans
+        self.__summary: dict[str, dict] = dict()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __stack(self) -> list:
+        stack = getattr(self.__local, 'stack', None)
+        if stack is None:
+            stack = self.__local.stack = list()
+        return stack
+
+    def span(self, name: str) -> Span:
+        span = Span(name, self.__stack(), self.__record)
+        self.spans.append(span)
+        self.num_spans += 1
+        return span
+
+    def __record(self, span: Span):
+        with self.__lock:
+            stage = self.__summary.get(span.name)
+            if stage is None:
+                stage = self.__summary[span.name] = {
+                    'calls': 0,
+                    'total': 0.0,
+                    'min': span.duration,
+                    'max': span.duration,
+                    'counters': dict(),
+                }
+            stage['calls'] += 1
+            stage['total'] += span.duration
+            stage['min'] = min(stage['min'], span.duration)
+            stage['max'] = max(stage['max'], span.duration)
+            counters = stage['counters']
+            for counter, value in span.counters.items():
+                counters[counter] = counters.get(counter, 0) + value
+
+    def count(self, counter: str, value: float = 1):
+        stack = self.__stack()
+        if stack:
+            stack[-1].add(counter, value)
+        else:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Calls, total, minimum and maximum seconds, and summed counters
+        of the finished spans of each name, including the ones no
+        longer kept in 'spans'
+        """
+        with self.__lock:
+            return {
+                name: dict(stage, counters=dict(stage['counters']))
+                for name, stage in self.__summary.items()
+            }
+
+    def to_dict(self) -> dict:
+        ids = {id(span): idx for idx, span in enumerate(self.spans)}
+        return {
+            'created': self.created,
+            'summary': self.summary(),
+            'counters': dict(self.counters),
+            'dropped_spans': self.num_spans - len(self.spans),
+            'spans': [
+                {
+                    'id': idx,
+                    'parent': None
+                    if span.parent is None
+                    else ids.get(id(span.parent)),
+                    'name': span.name,
+                    'start': span.start - self.origin,
+                    'duration': span.duration,
+                    'counters': span.counters,
+                }
+                for idx, span in enumerate(self.spans)
+            ],
+        }
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def save(self, path: str):
+        with open(path, 'w') as file:
+            file.write(self.to_json(indent=2))
+
+
+_profile: Optional[Profile] = None
+
+
+def enabled() -> bool:
+    return _profile is not None
+
+
+def span(name: str):
+    """
+    Context manager timing a stage, e.g.
+        with span('market.parse_floats') as stage:
+            ...
+            stage.add('rows', len(rows))
+    """
+    if _profile is None:
+        return _NULL_SPAN
+    return _profile.span(name)
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorator timing every call of a function as a span
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return function(*args, **kwargs)
+            with _profile.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(counter: str, value: float = 1):
+    """
+    Adds to a counter of the innermost open span
+    """
+    if _profile is not None:
+        _profile.count(counter, value)
+
+
+@contextmanager
+def profile() -> Iterator[Profile]:
+    """
+    Records what runs inside the block into a new Profile.
+    The profile recording before (if any) resumes afterwards.
+    """
+    global _profile
+    previous, _profile = _profile, Profile()
+    try:
+        yield _profile
+    finally:
+        _profile = previous
+
+
+def _report_at_exit(target: str, recorded: Profile):
+    if target.lower() in ('1', 'true', 'yes'):
+        print(recorded.to_json(indent=2), file=sys.stderr)
+    else:
+        recorded.save(target)
+
+
+if os.environ.get(ENV_VAR, '').lower() not in ('', '0', 'false', 'no'):
+    _profile = Profile()
+    atexit.register(_report_at_exit, os.environ[ENV_VAR], _profile)
@@ -0,0 +1,292 @@
+"""
+Bulk export of computed markets to csv, JSON lines and a columnar
+binary format
+"""
+
+import csv
+import json
+import os
+import struct
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+from brfundamentus.models.market_history import MarketHistory, DateLike
+from brfundamentus.models.market_store import INDICATORS, INTEGER_INDICATORS
+from brfundamentus.models.stock import Stock
+from brfundamentus.models.stock_market import StockMarket
+
+CHUNK_SIZE = 65536
+BUFFER_SIZE = 1 << 20
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.brfc': 'columnar',
+}
+
+# columnar layout: MAGIC, then a header (uint32 length and JSON with the
+# names of the 'strings' and 'floats' columns), then row groups, each a
+# uint32 number of rows, every string column as a uint32 length and its
+# values joined by newlines in utf-8, and every float column as float64
+# little endian. A group of 0 rows ends the file.
+MAGIC = b'BRFCOL\x00\x01'
+_UINT32 = struct.Struct('<I')
+
+
+def _format_column(
+    values: np.ndarray, integer: bool, missing: str, finite: bool = False
+) -> list[str]:
+    """
+    Text of the values of a column, 'missing' for NaN (and for
+    infinities, if 'finite')
+    """
+    if integer:
+        return [
+            missing if value != value else str(int(value))
+            for value in values.tolist()
+        ]
+    if finite:
+        return [
+            repr(value) if abs(value) < float('inf') else missing
+            for value in values.tolist()
+        ]
+    return [
+        missing if value != value else repr(value)
+        for value in values.tolist()
+    ]
+
+
+class _CsvWriter:
+    def __init__(self, file, string_fields: list[str]):
+        self.writer = csv.writer(file)
+        self.writer.writerow(string_fields + INDICATORS)
+
+    def write(self, strings: list[list[str]], matrix: np.ndarray):
+        columns = strings + [
+            _format_column(values, parameter in INTEGER_INDICATORS, '')
+            for parameter, values in zip(INDICATORS, matrix)
+        ]
+        self.writer.writerows(zip(*columns))
+
+    def close(self):
+        pass
+
+
+class _JsonLinesWriter:
+    def __init__(self, file, string_fields: list[str]):
+        self.file = file
+        fields = string_fields + INDICATORS
+        self.template = (
+            '{'
+            + ', '.join(f'{json.dumps(name)}: %s' for name in fields)
+            + '}\n'
+        )
+
+    def write(self, strings: list[list[str]], matrix: np.ndarray):
+        columns = [
+            [json.dumps(value) for value in column] for column in strings
+        ] + [
+            _format_column(
+                values, parameter in INTEGER_INDICATORS, 'null', finite=True
+            )
+            for parameter, values in zip(INDICATORS, matrix)
+        ]
+        template = self.template
+        self.file.writelines(template % row for row in zip(*columns))
+
+    def close(self):
+        pass
+
+
+class _ColumnarWriter:
+    def __init__(self, file, string_fields: list[str]):
+        self.file = file
+        header = json.dumps(
+            {'strings': string_fields, 'floats': INDICATORS}
+        ).encode()
+        file.write(MAGIC + _UINT32.pack(len(header)) + header)
+
+    def write(self, strings: list[list[str]], matrix: np.ndarray):
+        num_rows = matrix.shape[1]
+        if num_rows == 0:
+            return
+        self.file.write(_UINT32.pack(num_rows))
+        for column in strings:
+            encoded = '\n'.join(column).encode()
+            self.file.write(_UINT32.pack(len(encoded)) + encoded)
+        self.file.write(np.ascontiguousarray(matrix, dtype='<f8').tobytes())
+
+    def close(self):
+        self.file.write(_UINT32.pack(0))
+
+
+_WRITERS = {
+    'csv': _CsvWriter,
+    'jsonl': _JsonLinesWriter,
+    'columnar': _ColumnarWriter,
+}
+
+
+def _export_format(path: str, fmt: Optional[str]) -> str:
+    if fmt is None:
+        fmt = EXTENSIONS.get(os.path.splitext(os.fspath(path))[1].lower())
+        if fmt is None:
+            raise ValueError(
+                f'Cannot tell the format of {path}, expected one of '
+                f'the extensions {list(EXTENSIONS)} or a format'
+            )
+    if fmt not in _WRITERS:
+        raise ValueError(
+            f'Unknown format {fmt!r}, expected one of {list(_WRITERS)}'
+        )
+
+    return fmt
+
+
+def _export(
+    path: str,
+    fmt: Optional[str],
+    string_fields: list[str],
+    chunks: Iterable[tuple[list[list[str]], np.ndarray]],
+) -> int:
+    """
+    Streams chunks of rows, as string columns and an indicator x row
+    matrix, into a file. Returns the number of rows written.
+    """
+    fmt = _export_format(path, fmt)
+    num_rows = 0
+    if fmt == 'columnar':
+        file = open(path, 'wb', buffering=BUFFER_SIZE)
+    else:
+        file = open(
+            path, 'w', buffering=BUFFER_SIZE, encoding='utf-8', newline=''
+        )
+    with file:
+        writer = _WRITERS[fmt](file, string_fields)
+        for strings, matrix in chunks:
+            writer.write(strings, matrix)
+            num_rows += matrix.shape[1]
+        writer.close()
+
+    return num_rows
+
+
+def export_market(
+    market: StockMarket,
+    path: str,
+    fmt: str = None,
+    stocks: Iterable[Union[Stock, str]] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """
+    Writes the stocks of a market, with every indicator, fair price,
+    valuation and the Greenblatt rank, to a file in one of the formats:
+        - 'csv': comma separated, dot as decimal separator,
+                 empty fields for missing values.
+        - 'jsonl': a JSON object per line, null for missing values.
+        - 'columnar': binary, see MAGIC and read_columnar.
+    The format is told by the extension of 'path' (see EXTENSIONS)
+    if not given. 'stocks' limits the export to some stocks (or tickers),
+    e.g. the result of a screen, in their order; by default all stocks
+    are written, in the order of the market. Rows are formatted and
+    written 'chunk_size' at a time. Returns the number of rows written.
+    """
+    store = market.store
+    store.refresh_greenblatt_rank()
+    if stocks is None:
+        positions = np.arange(len(store))
+    else:
+        positions = list()
+        for stock in stocks:
+            ticker = stock if isinstance(stock, str) else stock.ticker
+            position = store.get_position(ticker)
+            if position is None:
+                raise KeyError(f'Ticker {ticker} is not listed')
+            positions.append(position)
+        positions = np.array(positions, dtype=np.int64)
+
+    def chunks():
+        for start in range(0, len(positions), chunk_size):
+            chunk = positions[start : start + chunk_size]
+            yield [store.tickers[chunk].tolist()], np.stack(
+                [store.columns[parameter][chunk] for parameter in INDICATORS]
+            )
+
+    return _export(path, fmt, ['ticker'], chunks())
+
+
+def export_history(
+    history: MarketHistory,
+    path: str,
+    fmt: str = None,
+    start: DateLike = None,
+    end: DateLike = None,
+) -> int:
+    """
+    Writes every snapshot of a MarketHistory between 'start' and 'end',
+    one row per stock and date, with a 'date' column in ISO format before
+    the columns of export_market. Snapshots are written one at a time,
+    so the whole history is never held in memory.
+    Returns the number of rows written.
+    """
+
+    def chunks():
+        for date, tickers, matrix in history.iter_snapshots(start, end):
+            yield [[date.isoformat()] * len(tickers), tickers.tolist()], matrix
+
+    return _export(path, fmt, ['date', 'ticker'], chunks())
+
+
+def _read_header(file, path: str) -> dict:
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'{path} is not a columnar export')
+    (length,) = _UINT32.unpack(file.read(_UINT32.size))
+
+    return json.loads(file.read(length))
+
+
+def read_columnar(path: str) -> Iterator[tuple[dict, dict]]:
+    """
+    Yields the row groups of a columnar file, as a dictionary of the
+    string columns (lists) and one of the float columns (arrays, with
+    NaN for missing values)
+    """
+    with open(path, 'rb', buffering=BUFFER_SIZE) as file:
+        header = _read_header(file, path)
+        num_floats = len(header['floats'])
+        while True:
+            (num_rows,) = _UINT32.unpack(file.read(_UINT32.size))
+            if num_rows == 0:
+                return
+            strings = dict()
+            for name in header['strings']:
+                (length,) = _UINT32.unpack(file.read(_UINT32.size))
+                strings[name] = file.read(length).decode().split('\n')
+            matrix = np.frombuffer(
+                file.read(8 * num_rows * num_floats), dtype='<f8'
+            ).reshape(num_floats, num_rows)
+            yield strings, dict(zip(header['floats'], matrix))
+
+
+def load_columnar(path: str) -> tuple[dict, dict]:
+    """
+    Whole content of a columnar file, see read_columnar.
+    A market export loads back as MarketStore(strings['ticker'], floats).
+    """
+    with open(path, 'rb') as file:
+        header = _read_header(file, path)
+    groups = list(read_columnar(path))
+
+    strings = {
+        name: [value for group, _ in groups for value in group[name]]
+        for name in header['strings']
+    }
+    floats = {
+        name: np.concatenate(
+            [group[name] for _, group in groups] or [np.empty(0)]
+        )
+        for name in header['floats']
+    }
+
+    return strings, floats
@@ -0,0 +1,165 @@
+"""
+Bounded cache of query results, dropped when the data they came from changes
+"""
+
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class QueryCache:
+    """
+    LRU cache of query results tagged with the state of the data they
+    were computed on. The first lookup under a different state (e.g. a
+    new version of a MarketStore) empties the cache.
+    With maxsize=0 nothing is cached.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        if maxsize < 0:
+            raise ValueError('maxsize must not be negative')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.__entries: OrderedDict = OrderedDict()
+        self.__state = None
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __sync(self, state: Hashable):
+        if state != self.__state:
+            if self.__entries:
+                self.invalidations += 1
+                self.__entries.clear()
+            self.__state = state
+
+    def get(self, key: Hashable, state: Hashable) -> Optional[Any]:
+        """
+        Result cached for 'key' under 'state', None on a miss
+        """
+        self.__sync(state)
+        value = self.__entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def put(self, key: Hashable, state: Hashable, value: Any):
+        if self.maxsize == 0:
+            return
+        self.__sync(state)
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.__entries.clear()
+        self.__state = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'size': len(self),
+            'maxsize': self.maxsize,
+        }
+
+
+def _freeze(value, unordered: bool = False):
+    """
+    Hashable form of a screen: dictionaries and the members of 'all' and
+    'any' groups become frozensets, since their order doesn't change a
+    screen, and other lists become tuples. Booleans are tagged, so that
+    True and 1 (which compile_screen tells apart) get different keys.
+    """
+    if isinstance(value, dict):
+        return frozenset(
+            (key, _freeze(member, key in ('all', 'any')))
+            for key, member in value.items()
+        )
+    if isinstance(value, list):
+        members = (_freeze(member) for member in value)
+        return frozenset(members) if unordered else tuple(members)
+    if isinstance(value, bool):
+        return bool, value
+
+    return value
+
+
+def _canonical_tickers(tickers) -> tuple:
+    """
+    Filter lists of tickers as sorted tuples; empty lists and None
+    both mean no filter
+    """
+    return tuple(sorted(set(tickers))) if tickers else ()
+
+
+def criterion_key(
+    num_stocks: int,
+    parameter: str,
+    cut_criterion: float,
+    reverse_cut: bool,
+    ascending: bool,
+    disconsider: list = None,
+    only_from: list = None,
+) -> Optional[tuple]:
+    """
+    Key of a StockMarket.get_top_stocks_by_criterion query,
+    the same for any order of the tickers.
+    None if the query can't be hashed, so it is never cached.
+    """
+    try:
+        key = (
+            'criterion',
+            num_stocks,
+            parameter,
+            cut_criterion,
+            bool(reverse_cut),
+            bool(ascending),
+            _canonical_tickers(disconsider),
+            _canonical_tickers(only_from),
+        )
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+
+def conditions_key(
+    conditions: list[dict],
+    sort_by: dict,
+    num_stocks: int,
+    disconsider: list = None,
+    only_from: list = None,
+) -> Optional[tuple]:
+    """
+    Key of a StockMarket.get_top_stocks_by_list_of_conditions query,
+    the same for any order of the conditions and of the tickers.
+    None if the query can't be hashed, so it is never cached.
+    """
+    try:
+        key = (
+            'conditions',
+            _freeze(conditions, unordered=True),
+            _freeze(sort_by),
+            num_stocks,
+            _canonical_tickers(disconsider),
+            _canonical_tickers(only_from),
+        )
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
@@ -0,0 +1,66 @@
+"""
+On disk cache of markets computed from statusinvest csv files
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from brfundamentus.models.market_store import MarketStore, INDICATORS
+
+# bump when the way markets are computed changes
+CACHE_VERSION = 2
+
+
+def file_digest(path: str) -> str:
+    """
+    SHA-256 of the content of a file, read in blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def cache_key(path: str, market_risk: float) -> str:
+    """
+    Key of a computed market: the content of the csv file,
+    the market risk and the layout of the cached columns
+    """
+    schema = hashlib.sha256(','.join(INDICATORS).encode()).hexdigest()[:8]
+
+    return (
+        f'{file_digest(path)}-{market_risk!r}-{schema}-v{CACHE_VERSION}'
+    )
+
+
+def load_cached_store(
+    cache_dir: str, key: str, trusted: bool = False
+) -> Optional[MarketStore]:
+    """
+    Memory-maps the store cached under 'key', if there is one
+    """
+    directory = os.path.join(cache_dir, key)
+    if not os.path.isdir(directory):
+        return None
+
+    return MarketStore.load(directory, mmap=True, trusted=trusted)
+
+
+def save_cached_store(cache_dir: str, key: str, store: MarketStore):
+    """
+    Caches a store under 'key'. The store is written to a temporary
+    directory first and then renamed, so readers never see it half written.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        store.save(temp_dir)
+        os.replace(temp_dir, os.path.join(cache_dir, key))
+    except OSError:
+        # another process cached the same key first
+        shutil.rmtree(temp_dir, ignore_errors=True)
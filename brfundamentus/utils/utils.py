@@ -2,6 +2,16 @@
 Utils methods
 """
 
+import re
+
+import numpy as np
+
+from brfundamentus.utils.instrumentation import count, timed
+
+# values with a single dot and no comma, which parse_str_to_float
+# reads with the dot as decimal separator
+SINGLE_DOT_VALUE = re.compile(r'^[^,.\n]*\.[^,.\n]*$', re.MULTILINE)
+
 
 def parse_str_to_float(x: str, d: float = 1):
     try:
@@ -13,6 +23,59 @@ def parse_str_to_float(x: str, d: float = 1):
             return None
 
 
+def parse_column_to_floats(
+    column: list[str], d: float = 1
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parses a whole column of numbers in brazilian format
+    (dot as thousands separator, comma as decimal separator),
+    dividing them by d (e.g. 100 for percentages).
+    Returns an array of floats, with NaN for missing values,
+    and the boolean mask of missing values.
+    Results are the same of parse_str_to_float on every value,
+    but the separators are normalized on the joined column at once
+    instead of through exceptions value by value.
+    """
+    joined = '\n'.join(column)
+    tokens = (
+        ('\n' + joined.replace('.', '').replace(',', '.') + '\n')
+        .replace('\n\n', '\nnan\n')
+        .replace('\n\n', '\nnan\n')[1:-1]
+        .split('\n')
+    )
+
+    if len(tokens) != len(column):
+        # some value has a line break, so lines do not match values
+        values = np.array(
+            [parse_str_to_float(x) for x in column], dtype=float
+        )
+    else:
+        line = 0
+        last_position = 0
+        for match in SINGLE_DOT_VALUE.finditer(joined):
+            line += joined.count('\n', last_position, match.start())
+            last_position = match.start()
+            tokens[line] = match.group()
+
+        try:
+            values = np.array(tokens, dtype=float)
+        except ValueError:
+            values = np.array(
+                [_parse_token(token, x) for token, x in zip(tokens, column)],
+                dtype=float,
+            )
+    values /= d
+
+    return values, np.isnan(values)
+
+
+def _parse_token(token: str, x: str):
+    try:
+        return float(token)
+    except ValueError:
+        return parse_str_to_float(x)
+
+
 def print_list_of_stocks(list_of_stocks: list):
     for stock in list_of_stocks:
         stock.print_valuations()
@@ -27,6 +90,7 @@ def round_value(x, r=4):
         return x
 
 
+@timed('stocks.greenblatt_rank')
 def compute_greenblatt_rank(stocks):
     """
     Computes the greenblatt rank of every stock
@@ -73,3 +137,4 @@ def compute_greenblatt_rank(stocks):
 
     for idx, stock in enumerate(stocks_with_greenblatt_rank):
         stock.greenblatt_rank = idx + 1
+    count('stocks', len(stocks))
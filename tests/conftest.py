@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from brfundamentus.builders.stock_builder import build_list_of_stocks
+from brfundamentus.models.stock import Stock
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.csv_reader import read_csv
+from brfundamentus.utils.utils import compute_greenblatt_rank
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MARKET_CSV = os.path.join(ROOT, 'statusinvest-busca-avancada-exemplo.csv')
+PORTFOLIO_CSV = os.path.join(ROOT, 'portfolio_example.csv')
+TRADEMAP_CSV = os.path.join(ROOT, 'transacoes_examplo.csv')
+
+
+@pytest.fixture(scope='session')
+def market_csv() -> str:
+    return MARKET_CSV
+
+
+@pytest.fixture(scope='session')
+def portfolio_csv() -> str:
+    return PORTFOLIO_CSV
+
+
+@pytest.fixture(scope='session')
+def trademap_csv() -> str:
+    return TRADEMAP_CSV
+
+
+@pytest.fixture
+def market() -> StockMarket:
+    return StockMarket.read_from_csv(MARKET_CSV)
+
+
+def build_reference_stocks(path: str, market_risk: float = 0.15) -> list:
+    """
+    Stocks of a statusinvest csv file built one row at a time, by
+    build_single_stock, and ranked by utils.compute_greenblatt_rank:
+    the per-row path the columnar market must match
+    """
+    headers, rows = read_csv(path, ';')
+    stocks = build_list_of_stocks(rows, headers, market_risk)
+    compute_greenblatt_rank(stocks)
+
+    return stocks
+
+
+@pytest.fixture(scope='session')
+def reference_stocks() -> list[Stock]:
+    return build_reference_stocks(MARKET_CSV)
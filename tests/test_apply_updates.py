@@ -0,0 +1,128 @@
+import pytest
+
+from brfundamentus.builders.stock_builder import build_single_stock
+from brfundamentus.models.stock import STOCK_FIELDS
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.csv_reader import header_positions
+from brfundamentus.utils.utils import parse_str_to_float
+
+from conftest import MARKET_CSV
+
+# rows of the example file that change, and new tickers added
+CHANGED = {'ITSA4': 1.5, 'BBAS3': 0.8, 'VALE3': 1.1, 'AALR3': 0.5}
+ADDED = {'NEWS3': 'ITSA4', 'NEWS4': 'TAEE11'}
+
+
+def _lines() -> list[str]:
+    with open(MARKET_CSV) as file:
+        return file.readlines()
+
+
+def _scaled(field: str, factor: float) -> str:
+    value = parse_str_to_float(field)
+    return field if value is None else repr(value * factor)
+
+
+def _changed_line(line: str, factor: float, ticker: str = None) -> str:
+    fields = line.rstrip('\n').split(';')
+    if ticker is not None:
+        fields[0] = ticker
+    # the price and EV/EBIT, so the ranking changes too
+    for idx in (1, 10):
+        fields[idx] = _scaled(fields[idx], factor)
+    return ';'.join(fields) + '\n'
+
+
+def _updates() -> tuple[list[str], list[str]]:
+    """
+    Lines of the updates csv, and lines of the whole file after them
+    """
+    header, *lines = _lines()
+    rows = {line.split(';')[0]: line for line in lines}
+    changed = [_changed_line(rows[t], f) for t, f in CHANGED.items()]
+    added = [_changed_line(rows[s], 1, t) for t, s in ADDED.items()]
+    replaced = dict(zip(CHANGED, changed))
+
+    updated = [replaced.get(line.split(';')[0], line) for line in lines]
+    return [header] + changed + added, [header] + updated + added
+
+
+def _fields(stocks) -> list[tuple]:
+    return [
+        tuple(getattr(stock, name) for name in STOCK_FIELDS)
+        for stock in stocks
+    ]
+
+
+@pytest.mark.parametrize('trusted', [False, True])
+def test_row_updates_equal_a_fresh_read(trusted):
+    updates, updated_file = _updates()
+    market = StockMarket.read_from_csv(MARKET_CSV, trusted=trusted)
+
+    def top(market: StockMarket) -> list:
+        return market.get_top_stocks_by_criterion(
+            10, 'ev_per_ebit', 0, ascending=True
+        )
+
+    # stocks built and indexes sorted before the updates are patched
+    market.stocks
+    top(market)
+
+    tickers = market.apply_updates(updates)
+    fresh = StockMarket.read_from_csv(updated_file, trusted=trusted)
+
+    assert tickers == list(CHANGED) + list(ADDED)
+    assert _fields(market.stocks) == _fields(fresh.stocks)
+    assert _fields(top(market)) == _fields(top(fresh))
+
+
+def test_price_ticks_keep_the_fundamentals(market):
+    header, *lines = _lines()
+    positions = header_positions(header.rstrip('\n').split(';'))
+    rows = {line.split(';')[0]: line.rstrip('\n').split(';') for line in lines}
+    before = {t: market.get_stock_by_ticker(t) for t in CHANGED}
+    prices = {t: before[t].price * f for t, f in CHANGED.items()}
+    ranks = [stock.greenblatt_rank for stock in market.stocks]
+
+    tickers = market.apply_updates(prices=dict(prices, XXXX3=10.0, ITUB4=0))
+
+    assert tickers == list(CHANGED)
+    assert [stock.greenblatt_rank for stock in market.stocks] == ranks
+    for ticker, factor in CHANGED.items():
+        # the same row with the price, its multiples and the yield rescaled
+        row = list(rows[ticker])
+        for name, scale in [
+            ('PRECO', factor),
+            ('P/L', factor),
+            ('P/VP', factor),
+            ('VALOR DE MERCADO', factor),
+            ('DY', 1 / factor),
+        ]:
+            row[positions[name]] = _scaled(row[positions[name]], scale)
+        expected = build_single_stock(row, positions, market.market_risk)
+        stock = market.get_stock_by_ticker(ticker)
+        for name in STOCK_FIELDS:
+            if name == 'greenblatt_rank':
+                continue
+            value, reference = getattr(stock, name), getattr(expected, name)
+            if reference is None:
+                assert value is None, name
+            else:
+                assert value == pytest.approx(reference, rel=1e-9), name
+
+
+def test_price_ticks_from_csv_equal_price_ticks(market):
+    ticks = StockMarket.read_from_csv(MARKET_CSV)
+    prices = {'ITSA4': 9.5, 'BBAS3': 30.25}
+
+    market.apply_updates(prices=prices)
+    ticks.apply_updates(
+        ['TICKER;PRECO\n', 'ITSA4;9,50\n', 'BBAS3;30,25\n']
+    )
+
+    assert _fields(ticks.stocks) == _fields(market.stocks)
+
+
+def test_updates_without_the_known_headers_are_rejected(market):
+    with pytest.raises(ValueError):
+        market.apply_updates(['TICKER;DY\n', 'ITSA4;1,0\n'])
@@ -0,0 +1,140 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from brfundamentus.models.backtest import Backtester, rebalance_rows
+from brfundamentus.models.market_history import MarketHistory
+from brfundamentus.utils.utils import parse_str_to_float
+
+DATES = [
+    datetime.date(2021, 1, 4),
+    datetime.date(2021, 1, 18),
+    datetime.date(2021, 2, 1),
+    datetime.date(2021, 2, 15),
+    datetime.date(2021, 3, 1),
+    datetime.date(2021, 3, 15),
+    datetime.date(2021, 4, 1),
+    datetime.date(2021, 4, 15),
+]
+CONDITIONS = [
+    {'parameter': 'dy', 'cut_criterion': 0.04, 'reverse_cut': False},
+    {
+        'parameter': 'price_per_profit',
+        'cut_criterion': 0,
+        'reverse_cut': False,
+    },
+    {
+        'any': [
+            {'parameter': 'roe', 'cut_criterion': 0.1, 'reverse_cut': False},
+            {'parameter': 'roic', 'cut_criterion': 0.1, 'reverse_cut': False},
+        ]
+    },
+]
+SORT_BY = {'parameter': 'dy', 'ascending': False}
+
+
+def _random_walk(lines: list[str], rng: np.random.Generator) -> list[str]:
+    """
+    Next snapshot: prices and yields moved, a few stocks missing
+    """
+    walked = list()
+    for line in lines:
+        fields = line.rstrip('\n').split(';')
+        for idx in (1, 2):
+            value = parse_str_to_float(fields[idx])
+            if value is not None:
+                value *= rng.lognormal(0, 0.1)
+                fields[idx] = f'{value:.2f}'.replace('.', ',')
+        walked.append(';'.join(fields) + '\n')
+
+    return walked
+
+
+@pytest.fixture(scope='module')
+def history(tmp_path_factory, market_csv) -> MarketHistory:
+    snapshots = tmp_path_factory.mktemp('snapshots')
+    rng = np.random.default_rng(0)
+    with open(market_csv, encoding='utf-8') as file:
+        header, *lines = file.readlines()
+    for date in DATES:
+        lines = _random_walk(lines, rng)
+        kept = [line for line in lines if rng.random() > 0.05]
+        path = snapshots / f'statusinvest-{date.isoformat()}.csv'
+        path.write_text(header + ''.join(kept), encoding='utf-8')
+
+    history = MarketHistory(str(tmp_path_factory.mktemp('history')))
+    history.ingest(str(snapshots))
+
+    return history
+
+
+def _naive_backtest(history, num_stocks: int, rebalance_dates) -> tuple:
+    """
+    Day by day replay: screens every rebalance date with StockMarket,
+    buys equal weights and values the holdings at the last known prices
+    """
+    last_price = dict()
+    holdings, bought, basis = [], dict(), 1.0
+    values, all_holdings, turnover = list(), list(), list()
+    for date in history.dates:
+        market = history.market_as_of(date)
+        for stock in market.stocks:
+            last_price[stock.ticker] = stock.price
+        growths = [last_price[t] / bought[t] for t in holdings]
+        value = basis * (np.mean(growths) if holdings else 1.0)
+        values.append(value)
+        if date not in rebalance_dates:
+            continue
+
+        drifted = {
+            t: growth / len(holdings) * basis / value
+            for t, growth in zip(holdings, growths)
+        }
+        basis = value
+        holdings = [
+            stock.ticker
+            for stock in market.get_top_stocks_by_list_of_conditions(
+                CONDITIONS, SORT_BY, num_stocks
+            )
+        ]
+        bought = {t: last_price[t] for t in holdings}
+        weights = {t: 1 / len(holdings) for t in holdings}
+        changes = sum(
+            abs(weights.get(t, 0) - drifted.get(t, 0))
+            for t in set(weights) | set(drifted)
+        )
+        cash = 1 - sum(weights.values())
+        drifted_cash = 1 - sum(drifted.values())
+        turnover.append(0.5 * (changes + abs(cash - drifted_cash)))
+        all_holdings.append(holdings)
+
+    return np.array(values), all_holdings, np.array(turnover)
+
+
+@pytest.mark.parametrize('rebalance', ['monthly', 2, 1])
+@pytest.mark.parametrize('num_stocks', [5, 30])
+def test_backtest_matches_a_naive_replay(history, rebalance, num_stocks):
+    result = Backtester(history).run(
+        CONDITIONS, SORT_BY, num_stocks, rebalance
+    )
+    values, holdings, turnover = _naive_backtest(
+        history, num_stocks, set(result.rebalance_dates)
+    )
+
+    assert result.dates == DATES
+    assert result.holdings == holdings
+    np.testing.assert_allclose(result.values, values, rtol=1e-12)
+    np.testing.assert_allclose(result.turnover, turnover, atol=1e-12)
+
+
+def test_rebalance_rows():
+    np.testing.assert_array_equal(
+        rebalance_rows(DATES, 'monthly'), [0, 2, 4, 6]
+    )
+    np.testing.assert_array_equal(rebalance_rows(DATES, 3), [0, 3, 6])
+    np.testing.assert_array_equal(rebalance_rows(DATES, 'yearly'), [0])
+    with pytest.raises(ValueError):
+        rebalance_rows(DATES, 0)
+    with pytest.raises(ValueError):
+        rebalance_rows(DATES, 'daily')
@@ -0,0 +1,62 @@
+from brfundamentus.benchmarks.pipeline import (
+    compare,
+    generate_data,
+    run_benchmarks,
+)
+from brfundamentus.benchmarks.synthetic_data import (
+    format_pt_br,
+    synthetic_tickers,
+)
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.stock_market import StockMarket
+
+
+def test_format_pt_br():
+    assert format_pt_br(1234567.891) == '1.234.567,89'
+    assert format_pt_br(-0.5) == '-0,50'
+    assert format_pt_br(float('nan')) == ''
+
+
+def test_synthetic_tickers_are_distinct():
+    tickers = synthetic_tickers(5000, seed=1)
+    assert len(set(tickers)) == 5000
+    assert tickers == synthetic_tickers(5000, seed=1)
+
+
+def test_generated_files_load(tmp_path):
+    paths = generate_data(
+        str(tmp_path), num_rows=2000, num_operations=500, num_positions=20
+    )
+    market = StockMarket.read_from_csv(paths['market'])
+    # as many rows are dropped as in the sample file
+    assert len(market.stocks) > 1600
+
+    portfolio = Portfolio.read_from_cvs(paths['portfolio'], market)
+    assert len(portfolio.shares) == 20
+    trademap = Portfolio.read_from_trademap_csv(paths['trademap'], market)
+    assert all(share.quantity > 0 for share in trademap.shares)
+
+
+def test_every_stage_is_timed(tmp_path):
+    paths = generate_data(
+        str(tmp_path), num_rows=500, num_operations=100, num_positions=10
+    )
+    results = run_benchmarks(paths, repeat=1)
+
+    assert 'Portfolio aggregation' in results['stages']
+    assert all(
+        timing['min'] > 0 and timing['repeat'] == 1
+        for timing in results['stages'].values()
+    )
+
+
+def test_compare_flags_slower_stages():
+    baseline = {'stages': {'a': {'min': 1.0}, 'b': {'min': 1.0}}}
+    current = {
+        'stages': {'a': {'min': 1.5}, 'b': {'min': 0.5}, 'c': {'min': 1.0}}
+    }
+    report = {
+        row['stage']: row['status'] for row in compare(baseline, current)
+    }
+
+    assert report == {'a': 'slower', 'b': 'faster'}
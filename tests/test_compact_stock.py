@@ -0,0 +1,169 @@
+import numpy as np
+from pydantic import ValidationError
+
+from brfundamentus.models.market_store import INDICATORS, MarketStore
+from brfundamentus.models.stock import STOCK_FIELDS, CompactStock, Stock
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.instrumentation import profile
+
+# position: (indicator, value) making the row invalid for Stock
+INVALID_VALUES = {
+    0: ('price', np.nan),
+    3: ('price', 0.0),
+    4: ('price', -1.0),
+    7: ('roe', np.nan),
+    9: ('price_per_profit', np.nan),
+    12: ('greenblatt_rank', 0.0),
+    15: ('greenblatt_rank', -3.0),
+}
+
+
+def _fields(stock) -> tuple:
+    return tuple(getattr(stock, name) for name in STOCK_FIELDS)
+
+
+def _clean_csv(path: str, directory) -> str:
+    """
+    Copy of a statusinvest csv without the rows validation drops
+    """
+    rejected = {
+        entry['ticker'] for entry in StockMarket.read_from_csv(path).rejections
+    }
+    with open(path) as file:
+        header, *lines = file.readlines()
+    clean_path = str(directory / 'clean.csv')
+    with open(clean_path, 'w') as file:
+        file.write(header)
+        file.writelines(
+            line for line in lines if line.split(';')[0] not in rejected
+        )
+
+    return clean_path
+
+
+def test_trusted_stocks_equal_validated_stocks(market_csv, tmp_path, capsys):
+    path = _clean_csv(market_csv, tmp_path)
+    stocks = StockMarket.read_from_csv(path).stocks
+    compact = StockMarket.read_from_csv(path, trusted=True).stocks
+
+    assert all(isinstance(stock, CompactStock) for stock in compact)
+    assert [_fields(stock) for stock in compact] == [
+        _fields(stock) for stock in stocks
+    ]
+    assert [repr(stock) for stock in compact] == [
+        repr(stock) for stock in stocks
+    ]
+
+    for stock in stocks[:20]:
+        stock.print_valuations()
+    expected = capsys.readouterr().out
+    for stock in compact[:20]:
+        stock.print_valuations()
+    assert capsys.readouterr().out == expected
+
+
+def test_from_row_equals_keyword_construction(market):
+    stock = market.stocks[0]
+    compact = CompactStock.from_row(_fields(stock))
+
+    assert compact == CompactStock(**dict(zip(STOCK_FIELDS, _fields(stock))))
+    assert _fields(compact) == _fields(stock)
+
+
+def test_trusted_stocks_notify_price_watchers(market_csv):
+    stock = StockMarket.read_from_csv(market_csv, trusted=True).stocks[0]
+    changes = list()
+
+    def watcher(changed, old, new):
+        changes.append((changed, old, new))
+
+    stock.watch_price(watcher)
+    old = stock.price
+    stock.set_price(old + 1)
+
+    assert changes == [(stock, old, old + 1)]
+
+
+def _invalid_store(market: StockMarket) -> MarketStore:
+    store = market.store
+    columns = {
+        parameter: values.copy() for parameter, values in store.columns.items()
+    }
+    for idx, (parameter, value) in INVALID_VALUES.items():
+        columns[parameter][idx] = value
+
+    return MarketStore(store.tickers.copy(), columns)
+
+
+def test_validate_drops_the_rows_stock_rejects(market):
+    store = _invalid_store(market)
+    rejected = list()
+    for idx in range(len(store)):
+        row = {
+            parameter: store.get_value(idx, parameter)
+            for parameter in INDICATORS
+        }
+        try:
+            Stock(ticker=store.tickers[idx], **row)
+        except ValidationError:
+            rejected.append(store.tickers[idx])
+
+    valid, report = store.validate()
+
+    assert [entry['ticker'] for entry in report] == rejected
+    assert len(rejected) == len(INVALID_VALUES)
+    assert list(valid.tickers) == [
+        ticker for ticker in store.tickers if ticker not in rejected
+    ]
+    assert valid.get_stocks() == [
+        market.store.build_stock(market.store.get_position(ticker))
+        for ticker in valid.tickers
+    ]
+
+
+def test_validate_report_gives_the_reasons(market):
+    store = _invalid_store(market)
+    store.columns['greenblatt_rank'][20] = 2.5
+    store.columns['price'][21] = np.nan
+    store.columns['roe'][21] = np.nan
+
+    _, report = store.validate()
+    reasons = {entry['ticker']: entry['reasons'] for entry in report}
+
+    assert reasons[store.tickers[20]] == [
+        'greenblatt_rank: value must be an integer'
+    ]
+    assert sorted(reasons[store.tickers[21]]) == [
+        'price: value is missing',
+        'roe: value is missing',
+    ]
+
+
+def test_valid_store_is_kept_whole(market):
+    valid, report = market.store.validate()
+
+    assert report == []
+    assert list(valid.tickers) == list(market.store.tickers)
+
+
+def test_market_keeps_the_rejections(market_csv):
+    with open(market_csv) as file:
+        tickers = [line.split(';')[0] for line in file.readlines()[1:]]
+    market = StockMarket.read_from_csv(market_csv)
+    rejected = [entry['ticker'] for entry in market.rejections]
+
+    assert rejected
+    assert len(market.stocks) + len(rejected) == len(tickers)
+    assert all(entry['reasons'] for entry in market.rejections)
+    assert set(rejected).isdisjoint(market.store.tickers)
+
+
+def test_trusted_read_skips_validation(market_csv):
+    with open(market_csv) as file:
+        num_rows = len(file.readlines()) - 1
+    with profile() as recorded:
+        market = StockMarket.read_from_csv(market_csv, trusted=True)
+
+    assert len(market.store) == num_rows
+    assert market.rejections == []
+    assert 'market.validation' not in recorded.summary()
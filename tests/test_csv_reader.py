@@ -0,0 +1,89 @@
+import io
+
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.csv_reader import (
+    header_positions,
+    iter_chunks,
+    read_csv,
+)
+
+
+def _lines(path: str) -> list[str]:
+    with open(path) as file:
+        return file.readlines()
+
+
+def test_rows_match_split_lines(market_csv):
+    lines = _lines(market_csv)
+    headers, rows = read_csv(market_csv, ';')
+
+    assert headers == lines[0].rstrip('\n').split(';')
+    assert list(rows) == [
+        line.rstrip('\n').split(';') for line in lines[1:] if line.strip()
+    ]
+
+
+def test_market_from_path_file_or_lines(market_csv):
+    expected = StockMarket.read_from_csv(market_csv).stocks
+
+    with open(market_csv, newline='') as file:
+        assert StockMarket.read_from_csv(file).stocks == expected
+    assert StockMarket.read_from_csv(_lines(market_csv)).stocks == expected
+
+
+def test_portfolio_from_path_or_lines(market, portfolio_csv):
+    expected = Portfolio.read_from_cvs(portfolio_csv, market)
+    portfolio = Portfolio.read_from_cvs(_lines(portfolio_csv), market)
+
+    assert [
+        (share.stock.ticker, share.mean_price, share.quantity)
+        for share in portfolio.shares
+    ] == [
+        (share.stock.ticker, share.mean_price, share.quantity)
+        for share in expected.shares
+    ]
+
+
+def test_concatenated_exports_read_as_one(market_csv):
+    lines = _lines(market_csv)
+    headers, rows = read_csv(lines + ['\n'] + lines, ';')
+
+    assert list(rows) == 2 * list(read_csv(lines, ';')[1])
+
+
+def test_quoted_fields_and_byte_order_mark(tmp_path):
+    path = tmp_path / 'quoted.csv'
+    path.write_text('\ufeffTICKER;NAME\nABCD3;"A;B"\n', encoding='utf-8')
+
+    headers, rows = read_csv(str(path), ';')
+
+    assert headers == ['TICKER', 'NAME']
+    assert list(rows) == [['ABCD3', 'A;B']]
+    assert list(read_csv(io.StringIO('A;B\n1;2\n'), ';')[1]) == [['1', '2']]
+
+
+def test_encoding(tmp_path):
+    path = tmp_path / 'latin.csv'
+    path.write_text('TICKER;NOME\nABCD3;Ação\n', encoding='latin-1')
+
+    headers, rows = read_csv(str(path), ';', encoding='latin-1')
+
+    assert headers == ['TICKER', 'NOME']
+    assert list(rows) == [['ABCD3', 'Ação']]
+
+
+def test_header_positions():
+    headers = [' Ticker', 'preco ', 'DY\n']
+
+    assert header_positions(headers) == {'Ticker': 0, 'preco': 1, 'DY': 2}
+    assert header_positions(headers, upper=True) == {
+        'TICKER': 0,
+        'PRECO': 1,
+        'DY': 2,
+    }
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_chunks([], 2)) == []
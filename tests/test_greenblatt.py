@@ -0,0 +1,70 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+from brfundamentus.models.greenblatt import GreenblattRanking
+from brfundamentus.utils.utils import compute_greenblatt_rank
+
+# includes ties, zeros, negatives and missing values, which are unranked
+VALUES = [None, -1.0, 0.0, 0.05, 0.1, 0.1, 3.5, 8.0, 8.0, 20.0]
+
+
+def _reference_ranks(stocks) -> list:
+    """
+    Greenblatt ranks of the stocks recomputed from scratch,
+    stock by stock, on copies of the stocks
+    """
+    copies = [
+        dataclasses.replace(stock, greenblatt_rank=None) for stock in stocks
+    ]
+    compute_greenblatt_rank(copies)
+
+    return [stock.greenblatt_rank for stock in copies]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_incremental_rank_equals_a_full_recompute(market, seed):
+    rng = random.Random(seed)
+    tickers = [stock.ticker for stock in market.stocks]
+    # some stocks are built before the updates, some after
+    built = market.stocks[:50]
+
+    for step in range(60):
+        ticker = rng.choice(tickers)
+        parameter = rng.choice(['ev_per_ebit', 'roic'])
+        market.update_indicators(ticker, **{parameter: rng.choice(VALUES)})
+        if step % 10 == 9:
+            stocks = market.stocks
+            expected = _reference_ranks(stocks)
+            assert [stock.greenblatt_rank for stock in stocks] == expected
+            assert [market.get_greenblatt_rank(t) for t in tickers] == (
+                expected
+            )
+
+    assert built == market.stocks[:50]
+
+
+def test_full_recompute_after_updates(market):
+    for ticker in ['ITSA4', 'BBAS3', 'TAEE11']:
+        market.update_indicators(ticker, ev_per_ebit=1.0, roic=0.9)
+    incremental = [stock.greenblatt_rank for stock in market.stocks]
+
+    market.store.compute_greenblatt_rank()
+
+    assert [stock.greenblatt_rank for stock in market.stocks] == incremental
+    assert incremental == _reference_ranks(market.stocks)
+
+
+def test_ranking_of_new_positions():
+    ev_per_ebit = np.array([5.0, np.nan, 2.0])
+    roic = np.array([0.1, 0.2, 0.3])
+    ranking = GreenblattRanking(ev_per_ebit, roic)
+
+    ranking.update(3, 1.0, 0.5)
+    ranking.update(1, 3.0, 0.2)
+
+    np.testing.assert_array_equal(
+        ranking.greenblatt_ranks(), np.array([4.0, 3.0, 2.0, 1.0])
+    )
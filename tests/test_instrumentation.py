@@ -0,0 +1,43 @@
+import json
+
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils import instrumentation
+from brfundamentus.utils.instrumentation import Profile, profile, span
+
+
+def test_spans_record_stages_and_counters(market_csv):
+    with profile() as recorded:
+        market = StockMarket.read_from_csv(market_csv)
+
+    summary = recorded.summary()
+    assert summary['market.validation']['counters']['rows'] == len(
+        market.stocks
+    ) + summary['market.validation']['counters'].get('rows_dropped', 0)
+    assert not instrumentation.enabled()
+
+    report = json.loads(recorded.to_json())
+    names = {entry['name'] for entry in report['spans']}
+    assert {'market.parse_floats', 'market.validation'} <= names
+
+
+def test_nested_spans_are_children():
+    with profile() as recorded:
+        with span('outer'):
+            with span('inner') as inner:
+                inner.add('rows', 3)
+
+    outer, inner = recorded.to_dict()['spans']
+    assert inner['parent'] == outer['id']
+    assert recorded.summary()['inner']['counters'] == {'rows': 3}
+
+
+def test_old_spans_are_dropped_but_summarized():
+    recorded = Profile(max_spans=10)
+    for _ in range(100):
+        with recorded.span('query') as query:
+            query.add('hits')
+
+    assert len(recorded.spans) == 10
+    assert recorded.summary()['query']['calls'] == 100
+    assert recorded.summary()['query']['counters'] == {'hits': 100}
+    assert recorded.to_dict()['dropped_spans'] == 90
@@ -0,0 +1,87 @@
+import random
+
+import numpy as np
+import pytest
+
+from brfundamentus.builders.trademap_builder import (
+    build_ledger_from_trademap_info,
+    build_shares_from_trademap_info,
+)
+from brfundamentus.models.constants import OperationType
+from brfundamentus.models.ledger import OperationsLedger
+from brfundamentus.utils.csv_reader import read_csv
+
+
+def _random_ledger(num_operations: int, seed: int = 0) -> tuple:
+    rng = random.Random(seed)
+    ledger = OperationsLedger()
+    expected = dict()
+    for _ in range(num_operations):
+        ticker = f'TICK{rng.randrange(20)}'
+        row = ledger.append(
+            ticker,
+            rng.choice([OperationType.BUY, OperationType.SELL]),
+            rng.randint(1, 100),
+            round(rng.uniform(1, 50), 2),
+        )
+        expected.setdefault(ticker, list()).append(row)
+        if rng.random() < 0.2:
+            # reads between appends keep the index up to date
+            ticker = f'TICK{rng.randrange(22)}'
+            assert ledger.rows(ticker).tolist() == expected.get(ticker, [])
+
+    return ledger, expected
+
+
+def test_rows_match_a_scan_of_the_column():
+    ledger, expected = _random_ledger(2000)
+    tickers = ledger.column('ticker')
+
+    for ticker, rows in expected.items():
+        assert ledger.rows(ticker).tolist() == rows
+        scanned = np.flatnonzero(tickers == ledger.ticker_id(ticker))
+        assert scanned.tolist() == rows
+    assert ledger.rows('UNKNOWN').tolist() == []
+
+
+def test_rows_are_read_only():
+    ledger, expected = _random_ledger(10)
+    with pytest.raises(ValueError):
+        ledger.rows(next(iter(expected)))[0] = 0
+    with pytest.raises(ValueError):
+        ledger.column('price')[0] = 0
+
+
+def test_save_and_load(tmp_path):
+    ledger, expected = _random_ledger(500)
+    path = str(tmp_path / 'ledger.npz')
+    ledger.save(path)
+    loaded = OperationsLedger.load(path)
+
+    assert len(loaded) == len(ledger)
+    assert loaded.operations() == ledger.operations()
+    loaded.append('TICK1', OperationType.BUY, 1, 1.0)
+    assert loaded.rows('TICK1').tolist() == expected['TICK1'] + [500]
+
+
+
+def test_trademap_rows_with_blank_amounts_are_skipped(market):
+    lines = [
+        'Data;Corretora;Ativo;Operação;Quantidade;Preço\n',
+        '08/03/21;Modal DTVM;ITSA4;Compra;10;10,30\n',
+        '09/03/21;Modal DTVM;ITSA4;Compra;;10,50\n',
+        '10/03/21;Modal DTVM;ITSA4;Compra;5;\n',
+        '11/03/21;Modal DTVM;SAPR4;Compra;;4,18\n',
+        '12/03/21;Modal DTVM;ITSA4;Venda;4;11,00\n',
+    ]
+    headers, rows = read_csv(lines, ';')
+    rows = list(rows)
+
+    ledger = build_ledger_from_trademap_info(market, rows, headers)
+    shares = build_shares_from_trademap_info(
+        market, rows, headers, OperationsLedger()
+    )
+
+    assert [op.quantity for op in ledger.operations()] == [10, 4]
+    assert [(sh.stock.ticker, sh.quantity) for sh in shares] == [('ITSA4', 6)]
+    assert ledger.replay('ITSA4') == (shares[0].mean_price, 6)
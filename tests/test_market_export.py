@@ -0,0 +1,133 @@
+import csv
+import json
+import math
+
+import numpy as np
+import pytest
+
+from brfundamentus.models.market_history import MarketHistory
+from brfundamentus.models.market_store import INDICATORS, MarketStore
+from brfundamentus.utils.market_export import (
+    export_history,
+    export_market,
+    load_columnar,
+    read_columnar,
+)
+
+
+def _expected_rows(stocks) -> list[dict]:
+    """
+    Every indicator of the stocks, as the Stock objects have them
+    """
+    return [
+        dict(
+            {'ticker': stock.ticker},
+            **{p: getattr(stock, p) for p in INDICATORS},
+        )
+        for stock in stocks
+    ]
+
+
+def _parse(value: str, parameter: str):
+    if value == '':
+        return None
+    if parameter == 'greenblatt_rank':
+        return int(value)
+    return float(value)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 100000])
+def test_csv_round_trip(market, tmp_path, chunk_size):
+    path = str(tmp_path / 'market.csv')
+
+    num_rows = export_market(market, path, chunk_size=chunk_size)
+    with open(path, newline='') as file:
+        rows = list(csv.DictReader(file))
+
+    assert num_rows == len(rows) == len(market.stocks)
+    assert [
+        dict(
+            {'ticker': row['ticker']},
+            **{p: _parse(row[p], p) for p in INDICATORS},
+        )
+        for row in rows
+    ] == _expected_rows(market.stocks)
+
+
+def test_jsonl_round_trip(market, tmp_path):
+    path = str(tmp_path / 'market.jsonl')
+
+    export_market(market, path, chunk_size=50)
+    with open(path) as file:
+        rows = [json.loads(line) for line in file]
+
+    expected = _expected_rows(market.stocks)
+    # infinities are written as null, since JSON has no infinities
+    for row in expected:
+        for parameter, value in row.items():
+            if isinstance(value, float) and math.isinf(value):
+                row[parameter] = None
+    assert rows == expected
+
+
+def test_columnar_round_trip(market, tmp_path):
+    path = str(tmp_path / 'market.brfc')
+
+    export_market(market, path, chunk_size=100)
+    strings, floats = load_columnar(path)
+    loaded = MarketStore(strings['ticker'], floats)
+    groups = list(read_columnar(path))
+
+    assert len(groups) == math.ceil(len(market.stocks) / 100)
+    assert loaded.get_stocks() == market.stocks
+
+
+def test_selected_stocks_in_their_order(market, tmp_path):
+    path = str(tmp_path / 'top.brfc')
+    top = market.get_top_stocks_by_criterion(10, 'dy', 0.05)
+
+    assert export_market(market, path, stocks=top) == 10
+    strings, floats = load_columnar(path)
+
+    assert MarketStore(strings['ticker'], floats).get_stocks() == top
+    with pytest.raises(KeyError):
+        export_market(market, path, stocks=['XXXX3'])
+
+
+def test_unknown_formats_are_rejected(market, tmp_path):
+    with pytest.raises(ValueError):
+        export_market(market, str(tmp_path / 'market.xlsx'))
+    with pytest.raises(ValueError):
+        export_market(market, str(tmp_path / 'market.csv'), fmt='parquet')
+    with open(tmp_path / 'market.csv', 'w') as file:
+        file.write('not columnar')
+    with pytest.raises(ValueError):
+        load_columnar(str(tmp_path / 'market.csv'))
+
+
+def test_history_round_trip(tmp_path, market_csv):
+    snapshots = tmp_path / 'snapshots'
+    snapshots.mkdir()
+    with open(market_csv, encoding='utf-8') as file:
+        lines = file.readlines()
+    (snapshots / 'statusinvest-2021-03-15.csv').write_text(''.join(lines))
+    (snapshots / 'statusinvest-2021-04-15.csv').write_text(
+        ''.join(lines[:-20])
+    )
+    history = MarketHistory(str(tmp_path / 'history'))
+    history.ingest(str(snapshots))
+    path = str(tmp_path / 'history.brfc')
+
+    num_rows = export_history(history, path)
+    strings, floats = load_columnar(path)
+
+    assert num_rows == sum(
+        len(history.market_as_of(date).stocks) for date in history.dates
+    )
+    for date in history.dates:
+        rows = np.array(strings['date']) == date.isoformat()
+        store = MarketStore(
+            np.array(strings['ticker'])[rows].tolist(),
+            {parameter: values[rows] for parameter, values in floats.items()},
+        )
+        assert store.get_stocks() == history.market_as_of(date).stocks
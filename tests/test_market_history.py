@@ -0,0 +1,75 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from brfundamentus.models.market_history import MarketHistory
+from brfundamentus.models.stock_market import StockMarket
+
+
+@pytest.fixture
+def snapshots(tmp_path, market_csv) -> str:
+    directory = tmp_path / 'snapshots'
+    directory.mkdir()
+    shutil.copy(market_csv, directory / 'statusinvest-2021-03-15.csv')
+    with open(market_csv, encoding='utf-8') as file:
+        lines = file.readlines()
+    # a later snapshot without the last stocks
+    with open(
+        directory / 'statusinvest-2021-04-15.csv', 'w', encoding='utf-8'
+    ) as file:
+        file.writelines(lines[:-20])
+
+    return str(directory)
+
+
+def test_market_as_of_matches_the_csv(tmp_path, snapshots):
+    history = MarketHistory(str(tmp_path / 'history'))
+    ingested, failures = history.ingest(snapshots)
+    assert [date.isoformat() for date in ingested] == [
+        '2021-03-15',
+        '2021-04-15',
+    ]
+    assert failures == []
+
+    for date in ('2021-03-31', '2021-04-15'):
+        path = os.path.join(
+            snapshots, f'statusinvest-{history.snapshot_date(date)}.csv'
+        )
+        expected = StockMarket.read_from_csv(path)
+        assert history.market_as_of(date).stocks == expected.stocks
+    assert history.market_as_of('2021-01-01') is None
+
+
+def test_series_follows_the_snapshots(tmp_path, snapshots, market_csv):
+    history = MarketHistory(str(tmp_path / 'history'))
+    history.ingest(snapshots)
+    market = StockMarket.read_from_csv(market_csv)
+    last = market.stocks[-1]
+
+    dates, values = history.series(last.ticker, 'price')
+    assert len(dates) == 2
+    assert values[0] == last.price
+    assert np.isnan(values[1])
+
+
+def test_ingest_skips_files_already_ingested(tmp_path, snapshots):
+    history = MarketHistory(str(tmp_path / 'history'))
+    history.ingest(snapshots)
+
+    reopened = MarketHistory(str(tmp_path / 'history'))
+    assert reopened.ingest(snapshots) == ([], [])
+    assert len(reopened) == 2
+
+
+def test_ingest_rejects_files_of_the_same_date(tmp_path, snapshots):
+    shutil.copy(
+        os.path.join(snapshots, 'statusinvest-2021-03-15.csv'),
+        os.path.join(snapshots, 'statusinvest-2021-03-15 (1).csv'),
+    )
+    history = MarketHistory(str(tmp_path / 'history'))
+
+    with pytest.raises(ValueError, match='2021-03-15'):
+        history.ingest(snapshots)
+    assert len(history) == 0
@@ -0,0 +1,113 @@
+import datetime
+import os
+
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+
+from brfundamentus.builders import market_loader
+from brfundamentus.builders.market_loader import (
+    iter_markets,
+    load_markets,
+    snapshot_date,
+)
+from brfundamentus.models.stock_market import StockMarket
+
+
+@pytest.fixture
+def snapshot_paths(market_csv, tmp_path) -> list[str]:
+    """
+    Snapshot files, out of date order: shrinking copies of the example
+    file, a file without a date and a broken file
+    """
+    with open(market_csv) as file:
+        header, *lines = file.readlines()
+    files = {
+        'statusinvest-2021-03-15.csv': [header] + lines[:300],
+        'statusinvest-2020-12-01.csv': [header] + lines,
+        'statusinvest-latest.csv': [header] + lines[100:],
+        'statusinvest-2021-01-04.csv': ['TICKER;PRECO\n', 'ITSA4;10,0\n'],
+        'statusinvest-2021-02-01.csv': [header] + lines[:50],
+    }
+    paths = list()
+    for name, content in files.items():
+        path = tmp_path / name
+        path.write_text(''.join(content))
+        paths.append(str(path))
+
+    return paths
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_parallel_loading_equals_serial_reads(snapshot_paths, max_workers):
+    loaded = load_markets(snapshot_paths, max_workers=max_workers)
+
+    assert [os.path.basename(item.path) for item in loaded] == [
+        'statusinvest-2020-12-01.csv',
+        'statusinvest-2021-01-04.csv',
+        'statusinvest-2021-02-01.csv',
+        'statusinvest-2021-03-15.csv',
+        'statusinvest-latest.csv',
+    ]
+    assert [item.date for item in loaded] == [
+        datetime.date(2020, 12, 1),
+        datetime.date(2021, 1, 4),
+        datetime.date(2021, 2, 1),
+        datetime.date(2021, 3, 15),
+        None,
+    ]
+    for item in loaded:
+        if item.path.endswith('2021-01-04.csv'):
+            assert not item.ok
+            assert item.market is None
+            assert item.error.startswith('KeyError')
+            continue
+        assert item.ok
+        market = StockMarket.read_from_csv(item.path)
+        assert item.market.stocks == market.stocks
+        assert item.market.rejections == market.rejections
+
+
+def test_bounded_pending_loads(snapshot_paths):
+    loaded = iter_markets(snapshot_paths, max_workers=2, max_pending=1)
+
+    first = next(loaded)
+    loaded.close()
+
+    assert first.date == datetime.date(2020, 12, 1)
+    assert len(first.market.stocks) == len(
+        StockMarket.read_from_csv(first.path).stocks
+    )
+
+
+class _RecordingExecutor(ProcessPoolExecutor):
+    shutdowns = list()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shutdowns.append((wait, cancel_futures))
+        super().shutdown(wait, cancel_futures=cancel_futures)
+
+
+def test_workers_are_waited_for_unless_stopped_early(
+    snapshot_paths, monkeypatch
+):
+    monkeypatch.setattr(
+        market_loader, 'ProcessPoolExecutor', _RecordingExecutor
+    )
+    shutdowns = _RecordingExecutor.shutdowns
+    shutdowns.clear()
+
+    list(iter_markets(snapshot_paths, max_workers=2))
+    assert shutdowns == [(True, False)]
+
+    loaded = iter_markets(snapshot_paths, max_workers=2)
+    next(loaded)
+    loaded.close()
+    assert shutdowns == [(True, False), (False, True)]
+
+
+def test_snapshot_date():
+    assert snapshot_date('/data/statusinvest-2021-03-15.csv') == (
+        datetime.date(2021, 3, 15)
+    )
+    assert snapshot_date('/2021-03-15/statusinvest.csv') is None
@@ -0,0 +1,47 @@
+import dataclasses
+
+import numpy as np
+
+from brfundamentus.models.market_store import INDICATORS, MarketStore
+from brfundamentus.models.stock_market import StockMarket
+
+
+def test_market_matches_per_row_stocks(market, reference_stocks):
+    assert market.stocks == reference_stocks
+
+
+def test_from_stocks_keeps_values(reference_stocks):
+    store = MarketStore.from_stocks(reference_stocks)
+
+    assert list(store.tickers) == [stock.ticker for stock in reference_stocks]
+    for parameter in INDICATORS:
+        values = [getattr(stock, parameter) for stock in reference_stocks]
+        expected = [np.nan if value is None else value for value in values]
+        np.testing.assert_array_equal(store.columns[parameter], expected)
+    assert store.get_stocks() == reference_stocks
+
+
+def test_market_from_stocks_ranks_as_per_row(reference_stocks):
+    unranked = [
+        dataclasses.replace(stock, greenblatt_rank=None)
+        for stock in reference_stocks
+    ]
+    market = StockMarket(unranked)
+
+    assert [stock.greenblatt_rank for stock in market.stocks] == [
+        stock.greenblatt_rank for stock in reference_stocks
+    ]
+
+
+def test_stocks_are_built_once(market):
+    stock = market.get_stock_by_ticker('ITSA4')
+
+    assert market.get_stock_by_ticker('ITSA4') is stock
+    assert market.stocks[market.store.get_position('ITSA4')] is stock
+
+
+def test_save_and_load(tmp_path, market):
+    market.store.save(str(tmp_path))
+    for mmap in (True, False):
+        loaded = MarketStore.load(str(tmp_path), mmap=mmap)
+        assert loaded.get_stocks() == market.stocks
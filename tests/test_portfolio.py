@@ -0,0 +1,104 @@
+import copy
+import gc
+import pickle
+import random
+
+import pytest
+
+from brfundamentus.builders.portfolio_builder import build_single_share
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.utils.csv_reader import header_positions, read_csv
+
+
+def _sums(portfolio: Portfolio) -> tuple:
+    return (
+        sum(share.total_invested for share in portfolio.shares),
+        sum(share.total_amount for share in portfolio.shares),
+    )
+
+
+def test_aggregates_follow_operations_and_prices(market, portfolio_csv):
+    portfolio = Portfolio.read_from_cvs(portfolio_csv, market)
+    share = portfolio.shares[0]
+
+    share.buy(share.stock.price, 10)
+    share.sell(share.stock.price * 1.1, 5)
+    share.stock.set_price(share.stock.price * 1.2)
+    portfolio.shares[1].stock.set_price(1.0)
+
+    total_invested, equity = _sums(portfolio)
+    assert portfolio.total_invested == pytest.approx(total_invested)
+    assert portfolio.equity == pytest.approx(equity)
+
+
+def test_aggregates_do_not_drift(market, portfolio_csv):
+    portfolio = Portfolio.read_from_cvs(portfolio_csv, market)
+    rng = random.Random(0)
+
+    # one update of the aggregates per price change
+    for _ in range(10 * Portfolio.REANCHOR_INTERVAL):
+        stock = rng.choice(portfolio.shares).stock
+        stock.set_price(stock.price * rng.uniform(0.98, 1.02))
+
+    assert (portfolio.total_invested, portfolio.equity) == _sums(portfolio)
+
+
+def test_price_watchers_do_not_keep_shares_alive(market, portfolio_csv):
+    portfolio = Portfolio.read_from_cvs(portfolio_csv, market)
+    stock = portfolio.shares[0].stock
+    assert len(stock._price_watchers) == 1
+
+    del portfolio
+    gc.collect()
+    stock.set_price(stock.price + 1)
+
+    assert stock._price_watchers == []
+
+
+@pytest.mark.parametrize(
+    'clone', [copy.deepcopy, lambda obj: pickle.loads(pickle.dumps(obj))]
+)
+def test_wired_portfolio_can_be_copied(market, portfolio_csv, clone):
+    portfolio = Portfolio.read_from_cvs(portfolio_csv, market)
+    equity = portfolio.equity
+    copied = clone(portfolio)
+    stock = copied.shares[0].stock
+
+    assert stock is not portfolio.shares[0].stock
+    assert copied.equity == pytest.approx(equity)
+    stock.set_price(stock.price * 2)
+    assert copied.equity == pytest.approx(_sums(copied)[1])
+    assert copied.equity != pytest.approx(equity)
+    assert portfolio.equity == equity
+
+
+def test_functions_are_held_strongly(market):
+    stock = market.get_stock_by_ticker('ITSA4')
+    changes = list()
+    stock.watch_price(lambda *change: changes.append(change))
+
+    gc.collect()
+    old = stock.price
+    stock.set_price(old + 1)
+
+    assert changes == [(stock, old, old + 1)]
+
+
+def test_prices_must_be_positive(market):
+    stock = market.get_stock_by_ticker('ITSA4')
+
+    with pytest.raises(ValueError):
+        stock.set_price(0.0)
+
+
+def test_single_share_accepts_headers_or_positions(market, portfolio_csv):
+    headers, rows = read_csv(portfolio_csv, ',')
+    row = next(rows)
+    by_headers = build_single_share(market, headers, row)
+    by_positions = build_single_share(
+        market, header_positions(headers, upper=True), row
+    )
+
+    assert by_headers.stock is by_positions.stock
+    assert by_headers.mean_price == by_positions.mean_price
+    assert by_headers.quantity == by_positions.quantity
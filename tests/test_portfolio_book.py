@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.portfolio_book import PortfolioBook
+
+
+def _portfolios(market, portfolio_csv, trademap_csv) -> dict:
+    return {
+        'csv': Portfolio.read_from_cvs(portfolio_csv, market),
+        'trademap': Portfolio.read_from_trademap_csv(trademap_csv, market),
+    }
+
+
+def _assert_book_matches(book: PortfolioBook, portfolios: dict):
+    assert book.names == list(portfolios)
+    summary = book.summary()
+    for entry, portfolio in zip(summary, portfolios.values()):
+        assert entry['equity'] == pytest.approx(portfolio.equity)
+        assert entry['total_invested'] == pytest.approx(
+            portfolio.total_invested
+        )
+        assert entry['return_of_investiment'] == pytest.approx(
+            portfolio.return_of_investiment
+        )
+        assert entry['positions'] == pytest.approx(
+            {
+                share.stock.ticker: portfolio.compute_share_weight(share)
+                for share in portfolio.shares
+            }
+        )
+
+
+def test_book_matches_portfolios(market, portfolio_csv, trademap_csv):
+    portfolios = _portfolios(market, portfolio_csv, trademap_csv)
+
+    _assert_book_matches(
+        PortfolioBook.from_portfolios(market, portfolios), portfolios
+    )
+
+
+def test_csvs_read_straight_into_the_book(
+    market, portfolio_csv, trademap_csv
+):
+    portfolios = _portfolios(market, portfolio_csv, trademap_csv)
+    book = PortfolioBook.read_csvs(market, [portfolio_csv, trademap_csv])
+
+    assert book.names == [portfolio_csv, trademap_csv]
+    _assert_book_matches(
+        book, dict(zip([portfolio_csv, trademap_csv], portfolios.values()))
+    )
+    trademap = book.summary()[1]['positions']
+    assert list(trademap) == [
+        share.stock.ticker for share in portfolios['trademap'].shares
+    ]
+
+
+def test_book_follows_market_prices(market, portfolio_csv, trademap_csv):
+    portfolios = _portfolios(market, portfolio_csv, trademap_csv)
+    book = PortfolioBook.from_portfolios(market, portfolios)
+
+    for share in portfolios['csv'].shares[:3]:
+        market.update_indicators(
+            share.stock.ticker, price=share.stock.price * 1.25
+        )
+
+    _assert_book_matches(book, portfolios)
+
+
+def test_equity_under_price_scenarios(market, portfolio_csv, trademap_csv):
+    portfolios = _portfolios(market, portfolio_csv, trademap_csv)
+    book = PortfolioBook.from_portfolios(market, portfolios)
+    prices = market.store.columns['price']
+
+    equity = book.equity_under(np.stack([prices, 2 * prices, 0 * prices], 1))
+
+    np.testing.assert_allclose(equity[:, 0], book.equity())
+    np.testing.assert_allclose(equity[:, 1], 2 * book.equity())
+    np.testing.assert_allclose(equity[:, 2], 0)
+
+
+def test_unlisted_tickers_are_reported(market):
+    book = PortfolioBook.from_holdings(
+        market,
+        {
+            'a': [('ITSA4', 10.0, 100), ('XXXX3', 5.0, 10)],
+            'b': [],
+            'c': [('BBAS3', 30.0, 10)],
+        },
+    )
+    itsa4 = market.get_stock_by_ticker('ITSA4')
+    bbas3 = market.get_stock_by_ticker('BBAS3')
+
+    assert book.missing == {'a': ['XXXX3']}
+    np.testing.assert_allclose(
+        book.equity(), [100 * itsa4.price, 0, 10 * bbas3.price]
+    )
+    np.testing.assert_allclose(book.total_invested(), [1000.0, 0, 300.0])
@@ -0,0 +1,85 @@
+import pytest
+
+from brfundamentus.builders.trademap_builder import (
+    build_shares_from_trademap_info,
+)
+from brfundamentus.models.ledger import OperationsLedger
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.position_index import PositionIndex, apply_operation
+from brfundamentus.utils.csv_reader import read_csv
+
+
+def test_apply_operation_averages_and_realizes():
+    position, mean_price, gain = apply_operation(10, 10.0, 5, 13.0)
+    assert (position, mean_price, gain) == (15, 11.0, 0.0)
+
+    position, mean_price, gain = apply_operation(15, 11.0, -5, 12.0)
+    assert (position, mean_price) == (10, 11.0)
+    assert gain == pytest.approx(5.0)
+
+
+def test_apply_operation_rounds_mean_price_to_cents():
+    _, mean_price, _ = apply_operation(3, 10.0, 1, 10.01)
+    assert mean_price == 10.0
+
+
+def test_apply_operation_opens_short_beyond_position():
+    position, mean_price, gain = apply_operation(10, 10.0, -15, 12.0)
+    assert (position, mean_price) == (-5, 12.0)
+    assert gain == pytest.approx(20.0)
+
+    position, mean_price, gain = apply_operation(-5, 12.0, 5, 11.0)
+    assert position == 0
+    assert gain == pytest.approx(5.0)
+
+
+def test_apply_operation_opens_position_at_its_price():
+    assert apply_operation(0, 9.5, 3, 10.005) == (3, 10.005, 0.0)
+
+
+# tickers of the example file sold beyond the position:
+# mean prices of Share, as before PositionIndex, and of PositionIndex
+OVERSOLD = {
+    'ITSA4': (9.9, 8.79),
+    'LREN3': (47.96, 23.24),
+    'AMER3': (43.01, 14.05),
+    'BPAN4': (11.44, 7.7),
+}
+
+
+def _example_ledger(market, trademap_csv) -> tuple:
+    headers, rows = read_csv(trademap_csv, ';')
+    ledger = OperationsLedger()
+    shares = build_shares_from_trademap_info(market, rows, headers, ledger)
+
+    return shares, ledger
+
+
+def test_shares_and_index_agree_on_example_file(market, trademap_csv):
+    shares, ledger = _example_ledger(market, trademap_csv)
+    index = PositionIndex(ledger)
+
+    assert shares
+    for share in shares:
+        ticker = share.stock.ticker
+        quantity, mean_price = index.position(ticker, '2100-01-01')
+        assert quantity == share.quantity, ticker
+        if quantity > 0:
+            assert mean_price == share.mean_price, ticker
+            assert index.realized_pnl(ticker=ticker) == pytest.approx(
+                share.realized_pnl
+            ), ticker
+        assert ledger.replay(ticker) == (share.mean_price, share.quantity)
+
+
+def test_oversold_shares_keep_their_mean_price(market, trademap_csv):
+    shares, ledger = _example_ledger(market, trademap_csv)
+    index = PositionIndex(ledger)
+    portfolio = Portfolio.read_from_trademap_csv(trademap_csv, market)
+
+    for ticker, (share_price, index_price) in OVERSOLD.items():
+        share = next(sh for sh in shares if sh.stock.ticker == ticker)
+        assert share.quantity < 0
+        assert share.mean_price == share_price
+        assert portfolio.get_share_by_ticker(ticker).mean_price == share_price
+        assert index.position(ticker, '2100-01-01')[1] == index_price
@@ -0,0 +1,128 @@
+import pytest
+
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.query_cache import QueryCache, conditions_key
+
+CONDITIONS = [
+    {'parameter': 'dy', 'cut_criterion': 0.03, 'reverse_cut': False},
+    {
+        'any': [
+            {'parameter': 'roe', 'cut_criterion': 0.1, 'reverse_cut': False},
+            {'parameter': 'roic', 'cut_criterion': 0.1, 'reverse_cut': False},
+        ]
+    },
+]
+PERMUTED = [
+    {
+        'any': [
+            {'reverse_cut': False, 'parameter': 'roic', 'cut_criterion': 0.1},
+            {'parameter': 'roe', 'cut_criterion': 0.1, 'reverse_cut': False},
+        ]
+    },
+    {'parameter': 'dy', 'cut_criterion': 0.03, 'reverse_cut': False},
+]
+SORT_BY = {'parameter': 'roe', 'ascending': False}
+
+
+@pytest.fixture
+def uncached(market_csv) -> StockMarket:
+    market = StockMarket.read_from_csv(market_csv)
+    return StockMarket(
+        store=market.store, compute_rank=False, query_cache_size=0
+    )
+
+
+def test_hits_return_the_uncached_results(market, uncached):
+    queries = [
+        lambda m: m.get_top_stocks_by_list_of_conditions(CONDITIONS, SORT_BY),
+        lambda m: m.get_top_stocks_by_criterion(20, 'dy', 0.05),
+        lambda m: m.get_top_stocks_by_criterion(
+            20, 'roe', 0.1, disconsider=['ITSA4', 'BBAS3']
+        ),
+    ]
+    for query in queries:
+        expected = query(uncached)
+        assert query(market) == expected
+        assert query(market) == expected
+
+    stats = market.query_cache_stats()
+    assert (stats['hits'], stats['misses']) == (3, 3)
+    assert uncached.query_cache_stats()['size'] == 0
+
+
+def test_keys_ignore_the_order_of_conditions_and_tickers(market, uncached):
+    only_from = ['ITSA4', 'BBAS3', 'TAEE11', 'PETR4']
+    first = market.get_top_stocks_by_list_of_conditions(
+        CONDITIONS, SORT_BY, only_from=only_from
+    )
+    second = market.get_top_stocks_by_list_of_conditions(
+        PERMUTED, SORT_BY, only_from=only_from[::-1]
+    )
+
+    assert market.query_cache_stats()['hits'] == 1
+    assert first == second == uncached.get_top_stocks_by_list_of_conditions(
+        PERMUTED, SORT_BY, only_from=only_from[::-1]
+    )
+
+
+def test_booleans_and_numbers_get_different_keys():
+    truthy = dict(CONDITIONS[0], reverse_cut=1)
+
+    assert conditions_key([truthy], SORT_BY, 50) != conditions_key(
+        [dict(CONDITIONS[0], reverse_cut=True)], SORT_BY, 50
+    )
+    assert conditions_key(CONDITIONS, SORT_BY, 50) != conditions_key(
+        CONDITIONS, SORT_BY, 10
+    )
+
+
+def test_updates_invalidate_the_results(market, market_csv):
+    def query(m):
+        return m.get_top_stocks_by_criterion(10, 'roe', 0.1)
+
+    before = query(market)
+    market.update_indicators(before[0].ticker, roe=-1.0)
+    after = query(market)
+
+    assert before[0] not in after
+    assert market.query_cache_stats()['invalidations'] == 1
+
+    fresh = StockMarket.read_from_csv(market_csv)
+    fresh.update_indicators(before[0].ticker, roe=-1.0)
+    assert query(fresh) == after
+
+    market.apply_updates(prices={after[0].ticker: after[0].price * 2})
+    assert query(market) == after
+    assert market.query_cache_stats()['invalidations'] == 2
+
+
+def test_changing_a_result_does_not_change_the_cache(market):
+    result = market.get_top_stocks_by_criterion(10, 'dy', 0.05)
+    expected = list(result)
+    result.clear()
+
+    assert market.get_top_stocks_by_criterion(10, 'dy', 0.05) == expected
+
+
+def test_lru_eviction():
+    cache = QueryCache(2)
+    cache.put('a', 0, 1)
+    cache.put('b', 0, 2)
+    assert cache.get('a', 0) == 1
+    cache.put('c', 0, 3)
+
+    assert cache.get('b', 0) is None
+    assert (cache.get('a', 0), cache.get('c', 0)) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+    assert cache.get('a', 1) is None
+    assert len(cache) == 0 and cache.stats()['invalidations'] == 1
+
+
+def test_size_zero_caches_nothing():
+    cache = QueryCache(0)
+    cache.put('a', 0, 1)
+
+    assert cache.get('a', 0) is None
+    with pytest.raises(ValueError):
+        QueryCache(-1)
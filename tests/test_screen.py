@@ -0,0 +1,178 @@
+import pytest
+
+from brfundamentus.models.screen import compile_screen
+
+CONDITIONS = [
+    {'parameter': 'dy', 'cut_criterion': 0.03, 'reverse_cut': False},
+    {'parameter': 'net_margin', 'cut_criterion': 0.15, 'reverse_cut': False},
+    {
+        'parameter': 'price_per_profit',
+        'cut_criterion': 20,
+        'reverse_cut': True,
+    },
+]
+SORT_BY = {'parameter': 'roe', 'ascending': True}
+
+
+def _reference(
+    stocks, conditions, sort_by, num_stocks, disconsider=None, only_from=None
+):
+    """
+    Screening as StockMarket did it stock by stock, before screens
+    were compiled
+    """
+
+    def passes(stock, condition):
+        if stock.ticker in (disconsider or []):
+            return False
+        if only_from and stock.ticker not in only_from:
+            return False
+        value = getattr(stock, condition['parameter'], None)
+        modifier = -1 if condition['reverse_cut'] else 1
+        return (
+            value is not None
+            and modifier * value > modifier * condition['cut_criterion']
+        )
+
+    selected = [
+        stock
+        for stock in stocks
+        if all(passes(stock, condition) for condition in conditions)
+    ]
+    selected.sort(
+        key=lambda stock: getattr(stock, sort_by['parameter']),
+        reverse=not sort_by['ascending'],
+    )
+    return selected[:num_stocks]
+
+
+def _values(stocks, parameter):
+    return [getattr(stock, parameter) for stock in stocks]
+
+
+@pytest.mark.parametrize('num_stocks', [5, 50, 1000])
+def test_conditions_match_stock_by_stock_screening(market, num_stocks):
+    result = market.get_top_stocks_by_list_of_conditions(
+        CONDITIONS, SORT_BY, num_stocks
+    )
+    expected = _reference(market.stocks, CONDITIONS, SORT_BY, num_stocks)
+
+    assert _values(result, 'roe') == _values(expected, 'roe')
+    if num_stocks >= len(expected):
+        assert {stock.ticker for stock in result} == {
+            stock.ticker for stock in expected
+        }
+
+
+def test_criterion_matches_stock_by_stock_screening(market):
+    condition = {'parameter': 'dy', 'cut_criterion': 0.05, 'reverse_cut': 0}
+    result = market.get_top_stocks_by_criterion(20, 'dy', 0.05)
+    expected = _reference(
+        market.stocks, [condition], {'parameter': 'dy', 'ascending': False}, 20
+    )
+
+    assert _values(result, 'dy') == _values(expected, 'dy')
+
+
+def test_truthy_reverse_cut_is_accepted_when_not_strict(market):
+    conditions = [dict(condition) for condition in CONDITIONS]
+    for condition in conditions:
+        condition['reverse_cut'] = int(condition['reverse_cut'])
+
+    assert market.get_top_stocks_by_list_of_conditions(
+        conditions, SORT_BY
+    ) == market.get_top_stocks_by_list_of_conditions(CONDITIONS, SORT_BY)
+
+
+def test_strict_rejects_non_boolean_reverse_cut():
+    condition = {'parameter': 'dy', 'cut_criterion': 0, 'reverse_cut': 1}
+    with pytest.raises(ValueError):
+        compile_screen([condition], SORT_BY)
+    compile_screen([condition], SORT_BY, strict=False)
+
+
+def test_groups_combine_conditions(market):
+    dy, margin, price_per_profit = CONDITIONS
+    screen = [{'any': [dy, {'not': margin}]}, price_per_profit]
+    result = market.get_top_stocks_by_list_of_conditions(screen, SORT_BY, 1000)
+
+    def value(stock, condition):
+        return getattr(stock, condition['parameter'])
+
+    expected = {
+        stock.ticker
+        for stock in market.stocks
+        if (
+            (value(stock, dy) is not None and value(stock, dy) > 0.03)
+            or not (
+                value(stock, margin) is not None
+                and value(stock, margin) > 0.15
+            )
+        )
+        and value(stock, price_per_profit) is not None
+        and value(stock, price_per_profit) < 20
+    }
+    assert {stock.ticker for stock in result} == expected
+
+
+@pytest.mark.parametrize(
+    'disconsider, only_from',
+    [
+        (['ITSA4', 'BBAS3'], None),
+        (None, ['ITSA4', 'BBAS3', 'TAEE11', 'CMIG4', 'XXXX99']),
+        (['BBAS3'], ['ITSA4', 'BBAS3', 'TAEE11', 'CMIG4']),
+    ],
+)
+def test_ticker_filters_match_stock_by_stock_screening(
+    market, disconsider, only_from
+):
+    conditions = CONDITIONS[:1]
+    sort_by = {'parameter': 'dy', 'ascending': False}
+    result = market.get_top_stocks_by_list_of_conditions(
+        conditions, sort_by, 1000, disconsider, only_from
+    )
+
+    assert result == _reference(
+        market.stocks, conditions, sort_by, 1000, disconsider, only_from
+    )
+
+
+def test_same_stocks_in_the_same_order(market):
+    for sort_by in (SORT_BY, {'parameter': 'gross_margin', 'ascending': 0}):
+        assert market.get_top_stocks_by_list_of_conditions(
+            CONDITIONS[:2], sort_by, 1000
+        ) == _reference(market.stocks, CONDITIONS[:2], sort_by, 1000)
+
+
+def test_unknown_parameter_selects_no_stocks(market):
+    conditions = CONDITIONS + [
+        {'parameter': 'unknown', 'cut_criterion': 0, 'reverse_cut': False}
+    ]
+
+    result = market.get_top_stocks_by_list_of_conditions(conditions, SORT_BY)
+
+    assert result == []
+
+
+def test_negated_criterion_passes_missing_values(market):
+    condition = {'parameter': 'cagr', 'cut_criterion': 0, 'reverse_cut': False}
+    result = market.get_top_stocks_by_list_of_conditions(
+        [{'not': condition}], SORT_BY, 1000
+    )
+
+    assert {stock.ticker for stock in result} == {
+        stock.ticker
+        for stock in market.stocks
+        if stock.cagr is None or not stock.cagr > 0
+    }
+
+
+def test_unknown_sort_parameter_fails_only_with_stocks_to_sort(market):
+    sort_by = {'parameter': 'unknown', 'ascending': False}
+    nothing = [{'parameter': 'dy', 'cut_criterion': 1e9, 'reverse_cut': False}]
+
+    assert market.get_top_stocks_by_list_of_conditions(nothing, sort_by) == []
+    with pytest.raises(KeyError):
+        market.get_top_stocks_by_list_of_conditions(CONDITIONS, sort_by)
+    with pytest.raises(ValueError):
+        compile_screen(nothing, sort_by)
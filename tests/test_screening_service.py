@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import signal
+
+import pytest
+
+from brfundamentus.service.screening_service import (
+    MAX_BODY_SIZE,
+    ScreeningService,
+    stock_to_dict,
+)
+from brfundamentus.models.stock_market import StockMarket
+
+
+async def _request(port: int, raw: bytes) -> tuple:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status = int(head.split()[1])
+
+    return status, json.loads(body) if body else None
+
+
+def _serve(market_csv: str, *requests: bytes) -> list:
+    async def run():
+        service = ScreeningService(market_csv, port=0, poll_interval=60)
+        await service.start()
+        try:
+            return [await _request(service.port, raw) for raw in requests]
+        finally:
+            await service.stop()
+
+    return asyncio.run(run())
+
+
+def _get(path: str) -> bytes:
+    return f'GET {path} HTTP/1.1\r\nConnection: close\r\n\r\n'.encode()
+
+
+def _post(path: str, body: bytes, length: str = None) -> bytes:
+    length = str(len(body)) if length is None else length
+    return (
+        f'POST {path} HTTP/1.1\r\nConnection: close\r\n'
+        f'Content-Length: {length}\r\n\r\n'
+    ).encode() + body
+
+
+@pytest.fixture(scope='module')
+def reference(market_csv) -> StockMarket:
+    return StockMarket.read_from_csv(market_csv)
+
+
+def test_queries_match_the_market(market_csv, reference):
+    screen = {
+        'conditions': [
+            {'parameter': 'dy', 'cut_criterion': 0.05, 'reverse_cut': False}
+        ],
+        'sort_by': {'parameter': 'roe', 'ascending': False},
+        'num_stocks': 10,
+    }
+    stock, top, screened, status = _serve(
+        market_csv,
+        _get('/stocks/itsa4'),
+        _get('/top?parameter=dy&num_stocks=5&cut_criterion=0.04'),
+        _post('/screen', json.dumps(screen).encode()),
+        _get('/status'),
+    )
+
+    itsa4 = reference.get_stock_by_ticker('ITSA4')
+    assert stock == (200, stock_to_dict(itsa4))
+    assert top == (
+        200,
+        [
+            stock_to_dict(stock)
+            for stock in reference.get_top_stocks_by_criterion(5, 'dy', 0.04)
+        ],
+    )
+    assert screened == (
+        200,
+        [
+            stock_to_dict(stock)
+            for stock in reference.get_top_stocks_by_list_of_conditions(
+                **screen
+            )
+        ],
+    )
+    assert status[0] == 200
+    assert status[1]['stocks'] == len(reference.stocks)
+
+
+@pytest.mark.parametrize('length', ['abc', '-1', '1.5'])
+def test_malformed_content_length_is_rejected(market_csv, length):
+    ((status, payload),) = _serve(market_csv, _post('/screen', b'{}', length))
+
+    assert status == 400
+    assert 'Content-Length' in payload['error']
+
+
+def test_large_body_is_rejected(market_csv):
+    raw = _post('/screen', b'', str(MAX_BODY_SIZE + 1))
+    ((status, _),) = _serve(market_csv, raw)
+
+    assert status == 413
+
+
+def test_errors_of_queries(market_csv):
+    unknown, bad_method, bad_json = _serve(
+        market_csv,
+        _get('/stocks/XXXX99'),
+        _get('/screen'),
+        _post('/screen', b'not json'),
+    )
+
+    assert unknown[0] == 404
+    assert bad_method[0] == 405
+    assert bad_json[0] == 400
+
+
+@pytest.mark.parametrize(
+    'arguments',
+    [
+        {'num_stocks': '5'},
+        {'num_stocks': 2.5},
+        {'num_stocks': True},
+        {'num_stocks': -1},
+        {'disconsider': 'ITSA4'},
+        {'only_from': ['ITSA4', 3]},
+    ],
+)
+def test_malformed_screen_arguments_are_rejected(market_csv, arguments):
+    screen = {
+        'conditions': [],
+        'sort_by': {'parameter': 'roe', 'ascending': False},
+        **arguments,
+    }
+    ((status, payload),) = _serve(
+        market_csv, _post('/screen', json.dumps(screen).encode())
+    )
+
+    assert status == 400
+    assert next(iter(arguments)) in payload['error']
+
+
+def test_broken_pool_is_replaced(market_csv):
+    async def run():
+        service = ScreeningService(market_csv, port=0, poll_interval=60)
+        await service.start()
+        try:
+            # the worker dies, e.g. killed for its memory
+            executor = service._ScreeningService__executor
+            for pid in list(executor._processes):
+                os.kill(pid, signal.SIGKILL)
+            await asyncio.sleep(0.5)
+            broken = await service.reload()
+            error = service.last_error
+            return broken, error, await service.reload()
+        finally:
+            await service.stop()
+
+    broken, error, reloaded = asyncio.run(run())
+
+    assert not broken
+    assert error.startswith('BrokenProcessPool')
+    assert reloaded
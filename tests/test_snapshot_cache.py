@@ -0,0 +1,78 @@
+import os
+import shutil
+
+from brfundamentus.models.stock import STOCK_FIELDS
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.instrumentation import profile
+from brfundamentus.utils.snapshot_cache import cache_key
+
+
+def _read(path, cache_dir, **kwargs) -> tuple[StockMarket, dict]:
+    with profile() as recorded:
+        market = StockMarket.read_from_csv(path, cache_dir=cache_dir, **kwargs)
+
+    return market, recorded.summary()['market.read_from_csv']['counters']
+
+
+def _fields(stocks) -> list[tuple]:
+    return [
+        tuple(getattr(stock, name) for name in STOCK_FIELDS)
+        for stock in stocks
+    ]
+
+
+def test_cached_market_equals_a_fresh_read(market_csv, tmp_path):
+    expected = StockMarket.read_from_csv(market_csv).stocks
+
+    first, counters = _read(market_csv, str(tmp_path))
+    assert counters.get('snapshot_cache_misses') == 1
+    assert first.stocks == expected
+
+    second, counters = _read(market_csv, str(tmp_path))
+    assert counters.get('snapshot_cache_hits') == 1
+    assert second.stocks == expected
+    assert second.rejections == first.rejections != []
+
+    trusted, counters = _read(market_csv, str(tmp_path), trusted=True)
+    assert counters.get('snapshot_cache_hits') == 1
+    assert _fields(trusted.stocks) == _fields(expected)
+
+
+def test_market_risk_is_part_of_the_key(market_csv, tmp_path):
+    _read(market_csv, str(tmp_path))
+
+    market, counters = _read(market_csv, str(tmp_path), market_risk=0.08)
+
+    assert counters.get('snapshot_cache_misses') == 1
+    assert market.stocks == StockMarket.read_from_csv(market_csv, 0.08).stocks
+
+
+def test_changed_file_is_read_again(market_csv, tmp_path):
+    path = str(tmp_path / 'market.csv')
+    shutil.copyfile(market_csv, path)
+    cache_dir = str(tmp_path / 'cache')
+    _read(path, cache_dir)
+
+    with open(path) as file:
+        lines = file.readlines()
+    with open(path, 'w') as file:
+        file.writelines(lines[:-10])
+    market, counters = _read(path, cache_dir)
+
+    assert counters.get('snapshot_cache_misses') == 1
+    assert market.stocks == StockMarket.read_from_csv(path).stocks
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_key_follows_the_content(market_csv, tmp_path):
+    path = str(tmp_path / 'copy.csv')
+    shutil.copyfile(market_csv, path)
+
+    assert cache_key(path, 0.15) == cache_key(market_csv, 0.15)
+    assert cache_key(path, 0.15) != cache_key(path, 0.1)
+
+
+def test_trusted_reads_are_not_cached(market_csv, tmp_path):
+    _read(market_csv, str(tmp_path), trusted=True)
+
+    assert os.listdir(str(tmp_path)) == []
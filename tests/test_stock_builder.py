@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import pytest
+
+from brfundamentus.builders.stock_builder import (
+    build_list_of_stocks,
+    build_market_store,
+    build_single_stock,
+)
+from brfundamentus.models.stock_market import StockMarket
+from brfundamentus.utils.csv_reader import header_positions, read_csv
+
+from conftest import build_reference_stocks
+
+# values that hit the edge cases of the valuations: missing, zero
+# (e.g. eps or payout of zero) and negative
+EDGE_VALUES = ['', '0', '0,00', '-1,50', '-0,01', '1.234,56', '1,5e3']
+
+
+def _fuzzed_csv(path: str, directory, seed: int) -> str:
+    """
+    Copy of a statusinvest csv with some fields replaced by edge values.
+    Prices are never missing, which build_single_stock does not handle.
+    """
+    rng = random.Random(seed)
+    with open(path, encoding='utf-8') as file:
+        header, *lines = file.read().splitlines()
+    fuzzed = list()
+    for line in lines:
+        fields = line.split(';')
+        for idx in range(1, len(fields)):
+            if rng.random() < 0.15:
+                # the price is the second field
+                values = EDGE_VALUES[1:] if idx == 1 else EDGE_VALUES
+                fields[idx] = rng.choice(values)
+        fuzzed.append(';'.join(fields))
+
+    fuzzed_path = str(directory / f'fuzzed-{seed}.csv')
+    with open(fuzzed_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join([header] + fuzzed) + '\n')
+
+    return fuzzed_path
+
+
+@pytest.mark.parametrize('market_risk', [0.15, 0.08])
+def test_store_matches_build_single_stock(market_csv, market_risk):
+    market = StockMarket.read_from_csv(market_csv, market_risk)
+
+    assert market.stocks == build_reference_stocks(market_csv, market_risk)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_store_matches_build_single_stock_on_edge_values(
+    tmp_path, market_csv, seed
+):
+    path = _fuzzed_csv(market_csv, tmp_path, seed)
+    market = StockMarket.read_from_csv(path)
+    reference = build_reference_stocks(path)
+
+    # fuzzing drops rows, as Stock validation does
+    assert len(reference) < 566
+    assert market.stocks == reference
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_chunks_do_not_change_the_store(market_csv, chunk_size):
+    headers, rows = read_csv(market_csv, ';')
+    rows = list(rows)
+    store = build_market_store(rows, headers, 0.15)
+    chunked = build_market_store(rows, headers, 0.15, chunk_size=chunk_size)
+
+    assert list(chunked.tickers) == list(store.tickers)
+    for parameter, values in store.columns.items():
+        np.testing.assert_array_equal(chunked.columns[parameter], values)
+
+
+def test_short_rows_are_dropped(market_csv):
+    headers, rows = read_csv(market_csv, ';')
+    rows = list(rows)[:10]
+    rows[3] = rows[3][:5]
+    store = build_market_store(rows, headers, 0.15)
+
+    assert len(store) == len(build_list_of_stocks(rows, headers, 0.15)) == 9
+
+
+def test_single_stock_accepts_headers_or_positions(market_csv):
+    headers, rows = read_csv(market_csv, ';')
+    row = next(rows)
+
+    assert build_single_stock(row, headers, 0.15) == build_single_stock(
+        row, header_positions(headers), 0.15
+    )
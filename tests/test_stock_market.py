@@ -0,0 +1,151 @@
+import pytest
+
+from brfundamentus.models.portfolio import Portfolio
+from brfundamentus.models.stock_market import StockMarket
+
+
+def _first_match(stocks, ticker):
+    """
+    Lookup as StockMarket did it, with a scan of the stocks
+    """
+    return next(
+        (stock for stock in stocks if stock.ticker == ticker.upper()), None
+    )
+
+
+def test_lookup_matches_a_scan(market, reference_stocks):
+    for ticker in ['ITSA4', 'itsa4', 'Vale3', 'XXXX99', '']:
+        assert market.get_stock_by_ticker(ticker) == _first_match(
+            reference_stocks, ticker
+        )
+
+
+def test_duplicate_tickers_resolve_to_the_first(market_csv):
+    with open(market_csv, encoding='utf-8') as file:
+        header, *lines = file.read().splitlines()
+    first = next(line for line in lines if line.startswith('ITSA4;'))
+    duplicate = 'ITSA4;1,00' + first[first.index(';', 6) :]
+    market = StockMarket.read_from_csv([header] + lines + [duplicate])
+
+    assert market.get_stock_by_ticker('ITSA4').price != 1.0
+
+
+def test_get_stocks_by_tickers(market):
+    stocks = market.get_stocks_by_tickers(['ITSA4', 'XXXX99', 'vale3'])
+
+    assert [stock and stock.ticker for stock in stocks] == [
+        'ITSA4',
+        None,
+        'VALE3',
+    ]
+
+
+def test_share_lookup(market, portfolio_csv):
+    portfolio = Portfolio.read_from_cvs(portfolio_csv, market)
+
+    for share in portfolio.shares:
+        ticker = share.stock.ticker
+        assert portfolio.get_share_by_ticker(ticker.lower()) is share
+    assert portfolio.get_share_by_ticker('XXXX99') is None
+
+
+@pytest.mark.parametrize('ticker', ['ITSA4', 'VALE3'])
+def test_greenblatt_rank_of_a_ticker(market, reference_stocks, ticker):
+    assert (
+        market.get_greenblatt_rank(ticker)
+        == _first_match(reference_stocks, ticker).greenblatt_rank
+    )
+
+
+def _top_by_criterion(
+    stocks,
+    num_stocks,
+    parameter,
+    cut_criterion=0,
+    reverse_cut=False,
+    ascending=False,
+    disconsider=None,
+    only_from=None,
+):
+    """
+    get_top_stocks_by_criterion as StockMarket did it, stock by stock
+    """
+    if not hasattr(stocks[0], parameter):
+        return []
+    modifier = -1 if reverse_cut else 1
+    selected = [
+        stock
+        for stock in stocks
+        if getattr(stock, parameter) is not None
+        and stock.ticker not in (disconsider or [])
+        and modifier * getattr(stock, parameter) > modifier * cut_criterion
+    ]
+    if only_from:
+        selected = [stock for stock in selected if stock.ticker in only_from]
+    selected.sort(
+        key=lambda stock: getattr(stock, parameter), reverse=not ascending
+    )
+
+    return selected[:num_stocks]
+
+
+TOP_QUERIES = [
+    {'num_stocks': 10, 'parameter': 'dy'},
+    {'num_stocks': 10, 'parameter': 'dy', 'ascending': True},
+    {'num_stocks': 1000, 'parameter': 'roe', 'cut_criterion': 0.1},
+    {
+        'num_stocks': 20,
+        'parameter': 'price_per_profit',
+        'cut_criterion': 10,
+        'reverse_cut': True,
+    },
+    {
+        'num_stocks': 20,
+        'parameter': 'price_per_profit',
+        'cut_criterion': 10,
+        'reverse_cut': True,
+        'ascending': True,
+    },
+    {'num_stocks': 50, 'parameter': 'greenblatt_rank', 'ascending': True},
+    {
+        'num_stocks': 30,
+        'parameter': 'graham_valuation',
+        'cut_criterion': -0.5,
+        'disconsider': ['ITSA4', 'BBAS3'],
+    },
+    {
+        'num_stocks': 30,
+        'parameter': 'net_margin',
+        'only_from': ['ITSA4', 'BBAS3', 'VALE3', 'PETR4', 'XXXX99'],
+    },
+    # ties: 12 stocks have a gross margin of exactly 1.0
+    {'num_stocks': 1000, 'parameter': 'gross_margin', 'cut_criterion': 0.5},
+    {
+        'num_stocks': 1000,
+        'parameter': 'gross_margin',
+        'cut_criterion': 0.5,
+        'ascending': True,
+    },
+    {'num_stocks': 10, 'parameter': 'not_an_indicator'},
+]
+
+
+@pytest.mark.parametrize('query', TOP_QUERIES)
+def test_top_stocks_match_a_sort_of_the_stocks(
+    market, reference_stocks, query
+):
+    assert market.get_top_stocks_by_criterion(**query) == _top_by_criterion(
+        reference_stocks, **query
+    )
+
+
+def test_top_stocks_follow_updates(market):
+    market.get_top_stocks_by_criterion(10, 'roe')
+    market.get_top_stocks_by_criterion(10, 'roe', ascending=True)
+    market.update_indicators('ITSA4', roe=10.0)
+    market.update_indicators('VALE3', roe=-10.0)
+
+    for ascending in (False, True):
+        assert market.get_top_stocks_by_criterion(
+            10, 'roe', ascending=ascending
+        ) == _top_by_criterion(market.stocks, 10, 'roe', ascending=ascending)
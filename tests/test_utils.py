@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from brfundamentus.utils.utils import (
+    parse_column_to_floats,
+    parse_str_to_float,
+)
+
+SAMPLES = [
+    '21,15',
+    '2.501.893.058,40',
+    '-18,47',
+    '1.5',
+    '1.234',
+    '12',
+    '',
+    ' ',
+    ' 3,5 ',
+    '"4,2"',
+    '-',
+    'abc',
+    '1,2,3',
+    '1.2.3',
+    'nan',
+    'inf',
+    '-0,00',
+    '1e3',
+    '\t7,1\t',
+]
+ALPHABET = list('0123456789') * 3 + list('.,- "\te')
+
+
+def _reference(column: list[str], d: float) -> np.ndarray:
+    values = [parse_str_to_float(x, d) for x in column]
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def _fuzzed_column(rng: np.random.Generator, size: int) -> list[str]:
+    column = list()
+    for _ in range(size):
+        if rng.random() < 0.5:
+            column.append(SAMPLES[rng.integers(len(SAMPLES))])
+        else:
+            column.append(
+                ''.join(rng.choice(ALPHABET, rng.integers(0, 8)).tolist())
+            )
+    return column
+
+
+@pytest.mark.parametrize('d', [1, 100, 1000000])
+def test_samples_match_value_by_value_parsing(d):
+    values, missing = parse_column_to_floats(SAMPLES, d)
+
+    np.testing.assert_array_equal(values, _reference(SAMPLES, d))
+    np.testing.assert_array_equal(missing, np.isnan(values))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_fuzzed_columns_match_value_by_value_parsing(seed):
+    rng = np.random.default_rng(seed)
+    column = _fuzzed_column(rng, 200)
+
+    values, missing = parse_column_to_floats(column, 100)
+
+    np.testing.assert_array_equal(values, _reference(column, 100))
+    np.testing.assert_array_equal(missing, np.isnan(values))
+
+
+def test_values_with_line_breaks():
+    column = ['1,5\n', '\n2,5', '3\n,5', '', '4']
+
+    values, _ = parse_column_to_floats(column)
+
+    np.testing.assert_array_equal(values, _reference(column, 1))
+
+
+def test_empty_column():
+    values, missing = parse_column_to_floats([])
+
+    assert values.shape == (0,) and missing.shape == (0,)
@@ -0,0 +1,84 @@
+import math
+
+import numpy as np
+
+from brfundamentus.builders.stock_builder import (
+    BAZIN_REQUIRED_YIELD,
+    GRAHAM_MULTIPLIER,
+)
+
+from conftest import build_reference_stocks
+
+MARKET_RISKS = [0.08, 0.15, 0.2]
+MODELS = ['graham_valuation', 'bazin_valuation', 'gordon_valuation']
+
+
+def _column(stocks, parameter: str) -> np.ndarray:
+    values = [getattr(stock, parameter) for stock in stocks]
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def _valuations(stock, market_risk, required_yield, multiplier) -> tuple:
+    """
+    Valuations of a stock under other assumptions, as build_single_stock
+    computes them
+    """
+    eps, bvps, dps, price = stock.eps, stock.bvps, stock.dps, stock.price
+    graham = (
+        None
+        if eps is None or bvps is None or eps * bvps < 0 or eps < 0
+        else math.sqrt(multiplier * eps * bvps) / price - 1
+    )
+    bazin = None if dps is None else dps / required_yield / price - 1
+    gordon = (
+        None
+        if stock.cagr is None or dps is None
+        else (1 / market_risk) * dps * (1 + 0.1 * stock.cagr) / price - 1
+    )
+
+    return graham, bazin, gordon
+
+
+def test_default_assumptions_give_the_stored_valuations(market_csv, market):
+    sensitivity = market.valuation_sensitivity(MARKET_RISKS)
+
+    assert sensitivity['tickers'] == [stock.ticker for stock in market.stocks]
+    assert [s['market_risk'] for s in sensitivity['scenarios']] == MARKET_RISKS
+    for scenario, market_risk in enumerate(MARKET_RISKS):
+        stocks = build_reference_stocks(market_csv, market_risk)
+        for model in MODELS:
+            np.testing.assert_allclose(
+                sensitivity[model][:, scenario],
+                _column(stocks, model),
+                rtol=1e-12,
+            )
+
+
+def test_every_combination_is_a_scenario(market):
+    required_yields = [0.04, BAZIN_REQUIRED_YIELD]
+    multipliers = [15.0, GRAHAM_MULTIPLIER]
+    sensitivity = market.valuation_sensitivity(
+        [0.1, 0.15], required_yields, multipliers
+    )
+    scenarios = sensitivity['scenarios']
+
+    assert len(scenarios) == 8
+    assert len({tuple(s.values()) for s in scenarios}) == 8
+    for idx, scenario in enumerate(scenarios):
+        expected = [
+            _valuations(
+                stock,
+                scenario['market_risk'],
+                scenario['required_yield'],
+                scenario['graham_multiplier'],
+            )
+            for stock in market.stocks
+        ]
+        for model, values in zip(MODELS, zip(*expected)):
+            np.testing.assert_allclose(
+                sensitivity[model][:, idx],
+                np.array(
+                    [np.nan if v is None else v for v in values], dtype=float
+                ),
+                rtol=1e-12,
+            )